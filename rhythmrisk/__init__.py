@@ -0,0 +1,36 @@
+"""Sigma alert ingestion, DBSCAN anomaly clustering and anomaly logging.
+
+Importing the package or any of its modules has no side effects: nothing connects to the
+database, configures logging or starts a loop until an entry point's main() is called.
+numpy, scikit-learn and mysql-connector are imported by the stages that use them. Run the
+stages with ``python -m rhythmrisk <command>``; see rhythmrisk.__main__ for the commands.
+"""
+import os
+import pickle
+import logging
+
+log_format = "%(asctime)s - %(levelname)s - %(message)s"
+
+# State files one stage writes and another reads (core-sample index, rate snapshots) are
+# resolved here rather than in each process's working directory, so they always meet
+state_dir = os.getenv("RHYTHMRISK_STATE_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def configure_logging(level=logging.INFO):
+    """Configure root logging the way every entry point does."""
+    logging.basicConfig(level=level, format=log_format)
+
+def state_path(path):
+    """Resolve a state file path; relative paths are taken relative to state_dir."""
+    return path if os.path.isabs(path) else os.path.join(state_dir, path)
+
+def load_pickle(path):
+    """Unpickle a state file written by another stage of the pipeline.
+
+    Unpickling runs whatever code the file's writer put in it, so only files owned by this
+    user (or root) and not writable by group or others are read; others raise PermissionError.
+    """
+    with open(path, "rb") as file:
+        info = os.fstat(file.fileno())
+        if info.st_uid not in (0, os.getuid()) or info.st_mode & 0o022:
+            raise PermissionError(f"{path} must be owned by this user and not writable by group or others")
+        return pickle.load(file)
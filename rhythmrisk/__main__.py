@@ -0,0 +1,37 @@
+import sys
+import importlib
+
+# Command -> (module, entry point); a module is only imported when its command runs
+commands = {
+    "init": ("rhythmrisk.schema", "main", "Create or migrate the database tables"),
+    "ingest": ("rhythmrisk.ingest", "main", "Watch the log folder and insert new alerts"),
+    "cluster": ("rhythmrisk.clustering", "main", "Run DBSCAN every 5 minutes and update cluster labels"),
+    "log": ("rhythmrisk.anomaly_log", "main", "Log new anomalies to CSV and serve recent ones"),
+    "anomalies": ("rhythmrisk.anomaly_service", "main", "Query the running anomaly service"),
+    "workers": ("rhythmrisk.workers", "main", "Ingest a shared log folder with lease-coordinated workers"),
+    "spool": ("rhythmrisk.spool", "main", "Show spool depth and lag, or drain it once"),
+    "backfill": ("rhythmrisk.backfill", "main", "Bulk load a folder of historical logs"),
+    "retention": ("rhythmrisk.retention", "main", "Apply the retention policy once"),
+    "tune": ("rhythmrisk.tune", "main", "Tune DBSCAN eps/min_samples"),
+    "benchmark": ("rhythmrisk.benchmark", "main", "Run the benchmarks"),
+}
+
+def usage():
+    lines = ["usage: python -m rhythmrisk <command> [options]", "", "commands:"]
+    lines += [f"  {name:<10} {description}" for name, (_, _, description) in commands.items()]
+    return "\n".join(lines)
+
+def run(name, argv):
+    """Import the command's module and call its entry point with argv as its arguments."""
+    module_name, function, _ = commands[name]
+    sys.argv = [f"rhythmrisk {name}"] + list(argv)
+    return getattr(importlib.import_module(module_name), function)()
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print(usage(), file=sys.stderr)
+        return 2
+    return run(sys.argv[1], sys.argv[2:])
+
+if __name__ == "__main__":
+    sys.exit(main())
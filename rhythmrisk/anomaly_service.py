@@ -0,0 +1,217 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import urlopen
+from . import configure_logging
+
+logger = logging.getLogger()
+
+# Service configuration
+service_host = os.getenv("ANOMALY_SERVICE_HOST", "127.0.0.1")
+service_port = int(os.getenv("ANOMALY_SERVICE_PORT", "8765"))
+buffer_capacity = int(os.getenv("ANOMALY_BUFFER_CAPACITY", "100000"))
+
+# Field order of anomaly rows, matching the columns of anomaly.csv
+anomaly_fields = ["system_time", "provider_name", "title", "tags", "description", "computer_name", "user_id", "event_id"]
+
+# Fields with a secondary index
+indexed_fields = ["computer_name", "user_id", "title"]
+
+class AnomalyRingBuffer:
+    """Bounded ring buffer of recent anomalies with secondary indexes on computer_name, user_id and title.
+
+    Every appended anomaly gets a monotonically increasing sequence number. Each index maps a
+    value to a deque of sequence numbers in append order; because the slot being overwritten
+    always holds the oldest anomaly, its index entries are always at the left of their deques
+    and are evicted in O(1).
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.next_seq = 0
+        self.indexes = {field: {} for field in indexed_fields}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    def append(self, anomaly):
+        """Add one anomaly (a dict keyed by anomaly_fields), evicting the oldest when full."""
+        with self.lock:
+            seq = self.next_seq
+            slot = seq % self.capacity
+            evicted = self.slots[slot]
+            if evicted is not None:
+                for field, index in self.indexes.items():
+                    value = evicted[1].get(field)
+                    entries = index.get(value)
+                    if entries and entries[0] == evicted[0]:
+                        entries.popleft()
+                        if not entries:
+                            del index[value]
+
+            self.slots[slot] = (seq, anomaly)
+            for field, index in self.indexes.items():
+                index.setdefault(anomaly.get(field), deque()).append(seq)
+            self.next_seq += 1
+
+    def extend(self, anomalies):
+        for anomaly in anomalies:
+            self.append(anomaly)
+
+    def _get(self, seq):
+        entry = self.slots[seq % self.capacity]
+        return entry[1] if entry is not None and entry[0] == seq else None
+
+    def query(self, limit=100, since=None, **filters):
+        """Return up to limit anomalies matching all filters, newest first.
+
+        The smallest index among the filtered fields drives the scan and the remaining filters
+        are checked per candidate. Without indexed filters the ring is walked from the newest slot.
+        """
+        if limit < 0:
+            raise ValueError(f"limit must not be negative, got {limit}")
+        if limit == 0:
+            return []
+        filters = {field: value for field, value in filters.items() if value is not None}
+        with self.lock:
+            candidates = None
+            for field, value in filters.items():
+                if field not in self.indexes:
+                    continue
+                entries = self.indexes[field].get(value)
+                if not entries:
+                    return []
+                if candidates is None or len(entries) < len(candidates):
+                    candidates = entries
+            if candidates is None:
+                candidates = range(max(0, self.next_seq - self.capacity), self.next_seq)
+
+            results = []
+            for seq in reversed(candidates):
+                anomaly = self._get(seq)
+                if anomaly is None:
+                    continue
+                if since and (anomaly.get("system_time") or "") < since:
+                    continue
+                if all(anomaly.get(field) == value for field, value in filters.items()):
+                    results.append(anomaly)
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self),
+                "capacity": self.capacity,
+                "appended": self.next_seq,
+                "distinct": {field: len(index) for field, index in self.indexes.items()},
+            }
+
+def anomaly_from_row(row):
+    """Build an anomaly dict from a row in anomaly.csv column order."""
+    return {field: (str(value) if value is not None else None) for field, value in zip(anomaly_fields, row)}
+
+def seed_from_csv(buffer, path):
+    """Warm the buffer from the newest rows of the anomaly CSV, which is stored newest first."""
+    if not os.path.exists(path):
+        return 0
+    rows = []
+    with open(path, "r") as log_file:
+        csv_reader = csv.reader(log_file)
+        next(csv_reader, None)  # Skip header
+        for row in csv_reader:
+            rows.append(row)
+            if len(rows) >= buffer.capacity:
+                break
+    buffer.extend(anomaly_from_row(row) for row in reversed(rows))
+    logger.info(f"Seeded anomaly buffer with {len(rows)} rows from {path}.")
+    return len(rows)
+
+def make_handler(buffer):
+    """Build a request handler class bound to the given buffer."""
+
+    class AnomalyQueryHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if url.path == "/anomalies":
+                try:
+                    limit = int(params.pop("limit", 100))
+                except ValueError:
+                    limit = -1
+                if limit < 0:
+                    self._send_json(400, {"error": "limit must be a non-negative integer"})
+                    return
+                since = params.pop("since", None)
+                unknown = set(params) - set(anomaly_fields)
+                if unknown:
+                    self._send_json(400, {"error": f"unknown filters: {', '.join(sorted(unknown))}"})
+                    return
+                anomalies = buffer.query(limit=limit, since=since, **params)
+                self._send_json(200, {"count": len(anomalies), "anomalies": anomalies})
+            elif url.path == "/stats":
+                self._send_json(200, buffer.stats())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            logger.debug(f"Anomaly service: {format % args}")
+
+    return AnomalyQueryHandler
+
+def start_service(buffer, host=service_host, port=service_port):
+    """Serve buffer queries over HTTP from a daemon thread and return the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(buffer))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Anomaly query service listening on http://{host}:{port}")
+    return server
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Query recent anomalies from the running anomaly service.")
+    parser.add_argument("--computer", dest="computer_name", help="Filter on computer_name")
+    parser.add_argument("--user", dest="user_id", help="Filter on user_id")
+    parser.add_argument("--title", help="Filter on title")
+    parser.add_argument("--since", help="Only anomalies at or after this system_time (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--stats", action="store_true", help="Print buffer statistics instead of anomalies")
+    parser.add_argument("--url", default=f"http://{service_host}:{service_port}")
+    args = parser.parse_args()
+
+    if args.stats:
+        with urlopen(f"{args.url}/stats") as response:
+            print(json.dumps(json.load(response), indent=2))
+        return
+
+    params = {key: value for key, value in vars(args).items()
+              if key in ("computer_name", "user_id", "title", "since", "limit") and value is not None}
+    with urlopen(f"{args.url}/anomalies?{urlencode(params)}") as response:
+        payload = json.load(response)
+    csv_writer = csv.writer(sys.stdout)
+    csv_writer.writerow(anomaly_fields)
+    for anomaly in payload["anomalies"]:
+        csv_writer.writerow([anomaly.get(field) for field in anomaly_fields])
+
+if __name__ == "__main__":
+    main()
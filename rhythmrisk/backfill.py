@@ -0,0 +1,316 @@
+import os
+import argparse
+import logging
+import tempfile
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from . import configure_logging, db
+from .ingest import log_folder, process_log_file, signature_clusters, update_last_processed_time
+from .schema import initialize_sql_tables
+from .dimensions import normalize_records, normalized_columns
+from .dedup import SeenLines, dedup_state_path
+from .rates import RateCounters, rate_features_enabled, rate_snapshot_path
+from .cluster_profile import ProfileDeltas, apply_profile_deltas, rebuild_cluster_profile
+
+logger = logging.getLogger()
+
+# Columns written to the staging files, in LOAD DATA order
+staging_columns = normalized_columns + ["dbscan_cluster"]
+
+# Staged noise rows looked up per statement when filling dbscan_outlier
+outlier_chunk_size = 1000
+
+# Rows per staging file; each file is loaded in its own transaction
+rows_per_stage = 500000
+
+# The backfill's own dedup set; the live ingester's set is only read, never written
+backfill_dedup_path = f"{dedup_state_path}.backfill"
+# The backfill's rate counts, which the clustering stage merges with the ingester's snapshot
+backfill_rate_path = f"{rate_snapshot_path}.backfill"
+
+def parse_file(args):
+    """Pool worker: parse one log file with process_log_file."""
+    file_path, since = args
+    data, latest_time = process_log_file(file_path, since)
+    return file_path, data, latest_time
+
+def fetch_signature_clusters():
+    """Load the existing signature -> cluster mapping and the current maximum cluster.
+
+    The mapping is signature_clusters', the lookup the live ingester uses, so a backfilled
+    alert gets the label a live insert of the same alert would get.
+    """
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            signatures = signature_clusters(cursor)
+            cursor.execute("SELECT MAX(dbscan_cluster) FROM sigma_alerts")
+            result = cursor.fetchone()
+            max_cluster = result[0] if result[0] is not None else 0
+        return signatures, max_cluster
+    except db.Error as e:
+        logger.error(f"Error loading existing cluster signatures: {e}")
+        raise
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def mysql_field(value):
+    """Format a value for LOAD DATA's default tab-separated, backslash-escaped format."""
+    if value is None:
+        return "\\N"
+    value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+class StagingWriter:
+    """Write rows to a sequence of tab-separated staging files of bounded size.
+
+    Each file has its own cluster_profile deltas, applied only if the whole file is inserted,
+    and its own list of noise rows, materialized in dbscan_outlier when the file is loaded.
+    """
+
+    def __init__(self, staging_dir):
+        self.staging_dir = staging_dir
+        self.paths = []
+        self.rows = []
+        self.deltas = []
+        self.noise = []
+        self.file = None
+        self.rows_in_file = 0
+        self.total_rows = 0
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        path = os.path.join(self.staging_dir, f"stage-{len(self.paths):05d}.tsv")
+        self.file = open(path, "w", encoding="utf-8", newline="\n")
+        self.paths.append(path)
+        self.rows.append(0)
+        self.deltas.append(ProfileDeltas())
+        self.noise.append([])
+        self.rows_in_file = 0
+
+    def write(self, row):
+        """Stage a normalized row ending in its cluster value."""
+        if self.file is None or self.rows_in_file >= rows_per_stage:
+            self._rotate()
+        self.file.write("\t".join(mysql_field(value) for value in row) + "\n")
+        self.deltas[-1][row[-1]].add(row[3], row[4], row[5], row[8])
+        if row[-1] == -1 and row[9] is not None:
+            self.noise[-1].append((row[9], row[3]))
+        self.rows_in_file += 1
+        self.rows[-1] += 1
+        self.total_rows += 1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def read_staged_rows(path):
+    """Read a staging file back into tuples, for servers that refuse LOAD DATA LOCAL."""
+    unescape = {"\\\\": "\\", "\\t": "\t", "\\n": "\n", "\\r": "\r"}
+    rows = []
+    with open(path, "r", encoding="utf-8", newline="\n") as file:
+        for line in file:
+            fields = []
+            for field in line.rstrip("\n").split("\t"):
+                if field == "\\N":
+                    fields.append(None)
+                    continue
+                out, i = [], 0
+                while i < len(field):
+                    pair = field[i:i + 2]
+                    if pair in unescape:
+                        out.append(unescape[pair])
+                        i += 2
+                    else:
+                        out.append(field[i])
+                        i += 1
+                fields.append("".join(out))
+            rows.append(tuple(fields))
+    return rows
+
+def insert_backfill_outliers(cursor, noise):
+    """Add dbscan_outlier rows for staged noise, keyed by (line_hash, system_time); returns the rows added.
+
+    Only rows stored as noise are added, and alert_id is unique, so a staged row IGNORE
+    dropped in favour of an existing one adds nothing.
+    """
+    added = 0
+    for offset in range(0, len(noise), outlier_chunk_size):
+        chunk = noise[offset:offset + outlier_chunk_size]
+        cursor.execute(
+            f"SELECT id FROM sigma_alerts WHERE dbscan_cluster = -1 AND (line_hash, system_time) IN "
+            f"({', '.join(['(%s, %s)'] * len(chunk))})",
+            [value for key in chunk for value in key]
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            continue
+        cursor.execute(f"""
+        INSERT IGNORE INTO dbscan_outlier
+            (alert_id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, dbscan_cluster)
+        SELECT id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, -1
+        FROM sigma_alerts_flat
+        WHERE id IN ({', '.join(['%s'] * len(ids))})
+        """, ids)
+        added += cursor.rowcount
+    return added
+
+def load_staging_files(writer):
+    """Bulk load the writer's staging files with LOAD DATA LOCAL INFILE, falling back to batched inserts.
+
+    A file's profile deltas are applied in its load transaction when every row went in. If
+    IGNORE dropped some, which rows is unknown, so the file's clusters are returned to be
+    re-derived from sigma_alerts instead. The file's noise rows reach dbscan_outlier in the
+    same transaction. Returns (rows loaded, clusters to re-derive).
+    """
+    connection = None
+    loaded = 0
+    rederive = set()
+    try:
+        connection = db.connect(allow_local_infile=True)
+        with connection.cursor() as cursor:
+            for path, expected, deltas, noise in zip(writer.paths, writer.rows, writer.deltas, writer.noise):
+                start = time.perf_counter()
+                try:
+                    cursor.execute(
+                        f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE sigma_alerts "
+                        f"CHARACTER SET utf8mb4 "
+                        f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                        f"({', '.join(staging_columns)})",
+                        (path,)
+                    )
+                    count = cursor.rowcount
+                except db.Error as e:
+                    logger.warning(f"LOAD DATA LOCAL INFILE failed for {path} ({e}); falling back to batched inserts.")
+                    rows = read_staged_rows(path)
+                    insert_query = f"""
+                    INSERT IGNORE INTO sigma_alerts ({', '.join(staging_columns)})
+                    VALUES ({', '.join(['%s'] * len(staging_columns))})
+                    """
+                    count = 0
+                    for offset in range(0, len(rows), 10000):
+                        cursor.executemany(insert_query, rows[offset:offset + 10000])
+                        count += cursor.rowcount
+                if count == expected:
+                    apply_profile_deltas(cursor, deltas)
+                else:
+                    rederive.update(deltas)
+                insert_backfill_outliers(cursor, noise)
+                connection.commit()
+                loaded += count
+                logger.info(f"Loaded {count} rows from {path} in {time.perf_counter() - start:.2f} seconds.")
+        return loaded, rederive
+    except db.Error as e:
+        logger.error(f"Error bulk loading staged data: {e}")
+        raise
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def rederive_backfill_profiles(cluster_ids):
+    """Recompute the profiles of clusters whose staged rows were only partly inserted."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            count = rebuild_cluster_profile(cursor, cluster_ids)
+        connection.commit()
+        logger.info(f"Re-derived cluster_profile for {count} clusters from sigma_alerts.")
+    except db.Error as e:
+        logger.error(f"Error updating cluster_profile after backfill: {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def backfill(folder, workers, staging_dir, since=None, keep_staging=False):
+    """Parse every file in folder in parallel, assign cluster signatures in bulk and bulk load the result."""
+    start = time.perf_counter()
+    files = [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+    files = [path for path in files if os.path.isfile(path)]
+    logger.info(f"Backfilling {len(files)} files from {folder} with {workers} workers.")
+
+    signatures, max_cluster = fetch_signature_clusters()
+    next_cluster = max_cluster + 1
+    latest = since
+    # Lines the live ingester or an earlier backfill already inserted are dropped before staging
+    live_lines = SeenLines().load()
+    seen_lines = SeenLines(backfill_dedup_path).load()
+    rate_counters = RateCounters(backfill_rate_path).load() if rate_features_enabled else None
+
+    os.makedirs(staging_dir, exist_ok=True)
+    writer = StagingWriter(staging_dir)
+    # One connection resolves dimension keys for every file, a batch per file
+    connection = db.connect()
+    try:
+        with Pool(processes=workers) as pool:
+            # imap keeps file order so new clusters are numbered as a sequential run would number them
+            for file_path, data, latest_time in pool.imap(parse_file, [(path, since) for path in files]):
+                data = [record for record in data if record not in seen_lines and record not in live_lines]
+                for record in data:
+                    seen_lines.add(record)
+                    if rate_counters is not None:
+                        rate_counters.add_record(record)
+                for row in normalize_records(connection, data):
+                    signature = row[8]
+                    cluster_value = signatures.get(signature)
+                    if cluster_value is None:
+                        cluster_value = next_cluster
+                        signatures[signature] = cluster_value
+                        next_cluster += 1
+                    writer.write(row + (cluster_value,))
+                if isinstance(latest_time, datetime) and (latest is None or latest_time > latest):
+                    latest = latest_time
+    finally:
+        writer.close()
+        if connection.is_connected():
+            connection.close()
+    parse_seconds = time.perf_counter() - start
+    logger.info(f"Parsed and staged {writer.total_rows} rows in {parse_seconds:.2f} seconds ({next_cluster - max_cluster - 1} new clusters).")
+
+    loaded, rederive = load_staging_files(writer)
+    if rederive:
+        # Only rows whose hashes had already expired from the dedup sets can get here
+        logger.warning(f"{writer.total_rows - loaded} staged rows were already in sigma_alerts; re-deriving {len(rederive)} cluster profiles.")
+        rederive_backfill_profiles(rederive)
+    seen_lines.save(force=True)
+    if rate_counters is not None:
+        rate_counters.save(force=True)
+
+    if isinstance(latest, datetime):
+        update_last_processed_time(latest)
+
+    if not keep_staging:
+        for path in writer.paths:
+            os.remove(path)
+
+    total_seconds = time.perf_counter() - start
+    rate = loaded / total_seconds if total_seconds else 0
+    logger.info(f"Backfill complete: {loaded} rows in {total_seconds:.2f} seconds ({rate:.0f} rows/s).")
+    return loaded
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Bulk backfill historical Zircolite output into sigma_alerts.")
+    parser.add_argument("folder", nargs="?", default=log_folder, help="Folder of historical log files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    parser.add_argument("--staging-dir", default=None, help="Directory for staging files (default: a temporary directory)")
+    parser.add_argument("--since", default=None, help="Only load entries after this time (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--keep-staging", action="store_true", help="Keep the staging files after loading")
+    args = parser.parse_args()
+
+    since = datetime.strptime(args.since, "%Y-%m-%d %H:%M:%S") if args.since else None
+    initialize_sql_tables()
+    if args.staging_dir:
+        backfill(args.folder, args.workers, args.staging_dir, since, args.keep_staging)
+    else:
+        with tempfile.TemporaryDirectory(prefix="sigma-backfill-") as staging_dir:
+            backfill(args.folder, args.workers, staging_dir, since, args.keep_staging)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import argparse
+import logging
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from . import configure_logging
+
+logger = logging.getLogger()
+
+# Vocabulary used to build synthetic alerts when no database is available
+synthetic_titles = [
+    "Suspicious PowerShell Download", "Mimikatz Command Line", "Non Interactive PowerShell",
+    "Scheduled Task Creation", "Remote Thread Creation", "Windows Defender Disabled",
+    "Whoami Execution", "Net.exe User Account Creation", "LSASS Memory Dump", "Rundll32 Without Parameters",
+]
+synthetic_tags = [
+    "attack.execution,attack.t1059.001", "attack.credential_access,attack.t1003",
+    "attack.persistence,attack.t1053.005", "attack.defense_evasion,attack.t1562.001",
+    "attack.discovery,attack.t1033", "attack.privilege_escalation,attack.t1055",
+]
+synthetic_providers = [
+    "Microsoft-Windows-Sysmon", "Microsoft-Windows-Security-Auditing",
+    "Microsoft-Windows-PowerShell", "Microsoft-Windows-Windows Defender",
+]
+
+def synthetic_rows(count, seed=0):
+    """Generate fetch_data-shaped rows (id, title, tags, computer, user, event, provider, system_time)."""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=1)
+    rows = []
+    for i in range(count):
+        rows.append((
+            i + 1,
+            rng.choice(synthetic_titles),
+            rng.choice(synthetic_tags),
+            f"WS-{rng.randint(1, 200):04d}.corp.local",
+            f"S-1-5-21-{rng.randint(1, 500)}",
+            str(rng.choice([1, 4624, 4688, 4104, 7045, 10])),
+            rng.choice(synthetic_providers),
+            start + timedelta(seconds=i * 86400 // max(count, 1)),
+        ))
+    return rows
+
+def write_synthetic_logs(folder, count, files, seed=0):
+    """Write count synthetic Zircolite JSON lines spread over files files; returns their paths.
+
+    Every run gets a fresh token in the description, so the lines are never duplicates of an
+    earlier run's and the line-hash key inserts all of them.
+    """
+    token = uuid.uuid4().hex
+    rows = synthetic_rows(count, seed)
+    # File names carry the token too, since leases are keyed by file name
+    paths = [os.path.join(folder, f"zircolite-{token[:8]}-{index:04d}.json") for index in range(files)]
+    handles = [open(path, "w") for path in paths]
+    try:
+        for i, row in enumerate(rows):
+            handles[i % files].write(json.dumps({
+                "title": row[1], "tags": row[2].split(","), "description": f"Synthetic alert {i} of run {token}",
+                "SystemTime": row[7].strftime("%Y-%m-%dT%H:%M:%S.000Z"), "Computer": row[3], "UserID": row[4],
+                "EventID": int(row[5]), "Provider_Name": row[6],
+            }, separators=(",", ":")) + "\n")
+    finally:
+        for handle in handles:
+            handle.close()
+    return paths
+
+def load_rows(args):
+    """Load benchmark input either from sigma_alerts or from the synthetic generator."""
+    if args.synthetic:
+        return synthetic_rows(args.synthetic, args.seed)
+    from . import clustering
+    return clustering.fetch_data()
+
+def noise_agreement(reference, labels):
+    """Fraction of rows whose noise/non-noise status matches the reference labelling."""
+    matches = sum(1 for a, b in zip(reference, labels) if (a == -1) == (b == -1))
+    return matches / len(reference) if len(reference) else 1.0
+
+def benchmark_projection(args):
+    """Compare DBSCAN on the full-width matrix against projected matrices of several widths."""
+    from . import clustering
+    from sklearn.metrics import adjusted_rand_score
+
+    rows = load_rows(args)
+    if not rows:
+        logger.warning("No rows to benchmark.")
+        return
+
+    start = time.perf_counter()
+    full_matrix = clustering.preprocess_data(rows)
+    preprocess_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = clustering.run_dbscan(full_matrix)
+    cluster_seconds = time.perf_counter() - start
+
+    print(f"rows={len(rows)}")
+    print(f"{'components':>10} {'width':>7} {'prep_s':>8} {'dbscan_s':>9} {'ARI':>6} {'noise_agree':>11}")
+    print(f"{'full':>10} {full_matrix.shape[1]:>7} {preprocess_seconds:>8.3f} {cluster_seconds:>9.3f} {1.0:>6.3f} {1.0:>11.3f}")
+
+    for n_components in args.components:
+        projector = clustering.FeatureProjector(n_components)
+        start = time.perf_counter()
+        projected = projector.transform(rows)
+        preprocess_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        labels = clustering.run_dbscan(projected)
+        cluster_seconds = time.perf_counter() - start
+        print(
+            f"{n_components:>10} {projected.shape[1]:>7} {preprocess_seconds:>8.3f} {cluster_seconds:>9.3f} "
+            f"{adjusted_rand_score(reference, labels):>6.3f} {noise_agreement(reference, labels):>11.3f}"
+        )
+
+def fresh(value):
+    """Return an equal but distinct str object, as a driver or regex match would hand back."""
+    return value.encode("utf-8").decode("utf-8") if isinstance(value, str) else value
+
+def measure_peak(build):
+    """Run build() under tracemalloc and return (result, peak bytes, seconds)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, seconds
+
+def benchmark_memory(args):
+    """Compare peak memory of plain tuples against AlertRecord/AlertBatch for ingest and clustering input."""
+    from . import records
+
+    count = args.synthetic or 1000000
+    rows = synthetic_rows(count, args.seed)
+    description = "Detects a suspicious command line"
+
+    def legacy_ingest():
+        return [(fresh(row[1]), fresh(row[2]), fresh(description), row[7].strftime("%Y-%m-%d %H:%M:%S"),
+                 fresh(row[3]), fresh(row[4]), fresh(row[5]), fresh(row[6])) for row in rows]
+
+    def compact_ingest():
+        return [records.AlertRecord(fresh(row[1]), fresh(row[2]), fresh(description), row[7],
+                                    fresh(row[3]), fresh(row[4]), fresh(row[5]), fresh(row[6])) for row in rows]
+
+    def legacy_fetch():
+        fetched = [tuple(fresh(value) for value in row[:7]) for row in rows]
+        if args.with_encoding:
+            from sklearn.preprocessing import LabelEncoder
+            for index in range(3, 7):
+                LabelEncoder().fit_transform([row[index] for row in fetched])
+        return fetched
+
+    def compact_fetch():
+        batch = records.AlertBatch()
+        for row in rows:
+            batch.append(*(fresh(value) for value in row[:7]))
+        if args.with_encoding:
+            from .features import encode_categoricals
+            encode_categoricals(batch)
+        return batch
+
+    print(f"rows={count}")
+    print(f"{'stage':>10} {'representation':>16} {'peak_MiB':>9} {'seconds':>8}")
+    for stage, legacy, compact in (("ingest", legacy_ingest, compact_ingest), ("clustering", legacy_fetch, compact_fetch)):
+        for name, build in (("tuples", legacy), ("compact", compact)):
+            result, peak, seconds = measure_peak(build)
+            del result
+            print(f"{stage:>10} {name:>16} {peak / 2**20:>9.1f} {seconds:>8.2f}")
+
+def benchmark_backfill(args):
+    """Rows/s of the per-record ingest path against the backfill command on synthetic logs.
+
+    Both write to the configured database, so point DB_NAME at a scratch schema. Local state
+    files (bookmark, dedup set, rate snapshot) are written to a temporary directory.
+    """
+    from . import backfill, ingest
+    from .schema import initialize_sql_tables
+
+    initialize_sql_tables()
+    workdir = tempfile.mkdtemp(prefix="sigma-benchmark-")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        legacy_folder, backfill_folder = os.path.join(workdir, "legacy"), os.path.join(workdir, "backfill")
+        os.makedirs(legacy_folder)
+        os.makedirs(backfill_folder)
+
+        ingest.configure()
+        # The per-record path does a few round trips per alert, so a small sample is enough
+        legacy_paths = write_synthetic_logs(legacy_folder, args.legacy_rows, 1, args.seed)
+        records, _ = ingest.process_log_file(legacy_paths[0], None)
+        start = time.perf_counter()
+        for record in records:
+            ingest.insert_data_to_sql([record], "sigma_alerts", ingest.assign_cluster_value(record))
+        legacy_rate = len(records) / (time.perf_counter() - start)
+
+        write_synthetic_logs(backfill_folder, args.synthetic or 200000, args.files, args.seed)
+        start = time.perf_counter()
+        loaded = backfill.backfill(backfill_folder, args.workers, os.path.join(workdir, "staging"))
+        backfill_rate = loaded / (time.perf_counter() - start)
+    finally:
+        os.chdir(previous)
+
+    print(f"{'path':>10} {'rows':>9} {'rows_per_s':>11}")
+    print(f"{'per-record':>10} {len(records):>9} {legacy_rate:>11.0f}")
+    print(f"{'backfill':>10} {loaded:>9} {backfill_rate:>11.0f}")
+    print(f"speedup={backfill_rate / legacy_rate:.1f}x")
+
+def benchmark_workers(args):
+    """Rows/s of the workers command in drain mode for each worker count, on fresh synthetic logs.
+
+    Every run inserts into the configured database, so point DB_NAME at a scratch schema.
+    Worker state (dedup sets, rate snapshots, spools, bookmark) goes to a temporary directory.
+    """
+    from .schema import initialize_sql_tables
+
+    initialize_sql_tables()
+    rows = args.synthetic or 200000
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'workers':>7} {'rows':>9} {'seconds':>8} {'rows_per_s':>11} {'scaling':>7}")
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory(prefix="sigma-benchmark-") as workdir:
+            folder = os.path.join(workdir, "logs")
+            os.makedirs(folder)
+            write_synthetic_logs(folder, rows, args.files, args.seed)
+            env = dict(os.environ, RHYTHMRISK_STATE_DIR=workdir,
+                       PYTHONPATH=os.pathsep.join(filter(None, [package_parent, os.getenv("PYTHONPATH")])))
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-m", "rhythmrisk", "workers", "--folder", folder, "--workers", str(workers),
+                 "--worker-prefix", f"benchmark-{uuid.uuid4().hex[:8]}", "--drain"],
+                cwd=workdir, env=env, check=True
+            )
+            seconds = time.perf_counter() - start
+        rate = rows / seconds
+        baseline = baseline or rate
+        print(f"{workers:>7} {rows:>9} {seconds:>8.2f} {rate:>11.0f} {rate / baseline:>6.2f}x")
+
+# Dependencies whose import cost the startup benchmark reports
+heavy_modules = ["numpy", "scipy", "sklearn", "mysql.connector"]
+
+# Run in a fresh interpreter: import one entry point's module and report what it cost
+startup_probe = """
+import sys, time, importlib
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+getattr(module, sys.argv[2])
+seconds = time.perf_counter() - start
+print(seconds, ",".join(name for name in sys.argv[3:] if name in sys.modules))
+"""
+
+def benchmark_startup(args):
+    """Time importing each command's entry point in a fresh interpreter and list the heavy modules it pulled in."""
+    from .__main__ import commands
+
+    print(f"{'command':>10} {'import_ms':>9} {'process_ms':>10}  heavy imports")
+    for name, (module_name, function, _) in commands.items():
+        import_times, process_times = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-c", startup_probe, module_name, function] + heavy_modules,
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            process_times.append(time.perf_counter() - start)
+            import_times.append(float(output[0]))
+        loaded = output[1] if len(output) > 1 else "-"
+        print(f"{name:>10} {statistics.median(import_times) * 1000:>9.0f} {statistics.median(process_times) * 1000:>10.0f}  {loaded}")
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Benchmarks for the RhythmRiskAnalytics pipeline.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic alerts instead of sigma_alerts")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic generator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    projection_parser = subparsers.add_parser("projection", help="Clustering time and label agreement per projection width")
+    projection_parser.add_argument("--components", type=int, nargs="+", default=[8, 16, 32, 64])
+    projection_parser.set_defaults(func=benchmark_projection)
+
+    memory_parser = subparsers.add_parser("memory", help="tracemalloc peak of tuple vs compact records (default 1M alerts)")
+    memory_parser.add_argument("--with-encoding", action="store_true", help="Include categorical encoding in the clustering stage")
+    memory_parser.set_defaults(func=benchmark_memory)
+
+    startup_parser = subparsers.add_parser("startup", help="Import time of each command's entry point")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Runs per command; the median is reported")
+    startup_parser.set_defaults(func=benchmark_startup)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Per-record ingest vs the backfill command (needs a scratch database)")
+    backfill_parser.add_argument("--legacy-rows", type=int, default=2000, help="Alerts sent through the per-record path")
+    backfill_parser.add_argument("--files", type=int, default=16, help="Files the backfill input is split into")
+    backfill_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Backfill parser processes")
+    backfill_parser.set_defaults(func=benchmark_backfill)
+
+    workers_parser = subparsers.add_parser("workers", help="Ingest throughput of lease-coordinated workers (needs a scratch database)")
+    workers_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to measure")
+    workers_parser.add_argument("--files", type=int, default=16, help="Files the input is split into")
+    workers_parser.set_defaults(func=benchmark_workers)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
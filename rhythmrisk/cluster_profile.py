@@ -0,0 +1,231 @@
+import hashlib
+import math
+import logging
+from collections import Counter
+
+logger = logging.getLogger()
+
+# HyperLogLog precision: 2**8 one-byte registers per sketch, about 6.5% standard error
+sketch_precision = 8
+
+# Clusters per statement when applying deltas
+profile_chunk_size = 500
+
+class HyperLogLog:
+    """Small mergeable distinct-count sketch stored as a bytearray of registers."""
+
+    __slots__ = ("registers",)
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(1 << sketch_precision)
+
+    def add(self, item):
+        if item is None:
+            return
+        h = int.from_bytes(hashlib.blake2b(str(item).encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - sketch_precision)
+        remainder = h & ((1 << (64 - sketch_precision)) - 1)
+        rank = (64 - sketch_precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+class ProfileDelta:
+    """Change to one cluster's profile accumulated from a batch of inserted or relabelled alerts."""
+
+    __slots__ = ("count", "first_seen", "last_seen", "hosts", "users", "signatures")
+
+    def __init__(self):
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.hosts = HyperLogLog()
+        self.users = HyperLogLog()
+        self.signatures = Counter()
+
+    def add(self, system_time, host_key, user_key, signature):
+        """Count one alert joining the cluster."""
+        self.count += 1
+        if system_time is not None:
+            if self.first_seen is None or system_time < self.first_seen:
+                self.first_seen = system_time
+            if self.last_seen is None or system_time > self.last_seen:
+                self.last_seen = system_time
+        self.hosts.add(host_key)
+        self.users.add(user_key)
+        if signature:
+            self.signatures[signature] += 1
+
+    def remove(self, count=1):
+        """Count alerts leaving the cluster (one by default).
+
+        Only the count shrinks: first/last seen and the sketches are monotone, so after
+        removals they describe every alert the cluster has held rather than its current members.
+        rebuild_cluster_profile recomputes them exactly from sigma_alerts.
+        """
+        self.count -= count
+
+class ProfileDeltas(dict):
+    """Cluster id -> ProfileDelta, created on first use."""
+
+    def __missing__(self, cluster_id):
+        delta = self[cluster_id] = ProfileDelta()
+        return delta
+
+def representative_vote(current, current_count, candidate, count):
+    """Fold a batch's most common signature into the stored representative.
+
+    This is the Boyer-Moore majority vote applied to batches: the same signature adds to the
+    stored count, a different one cancels it and takes over once it outweighs it. A signature
+    held by most of a cluster's alerts therefore always ends up as its representative.
+    """
+    if candidate is None:
+        return current, current_count
+    if current is None or current == candidate:
+        return candidate, current_count + count
+    if count > current_count:
+        return candidate, count - current_count
+    return current, current_count - count
+
+def create_cluster_profile_table(cursor):
+    """Create the cluster_profile table, seeding it from sigma_alerts when it is new.
+
+    first_seen, last_seen and the host/user sketches only ever grow (see ProfileDelta.remove),
+    so once alerts are relabelled or expired they are bounds over the cluster's history;
+    rebuild_cluster_profile makes them exact again.
+    """
+    cursor.execute("SHOW TABLES LIKE 'cluster_profile'")
+    created = cursor.fetchone() is None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cluster_profile (
+        cluster_id INT PRIMARY KEY,
+        alert_count BIGINT NOT NULL DEFAULT 0,
+        first_seen DATETIME,
+        last_seen DATETIME,
+        host_sketch VARBINARY(256),
+        user_sketch VARBINARY(256),
+        distinct_hosts INT,
+        distinct_users INT,
+        representative_signature BIGINT UNSIGNED,
+        representative_count BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+    """)
+    cursor.execute("SHOW COLUMNS FROM cluster_profile LIKE 'representative_count'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE cluster_profile ADD COLUMN representative_count BIGINT NOT NULL DEFAULT 0 AFTER representative_signature")
+        logger.info("Added 'representative_count' column to 'cluster_profile'.")
+    if created:
+        seeded = seed_cluster_profile(cursor)
+        logger.info(f"Seeded cluster_profile with {seeded} clusters from sigma_alerts.")
+
+def seed_cluster_profile(cursor, cluster_ids=None):
+    """Build profiles for every labelled cluster in sigma_alerts (or only cluster_ids) with a few GROUP BY queries.
+
+    Meant for clusters that have no cluster_profile row; returns the number of clusters written.
+    """
+    cursor.execute("SHOW COLUMNS FROM sigma_alerts LIKE 'dbscan_cluster'")
+    if not cursor.fetchone():
+        return 0
+    condition, params = "dbscan_cluster IS NOT NULL", ()
+    if cluster_ids is not None:
+        cluster_ids = sorted(cluster_ids)
+        if not cluster_ids:
+            return 0
+        condition, params = f"dbscan_cluster IN ({', '.join(['%s'] * len(cluster_ids))})", tuple(cluster_ids)
+    deltas = ProfileDeltas()
+    cursor.execute(f"""
+    SELECT dbscan_cluster, COUNT(*), MIN(system_time), MAX(system_time)
+    FROM sigma_alerts WHERE {condition} GROUP BY dbscan_cluster
+    """, params)
+    for cluster_id, count, first_seen, last_seen in cursor.fetchall():
+        delta = deltas[cluster_id]
+        delta.count, delta.first_seen, delta.last_seen = count, first_seen, last_seen
+    for column, sketch in (("computer_key", "hosts"), ("user_key", "users")):
+        cursor.execute(f"SELECT DISTINCT dbscan_cluster, {column} FROM sigma_alerts WHERE {condition} AND {column} IS NOT NULL", params)
+        for cluster_id, key in cursor.fetchall():
+            getattr(deltas[cluster_id], sketch).add(key)
+    cursor.execute(f"""
+    SELECT dbscan_cluster, signature_id, COUNT(*)
+    FROM sigma_alerts WHERE {condition} AND signature_id IS NOT NULL GROUP BY dbscan_cluster, signature_id
+    """, params)
+    for cluster_id, signature, count in cursor.fetchall():
+        deltas[cluster_id].signatures[signature] = count
+    return apply_profile_deltas(cursor, deltas)
+
+def rebuild_cluster_profile(cursor, cluster_ids=None):
+    """Replace cluster_profile (or the rows of cluster_ids) with exact profiles of the current sigma_alerts labels."""
+    if cluster_ids is None:
+        cursor.execute("DELETE FROM cluster_profile")
+    else:
+        cluster_ids = sorted(cluster_ids)
+        if not cluster_ids:
+            return 0
+        cursor.execute(f"DELETE FROM cluster_profile WHERE cluster_id IN ({', '.join(['%s'] * len(cluster_ids))})", cluster_ids)
+    return seed_cluster_profile(cursor, cluster_ids)
+
+def apply_profile_deltas(cursor, deltas):
+    """Fold deltas into cluster_profile inside the caller's transaction.
+
+    Existing sketches and representatives are read with FOR UPDATE, merged in Python and
+    written back with the new estimates; counts and first/last seen are adjusted in SQL.
+    Profiles whose count drops to zero are removed.
+    """
+    cluster_ids = sorted(cluster_id for cluster_id in deltas if cluster_id is not None)
+    for offset in range(0, len(cluster_ids), profile_chunk_size):
+        chunk = cluster_ids[offset:offset + profile_chunk_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(
+            f"""SELECT cluster_id, host_sketch, user_sketch, representative_signature, representative_count
+            FROM cluster_profile WHERE cluster_id IN ({placeholders}) FOR UPDATE""",
+            chunk
+        )
+        existing = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        rows = []
+        for cluster_id in chunk:
+            delta = deltas[cluster_id]
+            hosts, users = delta.hosts, delta.users
+            candidate, count = delta.signatures.most_common(1)[0] if delta.signatures else (None, 0)
+            representative, representative_count = candidate, count
+            if cluster_id in existing:
+                host_sketch, user_sketch, current, current_count = existing[cluster_id]
+                hosts = HyperLogLog(host_sketch).merge(hosts)
+                users = HyperLogLog(user_sketch).merge(users)
+                representative, representative_count = representative_vote(current, current_count or 0, candidate, count)
+            rows.append((
+                cluster_id, delta.count, delta.first_seen, delta.last_seen, bytes(hosts.registers), bytes(users.registers),
+                hosts.estimate(), users.estimate(), representative, representative_count
+            ))
+
+        cursor.executemany("""
+        INSERT INTO cluster_profile
+            (cluster_id, alert_count, first_seen, last_seen, host_sketch, user_sketch, distinct_hosts, distinct_users,
+             representative_signature, representative_count)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            alert_count = alert_count + VALUES(alert_count),
+            first_seen = LEAST(COALESCE(first_seen, VALUES(first_seen)), COALESCE(VALUES(first_seen), first_seen)),
+            last_seen = GREATEST(COALESCE(last_seen, VALUES(last_seen)), COALESCE(VALUES(last_seen), last_seen)),
+            host_sketch = VALUES(host_sketch),
+            user_sketch = VALUES(user_sketch),
+            distinct_hosts = VALUES(distinct_hosts),
+            distinct_users = VALUES(distinct_users),
+            representative_signature = VALUES(representative_signature),
+            representative_count = VALUES(representative_count)
+        """, rows)
+        cursor.execute(f"DELETE FROM cluster_profile WHERE cluster_id IN ({placeholders}) AND alert_count <= 0", chunk)
+    return len(cluster_ids)
@@ -0,0 +1,420 @@
+import logging
+import heapq
+import json
+from collections import deque
+import os
+import sys
+import schedule
+import time
+from datetime import datetime, timedelta
+from . import configure_logging, db, state_path
+from .records import (AlertBatch, as_batch, computer_table, event_table, from_epoch, missing_cluster,
+                      provider_table, tags_table, title_table, to_epoch, user_table)
+from .features import CoreSampleIndex, FeatureProjector, encode_categoricals
+from .dimensions import refresh_intern_tables
+from .cluster_profile import ProfileDeltas, apply_profile_deltas
+from .profiling import configure_from_args, maybe_profile
+from .rates import RateCounters, rate_features_enabled
+from .features import rate_columns
+
+# Sliding-window mode: cluster only the trailing N hours of system_time (0 clusters the whole table)
+cluster_window_hours = float(os.getenv("CLUSTER_WINDOW_HOURS", "0"))
+
+# Seconds an insert transaction may stay open. Concurrent writers commit ids out of order, so
+# each cycle re-reads ids above the high-water mark reached this long ago
+window_commit_lag_seconds = float(os.getenv("WINDOW_COMMIT_LAG_SECONDS", "600"))
+
+# Optional projection of the text features to N components before DBSCAN (0 uses the full-width matrix)
+projection_components = int(os.getenv("PROJECTION_COMPONENTS", "0"))
+
+# DBSCAN parameters, written by the tune command and read once by main()
+dbscan_config_path = os.getenv("DBSCAN_CONFIG_PATH", "dbscan_config.json")
+default_dbscan_params = {"eps": 0.5, "min_samples": 5}
+
+def load_dbscan_params(path):
+    """Read eps/min_samples from the tuning config, falling back to the defaults."""
+    params = dict(default_dbscan_params)
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as file:
+                config = json.load(file)
+            params["eps"] = float(config.get("eps", params["eps"]))
+            params["min_samples"] = int(config.get("min_samples", params["min_samples"]))
+            logging.info(f"Loaded DBSCAN parameters from {path}: eps={params['eps']}, min_samples={params['min_samples']}.")
+        except (OSError, ValueError) as e:
+            logging.error(f"Invalid DBSCAN config {path}, using defaults: {e}")
+    return params
+
+dbscan_params = dict(default_dbscan_params)
+
+# Core samples of the last run, persisted for real-time scoring at ingest
+core_index_path = state_path(os.getenv("CORE_INDEX_PATH", "core_index.pkl"))
+
+# Long-lived clustering state, built by configure() when an entry point starts rather than at import
+sliding_window = None
+feature_projector = None
+# Rate counters snapshotted by the ingester, appended as feature columns unless RATE_FEATURES=0
+rate_counters = None
+
+# Rows pulled per round trip when streaming query results into a batch
+fetch_chunk_size = 10000
+
+# Ids per statement when maintaining the dbscan_outlier materialization
+outlier_chunk_size = 1000
+
+# Columns every clustering query selects, in fetch_into_batch order
+select_columns = "id, title_key, tags_key, computer_key, user_key, event_id, provider_key, system_time, dbscan_cluster, signature_id"
+
+def fetch_into_batch(cursor):
+    """Stream rows of select_columns into an AlertBatch.
+
+    Dimension keys are used directly as intern-table codes; NULL keys map to the None code 0.
+    """
+    batch = AlertBatch()
+    while True:
+        rows = cursor.fetchmany(fetch_chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            batch.append_codes(
+                row[0], row[1] or 0, row[2] or 0, row[3] or 0, row[4] or 0,
+                event_table.code(row[5]), row[6] or 0, to_epoch(row[7]),
+                missing_cluster if row[8] is None else row[8], row[9] or 0
+            )
+    # Adopt exactly the dimension ids the batch references and the intern tables lack
+    refresh_intern_tables(cursor, batch)
+    return batch
+
+def fetch_data():
+    """Fetch data from the sigma_alerts table."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            select_query = f"""
+            SELECT {select_columns}
+            FROM sigma_alerts
+            """
+            cursor.execute(select_query)
+            data = fetch_into_batch(cursor)
+        return data
+    except db.Error as e:
+        logging.error(f"Error fetching data: {e}")
+        return AlertBatch()
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def fetch_window_rows(after_id, cutoff):
+    """Fetch rows newer than after_id whose system_time falls inside the window."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            select_query = f"""
+            SELECT {select_columns}
+            FROM sigma_alerts
+            WHERE id > %s AND system_time >= %s
+            ORDER BY id
+            """
+            cursor.execute(select_query, (after_id, cutoff))
+            data = fetch_into_batch(cursor)
+        return data
+    except db.Error as e:
+        logging.error(f"Error fetching window rows: {e}")
+        return AlertBatch()
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+class SlidingWindow:
+    """Trailing window of alerts over system_time, maintained incrementally between cycles.
+
+    Each cycle fetches rows above a low-water id and evicts rows whose system_time has
+    fallen behind the cutoff, so memory is bounded by the window size rather than by the
+    table's retention period. The low-water id is the highest id seen at least
+    window_commit_lag_seconds ago, so a row whose transaction committed after a higher id
+    was read is still picked up; rows already in the window are skipped.
+    """
+
+    def __init__(self, hours):
+        if hours <= 0:
+            raise ValueError(f"window hours must be positive, got {hours}")
+        self.span = timedelta(hours=hours)
+        self.rows = {}  # id -> encoded row (AlertBatch.codes_at), kept in id order
+        self.expiry = []  # min-heap of (epoch seconds, id)
+        self.last_id = 0  # highest id seen
+        self.safe_id = 0  # every id up to here was committed when it was last read
+        self.marks = deque()  # (monotonic time, last_id) after each fetch
+
+    def advance(self, now=None):
+        """Pull newly inserted rows, evict expired ones and return the current window."""
+        cutoff = (now or datetime.now()) - self.span
+
+        clock = time.monotonic()
+        while self.marks and clock - self.marks[0][0] >= window_commit_lag_seconds:
+            self.safe_id = self.marks.popleft()[1]
+
+        new_rows = fetch_window_rows(self.safe_id, cutoff)
+        entered = late = 0
+        for i in range(len(new_rows)):
+            codes = new_rows.codes_at(i)
+            if codes[0] in self.rows:
+                continue
+            if codes[0] < self.last_id:
+                late += 1
+            self.rows[codes[0]] = codes
+            heapq.heappush(self.expiry, (codes[7], codes[0]))
+            entered += 1
+        if new_rows:
+            self.last_id = max(self.last_id, int(new_rows.ids[-1]))
+        if late:
+            # Keep id order, which DBSCAN's border assignment and the labels written back follow
+            self.rows = dict(sorted(self.rows.items()))
+            logging.info(f"Sliding window: {late} rows committed out of id order were picked up late.")
+        self.marks.append((clock, self.last_id))
+
+        evicted = 0
+        cutoff_epoch = to_epoch(cutoff)
+        while self.expiry and self.expiry[0][0] < cutoff_epoch:
+            _, row_id = heapq.heappop(self.expiry)
+            if self.rows.pop(row_id, None) is not None:
+                evicted += 1
+
+        forgotten = self.release_values() if evicted else 0
+        logging.info(f"Sliding window: {entered} rows entered, {evicted} rows left, {len(self.rows)} in window, {forgotten} interned values released.")
+        window = AlertBatch()
+        for codes in self.rows.values():
+            window.append_codes(*codes)
+        return window
+
+    def release_values(self):
+        """Forget interned values no row in the window refers to any more, so the intern tables stay window-sized.
+
+        Dimension-keyed tables keep their ids as holes that fetch_into_batch re-adopts if a
+        later row refers to them; event ids are interned locally and their codes are reused.
+        """
+        forgotten = 0
+        for column, table in ((1, title_table), (2, tags_table), (3, computer_table), (4, user_table), (6, provider_table)):
+            forgotten += table.retain({codes[column] for codes in self.rows.values()}, reuse=False)
+        forgotten += event_table.retain({codes[5] for codes in self.rows.values()})
+        return forgotten
+
+    def record_labels(self, batch, cluster_labels):
+        """Remember the labels just written so the next cycle's profile deltas start from them."""
+        for row_id, label in zip(batch.ids, cluster_labels):
+            codes = self.rows.get(row_id)
+            if codes is not None:
+                self.rows[row_id] = codes[:8] + (int(label),) + codes[9:]
+
+def ensure_column_exists():
+    """Ensure the dbscan_cluster column exists in sigma_alerts and alert_id exists in dbscan_outlier."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW COLUMNS FROM sigma_alerts LIKE 'dbscan_cluster'")
+            result = cursor.fetchone()
+            if not result:
+                cursor.execute("ALTER TABLE sigma_alerts ADD COLUMN dbscan_cluster INT")
+                connection.commit()
+                logging.info("Added 'dbscan_cluster' column to 'sigma_alerts' table.")
+            cursor.execute("SHOW COLUMNS FROM dbscan_outlier LIKE 'alert_id'")
+            result = cursor.fetchone()
+            if not result:
+                cursor.execute("ALTER TABLE dbscan_outlier ADD COLUMN alert_id INT UNIQUE")
+                connection.commit()
+                logging.info("Added 'alert_id' column to 'dbscan_outlier' table.")
+    except db.Error as e:
+        logging.error(f"Error ensuring 'dbscan_cluster' column exists: {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def preprocess_data(data, model=None):
+    """Preprocess the data for DBSCAN, recording the fitted vectorizers on model when given."""
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    data = as_batch(data)
+    titles = data.decode("title")
+    tags = data.decode("tags")
+
+    title_vectorizer = TfidfVectorizer(stop_words="english")
+    tag_vectorizer = TfidfVectorizer(stop_words="english")
+    # A key whose dimension row is gone decodes to None; vectorize it as empty text
+    title_tfidf = title_vectorizer.fit_transform([title or "" for title in titles])
+    tag_tfidf = tag_vectorizer.fit_transform([tag or "" for tag in tags])
+    if model is not None:
+        model.title_vectorizer = title_vectorizer
+        model.tag_vectorizer = tag_vectorizer
+
+    combined_data = np.hstack((
+        title_tfidf.toarray(),
+        tag_tfidf.toarray(),
+        encode_categoricals(data, model)
+    ))
+
+    return combined_data
+
+def build_features(data, model=None):
+    """Feature matrix DBSCAN clusters: text and categorical columns, plus the rate columns when enabled."""
+    import numpy as np
+
+    data = as_batch(data)
+    if feature_projector:
+        features = feature_projector.transform(data, model)
+    else:
+        features = preprocess_data(data, model)
+    if rate_counters is None:
+        return features
+    # Rates come from the ingester's latest snapshot, so this needs no extra query
+    rate_counters.refresh()
+    if model is not None:
+        model.rate_features = True
+        model.rate_window = (rate_counters.bucket_seconds, rate_counters.window_buckets)
+    rates = rate_columns(rate_counters, data.decode("computer_name"), data.decode("user_id"),
+                         data.decode("event_id"), data.system_times)
+    return np.hstack((features, rates))
+
+def run_dbscan(data, model=None):
+    """Run DBSCAN clustering on the provided data and return the cluster labels.
+
+    When model is given, the scaler and the scaled core samples are recorded on it.
+    """
+    from sklearn.cluster import DBSCAN
+    from sklearn.preprocessing import StandardScaler
+
+    eps = dbscan_params["eps"]
+    scaler = StandardScaler()
+    data_scaled = scaler.fit_transform(data)
+    db = DBSCAN(eps=eps, min_samples=dbscan_params["min_samples"]).fit(data_scaled)
+    if model is not None:
+        model.scaler = scaler
+        core = db.core_sample_indices_
+        model.set_core_samples(data_scaled[core], db.labels_[core], eps)
+    return db.labels_
+
+def sync_outliers(cursor, ids, cluster_labels):
+    """Bring dbscan_outlier in line with the new labels for ids, touching only rows whose noise status changed.
+
+    Rows that were not part of this run (for example outside the sliding window) keep their entry.
+    Returns the number of rows inserted and deleted.
+    """
+    cursor.execute("SELECT alert_id FROM dbscan_outlier")
+    current = {row[0] for row in cursor.fetchall()}
+    noise = {row_id for row_id, label in zip(ids, cluster_labels) if label == -1}
+    to_insert = sorted(noise - current)
+    to_delete = sorted((current & set(ids)) - noise)
+
+    for offset in range(0, len(to_delete), outlier_chunk_size):
+        chunk = to_delete[offset:offset + outlier_chunk_size]
+        cursor.execute(f"DELETE FROM dbscan_outlier WHERE alert_id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+    for offset in range(0, len(to_insert), outlier_chunk_size):
+        chunk = to_insert[offset:offset + outlier_chunk_size]
+        cursor.execute(f"""
+        INSERT INTO dbscan_outlier
+            (alert_id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, dbscan_cluster)
+        SELECT id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, -1
+        FROM sigma_alerts_flat
+        WHERE id IN ({', '.join(['%s'] * len(chunk))})
+        """, chunk)
+
+    return len(to_insert), len(to_delete)
+
+def label_profile_deltas(data, cluster_labels):
+    """Build cluster_profile deltas for the rows whose label changed in this run."""
+    deltas = ProfileDeltas()
+    for i, label in enumerate(cluster_labels):
+        previous, label = data.clusters[i], int(label)
+        if previous == label:
+            continue
+        if previous != missing_cluster:
+            deltas[previous].remove()
+        deltas[label].add(from_epoch(data.system_times[i]), data.computer_codes[i] or None,
+                          data.user_codes[i] or None, data.signatures[i])
+    return deltas
+
+def update_cluster_labels(data, cluster_labels):
+    """Update the sigma_alerts table with the cluster labels, maintaining dbscan_outlier and cluster_profile in the same transaction."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            update_query = """
+            UPDATE sigma_alerts
+            SET dbscan_cluster = %s
+            WHERE id = %s
+            """
+            update_data = [(int(label), row_id) for row_id, label in zip(data.ids, cluster_labels)]
+            cursor.executemany(update_query, update_data)
+            inserted, deleted = sync_outliers(cursor, list(data.ids), cluster_labels)
+            profiles = apply_profile_deltas(cursor, label_profile_deltas(data, cluster_labels))
+            connection.commit()
+            logging.info(f"Updated {len(update_data)} records with cluster labels.")
+            logging.info(f"dbscan_outlier: {inserted} new outliers, {deleted} no longer outliers.")
+            logging.info(f"cluster_profile: applied deltas to {profiles} clusters.")
+        return True
+    except db.Error as e:
+        logging.error(f"Error updating cluster labels: {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def detect_anomalies():
+    """Fetch data, run DBSCAN, and update the database with cluster labels."""
+    ensure_column_exists()
+
+    data = sliding_window.advance() if sliding_window else fetch_data()
+    if not data:
+        logging.warning("No data found in the database.")
+        return
+
+    core_index = CoreSampleIndex()
+    preprocessed_data = build_features(data, core_index)
+    start_time = datetime.now()
+    cluster_labels = run_dbscan(preprocessed_data, core_index)
+    end_time = datetime.now()
+    duration = end_time - start_time
+    logging.info(f"DBSCAN clustering completed in {duration.total_seconds()} seconds.")
+
+    if update_cluster_labels(data, cluster_labels) and sliding_window:
+        sliding_window.record_labels(data, cluster_labels)
+
+    # Publish the run's core samples; ingest hot-reloads the file for real-time scoring
+    try:
+        core_index.save(core_index_path)
+    except OSError as e:
+        logging.error(f"Error saving core-sample index: {e}")
+
+def configure():
+    """Create the sliding window, feature projector and rate counters the environment asks for."""
+    global sliding_window, feature_projector, rate_counters
+    sliding_window = SlidingWindow(cluster_window_hours) if cluster_window_hours > 0 else None
+    feature_projector = FeatureProjector(projection_components) if projection_components > 0 else None
+    rate_counters = RateCounters() if rate_features_enabled else None
+
+def main():
+    """Cluster immediately, then every 5 minutes."""
+    global detect_anomalies
+    configure_logging()
+    configure()
+    dbscan_params.update(load_dbscan_params(dbscan_config_path))
+    # Profile sampled clustering cycles when PIPELINE_PROFILE=1 or --profile is given
+    configure_from_args(sys.argv)
+    detect_anomalies = maybe_profile("dbscan", detect_anomalies)
+
+    # Run the script immediately with existing data
+    detect_anomalies()
+
+    # Schedule anomaly detection every 5 minutes
+    schedule.every(5).minutes.do(detect_anomalies)
+
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
+
+if __name__ == "__main__":
+    main()
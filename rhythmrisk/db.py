@@ -0,0 +1,21 @@
+import os
+
+# Database configuration (Using environment variables for security)
+db_config = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER", "sigma"),
+    "password": os.getenv("DB_PASSWORD", "sigma"),
+    "database": os.getenv("DB_NAME", "sigma_db"),
+}
+
+def connect(**options):
+    """Open a connection with db_config, importing mysql-connector on first use."""
+    import mysql.connector
+    return mysql.connector.connect(**db_config, **options)
+
+def __getattr__(name):
+    # db.Error is resolved lazily, so "except db.Error" only imports mysql-connector when something is raised
+    if name == "Error":
+        from mysql.connector import Error
+        return Error
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
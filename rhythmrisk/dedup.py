@@ -0,0 +1,137 @@
+import os
+import time
+import logging
+from array import array
+from bisect import bisect_left
+from collections import deque
+from .records import to_epoch
+
+logger = logging.getLogger()
+
+# Dedup configuration
+dedup_state_path = os.getenv("DEDUP_STATE_PATH", "seen_lines.bin")
+dedup_window_hours = int(os.getenv("DEDUP_WINDOW_HOURS", "48"))
+dedup_max_entries = int(os.getenv("DEDUP_MAX_ENTRIES", "2000000"))
+# Entries per sorted block; expiry drops whole blocks, so this is also its granularity
+dedup_block_entries = int(os.getenv("DEDUP_BLOCK_ENTRIES", "65536"))
+# Minimum seconds between state snapshots; the unique key covers anything lost in between
+dedup_save_seconds = int(os.getenv("DEDUP_SAVE_SECONDS", "30"))
+
+class SeenLines:
+    """Exact set of recently inserted line hashes, bounded by count and by event time.
+
+    New hashes go into a small dict; every block_entries of them are sealed into a block of
+    two parallel arrays sorted by hash, 16 bytes an entry where a dict entry costs about ten
+    times that, and looked up by bisection. Blocks are kept in insertion order, which follows
+    SystemTime closely, so expiry drops whole blocks from the front: once a block's newest
+    hash is more than window_hours older than the newest line seen, or while the set exceeds
+    max_entries. Anything forgotten too early is still caught by the unique key on
+    sigma_alerts (line_hash, system_time).
+    """
+
+    def __init__(self, path=dedup_state_path, window_hours=dedup_window_hours, max_entries=dedup_max_entries,
+                 block_entries=dedup_block_entries):
+        self.path = path
+        self.window = window_hours * 3600
+        self.max_entries = max_entries
+        # Small sets get small blocks so the size bound stays reasonably tight
+        self.block_entries = max(1, min(block_entries, max_entries // 16))
+        self.blocks = deque()  # (hashes sorted, epochs in the same order, newest epoch), oldest first
+        self.sealed = 0
+        self.tail = {}
+        self.newest = 0
+        self.saved_at = 0.0
+        self.dirty = False
+
+    def __len__(self):
+        return self.sealed + len(self.tail)
+
+    def __contains__(self, record):
+        line_hash = record.line_hash
+        if line_hash is None:
+            return False
+        if line_hash in self.tail:
+            return True
+        for hashes, _, _ in self.blocks:
+            i = bisect_left(hashes, line_hash)
+            if i < len(hashes) and hashes[i] == line_hash:
+                return True
+        return False
+
+    def add(self, record):
+        if record.line_hash is None:
+            return
+        epoch = to_epoch(record.system_time)
+        self.tail[record.line_hash] = epoch
+        self.newest = max(self.newest, epoch)
+        self.dirty = True
+        if len(self.tail) >= self.block_entries:
+            self.seal()
+
+    def seal(self):
+        """Move the dict of new hashes into a sorted block."""
+        if not self.tail:
+            return
+        order = sorted(self.tail)
+        epochs = array("q", (self.tail[line_hash] for line_hash in order))
+        self.blocks.append((array("Q", order), epochs, max(epochs)))
+        self.sealed += len(order)
+        self.tail = {}
+
+    def expire(self):
+        """Forget the oldest blocks once they fall out of the window or beyond the size bound."""
+        cutoff = self.newest - self.window
+        while self.blocks and (self.blocks[0][2] < cutoff or len(self) > self.max_entries):
+            self.sealed -= len(self.blocks.popleft()[0])
+
+    def ordered(self):
+        """(hashes, epochs) of every entry, oldest block first."""
+        hashes, epochs = array("Q"), array("q")
+        for block_hashes, block_epochs, _ in self.blocks:
+            hashes.extend(block_hashes)
+            epochs.extend(block_epochs)
+        hashes.extend(self.tail.keys())
+        epochs.extend(self.tail.values())
+        return hashes, epochs
+
+    def load(self):
+        """Restore the set saved by a previous run, if any."""
+        if not os.path.exists(self.path):
+            return self
+        hashes, epochs = array("Q"), array("q")
+        try:
+            with open(self.path, "rb") as file:
+                count = int.from_bytes(file.read(8), "little")
+                hashes.fromfile(file, count)
+                epochs.fromfile(file, count)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error(f"Ignoring unreadable dedup state {self.path}: {e}")
+            return self
+        self.blocks, self.sealed, self.tail = deque(), 0, {}
+        for offset in range(0, len(hashes), self.block_entries):
+            self.tail = dict(zip(hashes[offset:offset + self.block_entries], epochs[offset:offset + self.block_entries]))
+            if len(self.tail) >= self.block_entries:
+                self.seal()
+        self.newest = max(epochs, default=0)
+        self.expire()
+        logger.info(f"Loaded {len(self)} recent line hashes from {self.path}.")
+        return self
+
+    def save(self, force=False):
+        """Write the set atomically, at most every dedup_save_seconds unless forced."""
+        if not self.dirty or (not force and time.monotonic() - self.saved_at < dedup_save_seconds):
+            return
+        self.expire()
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                hashes, epochs = self.ordered()
+                file.write(len(hashes).to_bytes(8, "little"))
+                hashes.tofile(file)
+                epochs.tofile(file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving dedup state {self.path}: {e}")
+            return
+        self.saved_at = time.monotonic()
+        self.dirty = False
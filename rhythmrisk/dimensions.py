@@ -0,0 +1,346 @@
+import os
+import logging
+import time
+from .records import (
+    signature_id, value_hash, title_table, tags_table, computer_table, user_table, provider_table
+)
+
+logger = logging.getLogger()
+
+# Flat sigma_alerts column -> (dimension table, foreign key column)
+dimensions = {
+    "title": ("dim_title", "title_key"),
+    "tags": ("dim_tags", "tags_key"),
+    "description": ("dim_description", "description_key"),
+    "computer_name": ("dim_computer", "computer_key"),
+    "user_id": ("dim_user", "user_key"),
+    "provider_name": ("dim_provider", "provider_key"),
+}
+
+# Dimension tables whose ids the clustering stage reuses directly as intern-table codes
+intern_tables = {
+    "dim_title": title_table,
+    "dim_tags": tags_table,
+    "dim_computer": computer_table,
+    "dim_user": user_table,
+    "dim_provider": provider_table,
+}
+
+# AlertBatch column holding each intern table's codes
+intern_columns = {
+    "dim_title": "title_codes",
+    "dim_tags": "tags_codes",
+    "dim_computer": "computer_codes",
+    "dim_user": "user_codes",
+    "dim_provider": "provider_codes",
+}
+
+# Rows per UPDATE statement when migrating a flat table
+migration_chunk_size = 50000
+
+# Rows re-hashed in Python before a migration drops the flat columns, plus as many non-ASCII ones
+migration_sample_size = 5000
+
+# Ids per statement when adopting dimension rows into the intern tables
+refresh_chunk_size = 1000
+
+# Seconds a process keeps a resolved dimension id before resolving it again; retention only
+# deletes values unreferenced for longer than this, so no cache can still hand one out
+dimension_cache_seconds = int(os.getenv("DIMENSION_CACHE_SECONDS", "3600"))
+
+def sql_value_hash(expression):
+    """SQL expression matching records.value_hash.
+
+    SHA1 hashes the bytes of its argument's charset, and value_hash hashes UTF-8, so the
+    value is converted first; a latin1 column would otherwise hash differently.
+    """
+    return f"CAST(CONV(LEFT(SHA1(CONVERT({expression} USING utf8mb4)), 16), 16, 10) AS UNSIGNED)"
+
+def sql_signature_id(alias=""):
+    """SQL expression matching records.signature_id over the flat columns."""
+    columns = ", ".join(
+        f"IFNULL(CONVERT({alias}{column} USING utf8mb4), '')" for column in ("title", "tags", "computer_name", "user_id", "event_id")
+    )
+    return f"CAST(CONV(LEFT(SHA1(CONCAT_WS(CHAR(31 USING utf8mb4), {columns})), 16), 16, 10) AS UNSIGNED)"
+
+def create_dimension_tables(cursor):
+    """Create the dimension tables: one row per distinct value, keyed by a 64-bit content hash."""
+    for table, _ in dimensions.values():
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            value_hash BIGINT UNSIGNED NOT NULL,
+            value TEXT NOT NULL,
+            orphaned_at DATETIME NULL,
+            UNIQUE KEY uq_{table}_hash (value_hash)
+        );
+        """)
+
+def ensure_orphan_column(cursor):
+    """Add orphaned_at, which retention uses to age out unreferenced values, to older dimension tables."""
+    for table, _ in dimensions.values():
+        cursor.execute(f"SHOW COLUMNS FROM {table} LIKE 'orphaned_at'")
+        if not cursor.fetchone():
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN orphaned_at DATETIME NULL")
+            logger.info(f"Added 'orphaned_at' column to '{table}'.")
+
+def create_alerts_table(cursor):
+    """Create the normalized sigma_alerts table."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sigma_alerts (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        title_key INT,
+        tags_key INT,
+        description_key INT,
+        system_time DATETIME,
+        computer_key INT,
+        user_key INT,
+        event_id VARCHAR(50),
+        provider_key INT,
+        signature_id BIGINT UNSIGNED,
+        dbscan_cluster INT,
+        line_hash BIGINT UNSIGNED,
+        KEY idx_sigma_alerts_signature (signature_id),
+        UNIQUE KEY uq_sigma_alerts_line (line_hash, system_time)
+    );
+    """)
+
+def ensure_line_hash_key(cursor):
+    """Add line_hash and its unique key to a sigma_alerts created before line dedup.
+
+    The key includes system_time so it stays valid if the table is range partitioned.
+    Rows loaded before the column existed keep a NULL hash, which the key ignores.
+    """
+    cursor.execute("SHOW COLUMNS FROM sigma_alerts LIKE 'line_hash'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE sigma_alerts ADD COLUMN line_hash BIGINT UNSIGNED, ADD UNIQUE KEY uq_sigma_alerts_line (line_hash, system_time)")
+        logger.info("Added 'line_hash' column and unique key to 'sigma_alerts'.")
+
+def create_flat_view(cursor):
+    """Create sigma_alerts_flat, which presents the normalized table with the original flat columns."""
+    joins = "\n".join(
+        f"    LEFT JOIN {table} ON {table}.id = a.{key}" for table, key in dimensions.values()
+    )
+    cursor.execute(f"""
+    CREATE OR REPLACE VIEW sigma_alerts_flat AS
+    SELECT a.id,
+           dim_title.value AS title,
+           dim_tags.value AS tags,
+           dim_description.value AS description,
+           a.system_time,
+           dim_computer.value AS computer_name,
+           dim_user.value AS user_id,
+           a.event_id,
+           dim_provider.value AS provider_name,
+           a.dbscan_cluster,
+           a.signature_id
+    FROM sigma_alerts a
+{joins}
+    """)
+
+def is_flat_layout(cursor):
+    cursor.execute("SHOW COLUMNS FROM sigma_alerts LIKE 'title'")
+    return cursor.fetchone() is not None
+
+def migrate_flat_alerts(connection):
+    """Convert an existing flat sigma_alerts table to the normalized layout in place.
+
+    Distinct values are copied into the dimension tables, the foreign keys and signature_id
+    are filled in id-range chunks so no single statement locks the whole table, and the
+    flat string columns are dropped only once every row has its keys and a sample of rows
+    re-hashes identically in Python (verify_migration).
+    """
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        for column, (table, key) in dimensions.items():
+            cursor.execute(f"SHOW COLUMNS FROM sigma_alerts LIKE '{key}'")
+            if not cursor.fetchone():
+                cursor.execute(f"ALTER TABLE sigma_alerts ADD COLUMN {key} INT")
+        cursor.execute("SHOW COLUMNS FROM sigma_alerts LIKE 'signature_id'")
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE sigma_alerts ADD COLUMN signature_id BIGINT UNSIGNED, ADD KEY idx_sigma_alerts_signature (signature_id)")
+        connection.commit()
+
+        for column, (table, _) in dimensions.items():
+            cursor.execute(f"""
+            INSERT IGNORE INTO {table} (value_hash, value)
+            SELECT DISTINCT {sql_value_hash(column)}, {column}
+            FROM sigma_alerts
+            WHERE {column} IS NOT NULL
+            """)
+            connection.commit()
+
+        joins = "\n".join(
+            f"LEFT JOIN {table} ON {table}.value_hash = {sql_value_hash('a.' + column)}"
+            for column, (table, _) in dimensions.items()
+        )
+        assignments = ", ".join(f"a.{key} = {table}.id" for table, key in dimensions.values())
+        update_query = f"""
+        UPDATE sigma_alerts a
+        {joins}
+        SET {assignments}, a.signature_id = {sql_signature_id('a.')}
+        WHERE a.id > %s AND a.id <= %s
+        """
+
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sigma_alerts")
+        max_id = cursor.fetchone()[0]
+        for low in range(0, max_id, migration_chunk_size):
+            cursor.execute(update_query, (low, low + migration_chunk_size))
+            connection.commit()
+
+        problems = verify_migration(cursor)
+        if problems:
+            for problem in problems[:20]:
+                logger.error(f"Migration check: {problem}")
+            # The flat columns are kept, so nothing is lost and the migration can be rerun once fixed
+            raise RuntimeError(f"sigma_alerts migration left {len(problems)} rows whose keys do not match their values; flat columns kept.")
+
+        drops = ", ".join(f"DROP COLUMN {column}" for column in dimensions)
+        cursor.execute(f"ALTER TABLE sigma_alerts {drops}")
+        connection.commit()
+    logger.info(f"Migrated {max_id} sigma_alerts rows to dimension tables in {time.perf_counter() - start:.1f} seconds.")
+
+def verify_migration(cursor, sample_size=None):
+    """Re-hash a sample of migrated rows in Python and return a description of every mismatch.
+
+    Checks that no row lost a key and that the SQL hashes agree with records.value_hash and
+    records.signature_id, sampling rows with non-ASCII values first since that is where a
+    column charset would make them differ.
+    """
+    sample_size = sample_size or migration_sample_size
+    problems = []
+    lost = " OR ".join(f"({column} IS NOT NULL AND {key} IS NULL)" for column, (_, key) in dimensions.items())
+    cursor.execute(f"SELECT COUNT(*) FROM sigma_alerts WHERE {lost}")
+    missing = cursor.fetchone()[0]
+    if missing:
+        problems.append(f"{missing} rows have a value but no dimension key")
+
+    columns = list(dimensions)
+    selected = ", ".join(f"a.{column}, {table}.value_hash" for column, (table, _) in dimensions.items())
+    joins = " ".join(f"LEFT JOIN {table} ON {table}.id = a.{key}" for table, key in dimensions.values())
+    # HEX() works on the stored bytes, so this finds non-ASCII values in any charset
+    non_ascii = " OR ".join(f"NOT (HEX(a.{column}) REGEXP '^([0-7][0-9A-F])*$')" for column in columns)
+    rows = []
+    for condition in (non_ascii, "1 = 1"):
+        cursor.execute(f"SELECT a.id, {selected}, a.event_id, a.signature_id FROM sigma_alerts a {joins} WHERE {condition} LIMIT %s", (sample_size,))
+        rows.extend(cursor.fetchall())
+
+    for row in rows:
+        values = dict(zip(columns, row[1:1 + 2 * len(columns):2]))
+        hashes = dict(zip(columns, row[2:2 + 2 * len(columns):2]))
+        event_id, stored_signature = row[-2], row[-1]
+        for column, value in values.items():
+            if value is not None and hashes[column] != value_hash(str(value)):
+                problems.append(f"row {row[0]}: {column} {value!r} hashes to {value_hash(str(value))}, dimension key has {hashes[column]}")
+        expected = signature_id(values["title"], values["tags"], values["computer_name"], values["user_id"], event_id)
+        if stored_signature != expected:
+            problems.append(f"row {row[0]}: signature_id {stored_signature} != {expected}")
+    return problems
+
+def ensure_dimension_layout(connection):
+    """Create or migrate to the normalized layout and refresh the flat compatibility view."""
+    with connection.cursor() as cursor:
+        create_dimension_tables(cursor)
+        create_alerts_table(cursor)
+        flat = is_flat_layout(cursor)
+    if flat:
+        logger.info("Migrating flat 'sigma_alerts' table to dimension tables.")
+        migrate_flat_alerts(connection)
+    with connection.cursor() as cursor:
+        ensure_line_hash_key(cursor)
+        ensure_orphan_column(cursor)
+        create_flat_view(cursor)
+    connection.commit()
+
+class DimensionCache:
+    """Process-local value -> id cache for one dimension table, filled in bulk on misses.
+
+    The cache is emptied every dimension_cache_seconds, and resolving a value clears its
+    orphaned_at mark, so retention never deletes an id a process may still write.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.ids = {}
+        self.filled_at = time.monotonic()
+
+    def resolve(self, cursor, values):
+        """Make sure every non-None value has an id, inserting new values in one batch."""
+        if time.monotonic() - self.filled_at >= dimension_cache_seconds:
+            self.ids = {}
+            self.filled_at = time.monotonic()
+        missing = {value_hash(value): value for value in values if value is not None and value not in self.ids}
+        if not missing:
+            return
+        cursor.executemany(
+            f"INSERT INTO {self.table} (value_hash, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE orphaned_at = NULL",
+            list(missing.items())
+        )
+        hashes = list(missing)
+        for offset in range(0, len(hashes), 1000):
+            chunk = hashes[offset:offset + 1000]
+            cursor.execute(
+                f"SELECT id, value_hash FROM {self.table} WHERE value_hash IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+            for dim_id, hash_value in cursor.fetchall():
+                self.ids[missing[hash_value]] = dim_id
+
+    def key(self, value):
+        return None if value is None else self.ids.get(value)
+
+# One cache per dimension, shared by everything that writes sigma_alerts in this process
+dimension_caches = {column: DimensionCache(table) for column, (table, _) in dimensions.items()}
+
+# Normalized sigma_alerts columns written at ingest, in normalize_records order
+normalized_columns = ["title_key", "tags_key", "description_key", "system_time", "computer_key",
+                      "user_key", "event_id", "provider_key", "signature_id", "line_hash"]
+
+def normalize_records(connection, records):
+    """Resolve dimension keys for records in sigma_alerts insert order and return normalized rows.
+
+    New dimension values are committed straight away, so the cached ids stay valid even if
+    the caller's alert insert is rolled back; retention only removes values no process has
+    resolved for longer than the caches live.
+    """
+    hashes = [getattr(record, "line_hash", None) for record in records]
+    records = [tuple(record) for record in records]
+    with connection.cursor() as cursor:
+        for index, column in ((0, "title"), (1, "tags"), (2, "description"), (4, "computer_name"),
+                              (5, "user_id"), (7, "provider_name")):
+            dimension_caches[column].resolve(cursor, {record[index] for record in records})
+    connection.commit()
+
+    title, tags, description = dimension_caches["title"], dimension_caches["tags"], dimension_caches["description"]
+    computer, user, provider = dimension_caches["computer_name"], dimension_caches["user_id"], dimension_caches["provider_name"]
+    return [
+        (title.key(record[0]), tags.key(record[1]), description.key(record[2]), record[3],
+         computer.key(record[4]), user.key(record[5]), record[6], provider.key(record[7]),
+         signature_id(record[0], record[1], record[4], record[5], record[6]), hashes[i])
+        for i, record in enumerate(records)
+    ]
+
+def refresh_intern_tables(cursor, batch):
+    """Adopt the dimension rows batch refers to that the shared intern tables do not hold yet.
+
+    Ids are fetched by exact id rather than by range: concurrent writers commit ids out of
+    order, INSERT IGNORE skips auto-increment values and released values leave holes, so no
+    high-water mark covers every id a batch can reference. Returns how many ids were adopted.
+    """
+    adopted = 0
+    for table, intern_table in intern_tables.items():
+        values = intern_table.values
+        wanted = sorted({
+            code for code in getattr(batch, intern_columns[table])
+            if code and (code >= len(values) or values[code] is None)
+        })
+        for offset in range(0, len(wanted), refresh_chunk_size):
+            chunk = wanted[offset:offset + refresh_chunk_size]
+            cursor.execute(f"SELECT id, value FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+            for dim_id, value in cursor.fetchall():
+                intern_table.adopt(dim_id, value)
+                adopted += 1
+        missing = [code for code in wanted if code >= len(intern_table.values) or intern_table.values[code] is None]
+        if missing:
+            logger.warning(f"{len(missing)} {table} ids referenced by sigma_alerts do not exist (first: {missing[0]}); those rows decode to None.")
+    return adopted
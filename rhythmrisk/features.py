@@ -0,0 +1,240 @@
+import os
+import bisect
+import logging
+import pickle
+import tempfile
+from . import load_pickle
+from .records import as_batch, computer_table, event_table, provider_table, to_epoch, user_table
+
+logger = logging.getLogger()
+
+# numpy, scipy and scikit-learn are imported inside the functions that need them, so
+# ingest can import CoreIndexLoader without paying for them until an index is loaded
+
+def category_key(value):
+    """Sort key LabelEncoder order is reproduced with; None sorts first."""
+    return (value is not None, value or "")
+
+def encode_codes(codes, table, categories=None):
+    """Label-encode an intern-code column, ranking only its distinct values like LabelEncoder would.
+
+    When categories is a list, the sorted distinct keys are appended to it so a single new
+    value can later be placed in the same ranking.
+    """
+    import numpy as np
+
+    unique_codes, inverse = np.unique(np.frombuffer(codes, dtype=np.int32), return_inverse=True)
+    values = [table.values[code] for code in unique_codes]
+    order = sorted(range(len(values)), key=lambda i: category_key(values[i]))
+    ranks = np.empty(len(unique_codes), dtype=np.int64)
+    ranks[order] = np.arange(len(unique_codes))
+    if categories is not None:
+        categories.append([category_key(values[i]) for i in order])
+    return ranks[inverse]
+
+def encode_categoricals(data, model=None):
+    """Label-encode computer_name, user_id, event_id and provider_name into four numeric columns.
+
+    When model is given, the category orders are recorded on it for scoring new alerts.
+    """
+    import numpy as np
+
+    batch = as_batch(data)
+    categories = [] if model is not None else None
+    computer_name_encoded = encode_codes(batch.computer_codes, computer_table, categories)
+    user_id_encoded = encode_codes(batch.user_codes, user_table, categories)
+    event_id_encoded = encode_codes(batch.event_codes, event_table, categories)
+    provider_name_encoded = encode_codes(batch.provider_codes, provider_table, categories)
+    if model is not None:
+        model.categories = categories
+
+    return np.column_stack((
+        computer_name_encoded,
+        user_id_encoded,
+        event_id_encoded,
+        provider_name_encoded
+    ))
+
+def rate_columns(counters, computer_names, user_ids, event_ids, epochs):
+    """log1p of the trailing-window alert counts per host, user and (user, event_id) at each row's time.
+
+    counters may be None (no snapshot yet), which yields zero columns of the same width.
+    """
+    import numpy as np
+
+    if counters is None:
+        return np.zeros((len(epochs), 3))
+    return np.log1p(np.asarray(counters.rates(computer_names, user_ids, event_ids, epochs), dtype=np.float64).reshape(-1, 3))
+
+# Rank given to a category the run never saw; the fitted ranks are 0..n-1, so it matches none of them
+unseen_category_rank = -1
+
+def category_rank(keys, value):
+    """Rank of value among the sorted category keys of a run, or unseen_category_rank."""
+    key = category_key(value)
+    rank = bisect.bisect_left(keys, key)
+    return rank if rank < len(keys) and keys[rank] == key else unseen_category_rank
+
+class FeatureProjector:
+    """Project the sparse title/tags TF-IDF block onto a fixed number of SVD components.
+
+    The vectorizers and the TruncatedSVD are fit on the first batch and reused by later
+    cycles, so the projected space stays stable and the text matrix is never densified.
+    The four categorical columns are appended unprojected.
+    """
+
+    def __init__(self, n_components):
+        self.n_components = n_components
+        self.title_vectorizer = None
+        self.tag_vectorizer = None
+        self.svd = None
+
+    @property
+    def fitted(self):
+        return self.svd is not None
+
+    def text_matrix(self, titles, tags):
+        from scipy import sparse
+        return sparse.hstack((
+            self.title_vectorizer.transform([title or "" for title in titles]),
+            self.tag_vectorizer.transform([tag or "" for tag in tags])
+        )).tocsr()
+
+    def fit(self, data):
+        """Fit the vectorizers and the projection on a batch of rows."""
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        data = as_batch(data)
+        titles, tags = data.decode("title"), data.decode("tags")
+        self.title_vectorizer = TfidfVectorizer(stop_words="english").fit([title or "" for title in titles])
+        self.tag_vectorizer = TfidfVectorizer(stop_words="english").fit([tag or "" for tag in tags])
+        text_matrix = self.text_matrix(titles, tags)
+        # TruncatedSVD needs strictly fewer components than input features
+        n_components = max(1, min(self.n_components, text_matrix.shape[1] - 1))
+        self.svd = TruncatedSVD(n_components=n_components, random_state=0).fit(text_matrix)
+        logger.info(
+            f"Fitted projection from {text_matrix.shape[1]} text features to {n_components} components "
+            f"({self.svd.explained_variance_ratio_.sum():.1%} variance retained)."
+        )
+        return self
+
+    def transform(self, data, model=None):
+        """Project a batch of rows, fitting on it first if nothing has been fit yet."""
+        import numpy as np
+
+        data = as_batch(data)
+        if not self.fitted:
+            self.fit(data)
+        if model is not None:
+            model.projector = self
+        return np.hstack((
+            self.svd.transform(self.text_matrix(data.decode("title"), data.decode("tags"))),
+            encode_categoricals(data, model)
+        ))
+
+class CoreSampleIndex:
+    """Everything one DBSCAN run fitted, enough to place a single new alert in its feature space.
+
+    preprocess_data, encode_categoricals and run_dbscan fill in the vectorizers (or projector),
+    the category orders, whether rate columns were appended, the scaler and the core samples. score() then labels an alert the
+    way DBSCAN labels a border point: within eps of a core sample means that sample's
+    cluster, otherwise provisional noise (-1).
+    """
+
+    def __init__(self):
+        self.title_vectorizer = None
+        self.tag_vectorizer = None
+        self.projector = None
+        self.categories = None
+        self.rate_features = False
+        self.rate_window = None
+        self.scaler = None
+        self.eps = None
+        self.core_labels = None
+        self.neighbors = None
+
+    def set_core_samples(self, core_points, core_labels, eps):
+        import numpy as np
+        from sklearn.neighbors import NearestNeighbors
+
+        self.eps = eps
+        self.core_labels = np.asarray(core_labels)
+        if len(core_points):
+            self.neighbors = NearestNeighbors(n_neighbors=1).fit(core_points)
+
+    def transform(self, records, rate_counters=None):
+        """Feature rows for records in sigma_alerts insert order (title, tags, description, system_time, computer_name, user_id, event_id, provider_name)."""
+        import numpy as np
+
+        records = [tuple(record) for record in records]
+        titles = [record[0] for record in records]
+        tags = [record[1] for record in records]
+        if self.projector is not None:
+            text = self.projector.svd.transform(self.projector.text_matrix(titles, tags))
+        else:
+            text = np.hstack((
+                self.title_vectorizer.transform([title or "" for title in titles]).toarray(),
+                self.tag_vectorizer.transform([tag or "" for tag in tags]).toarray()
+            ))
+        ranks = [
+            [category_rank(keys, record[index]) for keys, index in zip(self.categories, (4, 5, 6, 7))]
+            for record in records
+        ]
+        columns = [text, np.asarray(ranks, dtype=np.float64)]
+        if getattr(self, "rate_features", False):
+            columns.append(rate_columns(
+                rate_counters, [record[4] for record in records], [record[5] for record in records],
+                [record[6] for record in records], [to_epoch(record[3]) for record in records]
+            ))
+        return self.scaler.transform(np.hstack(columns))
+
+    def rate_mismatch(self, rate_counters):
+        """Why rate_counters cannot reproduce the rate columns this index was fitted on, or None if they can."""
+        if not getattr(self, "rate_features", False):
+            return None
+        if rate_counters is None:
+            return "it was fitted with rate columns but rate counters are disabled (RATE_FEATURES=0)"
+        window = getattr(self, "rate_window", None)
+        counters_window = (rate_counters.bucket_seconds, rate_counters.window_buckets)
+        if window is not None and tuple(window) != counters_window:
+            return f"it was fitted on {window[1]} buckets of {window[0]}s but the counters sum {counters_window[1]} of {counters_window[0]}s"
+        return None
+
+    def score(self, records, rate_counters=None):
+        """Cluster label for each record: the nearest core sample's label if within eps, else -1."""
+        if self.neighbors is None:
+            return [-1] * len(records)
+        distances, indices = self.neighbors.kneighbors(self.transform(records, rate_counters))
+        return [int(self.core_labels[i[0]]) if d[0] <= self.eps else -1 for d, i in zip(distances, indices)]
+
+    def save(self, path):
+        """Persist atomically so a reader never sees a half-written index."""
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+            temp_path = file.name
+        os.replace(temp_path, path)
+        logger.info(f"Saved core-sample index with {len(self.core_labels)} core samples to {path}.")
+
+class CoreIndexLoader:
+    """Load the persisted CoreSampleIndex and reload it whenever the file is replaced."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.index = None
+
+    def current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self.index
+        if mtime != self.mtime:
+            try:
+                self.index = load_pickle(self.path)
+                self.mtime = mtime
+                logger.info(f"Loaded core-sample index from {self.path}.")
+            except Exception as e:
+                logger.error(f"Error loading core-sample index {self.path}: {e}")
+        return self.index
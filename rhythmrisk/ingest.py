@@ -0,0 +1,666 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from datetime import datetime
+from . import configure_logging, db, state_path
+from .records import AlertRecord, compact_intern_tables, intern_scope, line_hash
+from .dimensions import normalize_records, normalized_columns
+from .schema import initialize_sql_tables, ensure_column_exists
+from .cluster_profile import ProfileDeltas, apply_profile_deltas
+from .features import CoreIndexLoader
+from .profiling import configure_from_args, maybe_profile
+from .retention import schedule_retention
+from .dedup import SeenLines, dedup_state_path
+from .rates import RateCounters, rate_features_enabled, rate_snapshot_path
+from .spool import Spool, spool_dir, spool_enabled
+
+logger = logging.getLogger()
+
+# Folder path for logs
+log_folder = os.getenv("LOG_FOLDER_PATH", "/var/log/logstash/detected_zircolite/")
+
+# Bookmark file to track the last processed log time
+bookmark_file = "bookmark.txt"
+
+# Opt-in real-time scoring against the core samples the clustering stage publishes after every run
+realtime_scoring = os.getenv("REALTIME_SCORING", "0") == "1"
+core_index_path = state_path(os.getenv("CORE_INDEX_PATH", "core_index.pkl"))
+
+# Local state, built by configure() when an entry point starts rather than at import
+core_index_loader = None
+# The last index whose rate columns the live counters could not reproduce, so it is reported once
+unscorable_index = None
+# Hashes of recently inserted log lines, so re-read lines are dropped before touching the database
+seen_lines = None
+# Per-host/user/(user, event_id) alert rates, snapshotted for the clustering stage's rate features
+rate_counters = None
+# Parsed records are appended here and replayed to MySQL by drain_spool, so a slow or down
+# database delays inserts instead of stalling or losing them
+spool = None
+# Records per replayed transaction
+spool_batch_size = int(os.getenv("SPOOL_BATCH_SIZE", "5000"))
+# Seconds the drainer waits when the spool is empty, and the ceiling of its retry backoff
+spool_poll_seconds = float(os.getenv("SPOOL_POLL_SECONDS", "1"))
+spool_max_backoff_seconds = float(os.getenv("SPOOL_MAX_BACKOFF_SECONDS", "60"))
+# Seconds between spool depth/lag log lines while the spool is not empty
+spool_metrics_seconds = float(os.getenv("SPOOL_METRICS_SECONDS", "60"))
+
+def worker_state_path(path, worker_id):
+    """Per-worker copy of a local state file or directory (the path itself without a worker id)."""
+    return path if worker_id is None else f"{path}.{worker_id}"
+
+# Build the ingester's local state
+def configure(worker_id=None):
+    """Create the core-index loader, dedup set, rate counters and spool, loading saved state.
+
+    Lease-coordinated workers pass their id so every state file and the spool directory are
+    their own and processes never overwrite each other's.
+    """
+    global core_index_loader, seen_lines, rate_counters, spool
+    core_index_loader = CoreIndexLoader(core_index_path)
+    seen_lines = SeenLines(worker_state_path(dedup_state_path, worker_id)).load()
+    rate_counters = RateCounters(worker_state_path(rate_snapshot_path, worker_id)).load() if rate_features_enabled else None
+    spool = Spool(worker_state_path(spool_dir, worker_id)) if spool_enabled else None
+
+# Read the last processed timestamp from the bookmark file
+def read_last_processed_time():
+    """Read the last processed timestamp from the bookmark file."""
+    if os.path.exists(bookmark_file):
+        with open(bookmark_file, "r") as file:
+            content = file.read().strip()
+            if content:
+                try:
+                    return datetime.strptime(content, "%Y-%m-%d %H:%M:%S")
+                except ValueError as e:
+                    logger.error(f"Invalid timestamp in bookmark file: {content} | Error: {e}")
+            else:
+                logger.info("Bookmark file is empty.")
+    else:
+        logger.info("Bookmark file does not exist.")
+    return None  # Return None if the file does not exist, is empty, or contains invalid data
+
+# Update the bookmark file with the latest processed timestamp
+def update_last_processed_time(last_processed_time):
+    """Update the bookmark file with the latest processed timestamp."""
+    if isinstance(last_processed_time, datetime):
+        with open(bookmark_file, "w") as file:
+            file.write(last_processed_time.strftime("%Y-%m-%d %H:%M:%S"))
+        logger.info(f"Updated bookmark file with timestamp: {last_processed_time}")
+    else:
+        logger.error(f"Expected datetime object for last_processed_time, got {type(last_processed_time)}")
+
+# Extract the alert fields from one log line
+def parse_line(line):
+    """Parse one Zircolite JSON line into an AlertRecord; raises ValueError if it has no usable SystemTime."""
+    title = re.search(r'"title":"(.*?)"', line)
+    tags = re.search(r'"tags":\[(.*?)\]', line)
+    description = re.search(r'"description":"((?:[^"\\]|\\.)*)"', line)  # Updated regex to handle escaped quotes
+    system_time = re.search(r'"SystemTime":"(.*?)"', line)
+    computer_name = re.search(r'"Computer":"(.*?)"', line)
+    user_id = re.search(r'"UserID":"(.*?)"', line)
+    event_id = re.search(r'"EventID":(\d+)', line)
+    provider_name = re.search(r'"Provider_Name":"(.*?)"', line)
+
+    title = title.group(1).strip() if title else None
+    tags = tags.group(1).replace('"', "").strip() if tags else None
+    description = description.group(1).strip() if description else None
+    computer_name = computer_name.group(1).strip() if computer_name else None
+    user_id = user_id.group(1).strip() if user_id else None
+    event_id = event_id.group(1).strip() if event_id else None
+    provider_name = provider_name.group(1).strip() if provider_name else None
+
+    # Convert SystemTime to MySQL-compatible format
+    try:
+        if system_time:
+            truncated_time = system_time.group(1).split('.')[0].rstrip("Z")
+            system_time = datetime.fromisoformat(truncated_time)
+        else:
+            system_time = None
+    except ValueError as e:
+        logger.error(f"Failed to process time: {system_time} | Error: {e}")
+        system_time = None
+
+    if system_time is None:
+        raise ValueError("missing SystemTime")
+
+    # Categorical fields are interned; system_time stays a datetime all the way to the insert
+    return AlertRecord(title, tags, description, system_time, computer_name, user_id, event_id, provider_name, line_hash(line))
+
+# Extract and process data from the log file
+def process_log_file(file_path, last_processed_time):
+    """Process a single log file and extract required fields."""
+    processed_data = []
+    latest_time = last_processed_time
+    try:
+        with open(file_path, "r") as file:
+            lines = file.readlines()
+
+        logger.info(f"Reading file: {file_path}")
+
+        for line in lines:
+            if not line.strip():
+                continue
+
+            try:
+                record = parse_line(line)
+                # Lines stamped exactly at the bookmark are re-read; seen_lines drops the ones already inserted
+                if last_processed_time and record.system_time < last_processed_time:
+                    continue  # Skip already processed entries
+                if not latest_time or record.system_time > latest_time:
+                    latest_time = record.system_time
+                processed_data.append(record)
+
+            except Exception as e:
+                logger.error(f"Failed to process line: {line.strip()} | Error: {e}")
+    except Exception as e:
+        logger.error(f"Error reading log file {file_path}: {e}")
+
+    return processed_data, latest_time
+
+# Cluster a signature's new alerts join, shared by the direct, spool and backfill paths
+def signature_clusters(cursor, signature_ids=None):
+    """Map signature_id -> the label of its earliest labelled row, preferring a cluster over noise.
+
+    A signature the clustering run split between a cluster and noise keeps joining the
+    cluster; it maps to -1 only when every labelled row is noise. signature_ids=None maps
+    every signature in sigma_alerts.
+    """
+    if signature_ids is None:
+        chunks = [None]
+    else:
+        signature_ids = list(signature_ids)
+        chunks = [signature_ids[offset:offset + 1000] for offset in range(0, len(signature_ids), 1000)]
+    clusters = {}
+    for chunk in chunks:
+        where = "" if chunk is None else f"AND signature_id IN ({', '.join(['%s'] * len(chunk))})"
+        cursor.execute(f"""
+        SELECT a.signature_id, a.dbscan_cluster
+        FROM sigma_alerts a
+        JOIN (
+            SELECT COALESCE(MIN(CASE WHEN dbscan_cluster >= 0 THEN id END), MIN(id)) AS first_id
+            FROM sigma_alerts
+            WHERE dbscan_cluster IS NOT NULL {where}
+            GROUP BY signature_id
+        ) f ON a.id = f.first_id
+        """, chunk or ())
+        clusters.update(cursor.fetchall())
+    return clusters
+
+# Get the cluster value of an existing record with the same signature
+def get_existing_cluster_value(record):
+    """Return the signature_clusters label for the record's signature (title, tags, computer_name, user_id, event_id), if any."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            return signature_clusters(cursor, [record.signature_id]).get(record.signature_id)
+    except db.Error as e:
+        logger.error(f"Error checking existing cluster value: {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+# Get the maximum existing cluster value
+def get_max_cluster_value():
+    """Get the maximum existing cluster value from the sigma_alerts table."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT MAX(dbscan_cluster) FROM sigma_alerts")
+            result = cursor.fetchone()
+            return result[0] if result[0] is not None else 0
+    except db.Error as e:
+        logger.error(f"Error fetching max cluster value: {e}")
+        return 0
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+# Score records against the last clustering run
+def score_records(records):
+    """Cluster values for records from the core-sample index, or None if scoring is off or unavailable."""
+    if not realtime_scoring or not records or core_index_loader is None:
+        return None
+    global unscorable_index
+    core_index = core_index_loader.current()
+    if core_index is None:
+        return None
+    reason = core_index.rate_mismatch(rate_counters)
+    if reason is not None:
+        # Scoring with zeroed or differently windowed rate columns would place alerts in the wrong clusters
+        if core_index is not unscorable_index:
+            logger.error(f"Real-time scoring disabled for the current core-sample index: {reason}.")
+            unscorable_index = core_index
+        return None
+    try:
+        return [int(cluster) for cluster in core_index.score(records, rate_counters)]
+    except Exception as e:
+        logger.error(f"Error scoring records against core-sample index: {e}")
+        return None
+
+# Choose the cluster value a new record is inserted with
+def assign_cluster_value(record, score=None):
+    """Use the record's core-sample score (computed here unless given), or fall back to its signature cluster."""
+    if score is None:
+        scores = score_records([record])
+        score = scores[0] if scores else None
+    if score is not None:
+        return score
+
+    existing_cluster_value = get_existing_cluster_value(record)
+    if existing_cluster_value is not None:
+        return existing_cluster_value
+    return get_max_cluster_value() + 1
+
+# Build cluster_profile deltas for normalized rows inserted with one cluster value
+def insert_profile_deltas(rows, cluster_value):
+    """Accumulate the profile change caused by inserting normalized rows into cluster_value."""
+    deltas = ProfileDeltas()
+    for row in rows:
+        deltas[cluster_value].add(row[3], row[4], row[5], row[8])
+    return deltas
+
+# Insert data into the SQL database (sigma_alerts or dbscan_outlier)
+def insert_data_to_sql(data, table, cluster_value):
+    """Insert processed data into the specified table ('sigma_alerts' or 'dbscan_outlier')."""
+    if data:
+        connection = None
+        try:
+            connection = db.connect()
+            with connection.cursor() as cursor:
+                if table == "sigma_alerts":
+                    # sigma_alerts stores dimension keys and the signature instead of the strings
+                    columns = normalized_columns + ["dbscan_cluster"]
+                    rows = normalize_records(connection, data)
+                else:
+                    columns = ["title", "tags", "description", "system_time", "computer_name", "user_id", "event_id", "provider_name", "dbscan_cluster"]
+                    rows = [tuple(row) for row in data]
+                insert_query = f"""
+                INSERT INTO {table} ({', '.join(columns)})
+                VALUES ({', '.join(['%s'] * len(columns))});
+                """
+                # Assign the same cluster value to all records
+                data_with_cluster = [row + (cluster_value,) for row in rows]
+                if table == "sigma_alerts":
+                    # The unique (line_hash, system_time) key turns a re-read line into a no-op, so only
+                    # rows that were really inserted reach dbscan_outlier and cluster_profile
+                    insert_query = insert_query.replace("INSERT INTO", "INSERT IGNORE INTO", 1)
+                    inserted, outliers = [], []
+                    for record, row in zip(data, data_with_cluster):
+                        cursor.execute(insert_query, row)
+                        if cursor.rowcount != 1:
+                            continue
+                        inserted.append(row)
+                        if cluster_value == -1:
+                            # Provisional noise is materialized in dbscan_outlier in the same transaction
+                            outliers.append((cursor.lastrowid,) + tuple(record) + (-1,))
+                    if outliers:
+                        cursor.executemany("""
+                        INSERT INTO dbscan_outlier
+                            (alert_id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, dbscan_cluster)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+                        """, outliers)
+                    apply_profile_deltas(cursor, insert_profile_deltas(inserted, cluster_value))
+                else:
+                    cursor.executemany(insert_query, data_with_cluster)
+                    inserted = data_with_cluster
+                connection.commit()
+                if table == "sigma_alerts":
+                    for record in data:
+                        seen_lines.add(record)
+                skipped = f" ({len(data) - len(inserted)} duplicate lines ignored)" if len(inserted) < len(data) else ""
+                logger.info(f"Inserted {len(inserted)} rows into '{table}' with cluster value {cluster_value}{skipped}.")
+        except db.Error as e:
+            logger.error(f"Error inserting data into {table}: {e}")
+        finally:
+            if connection and connection.is_connected():
+                connection.close()
+
+# Insert the records whose lines have not been inserted recently
+def insert_unseen_records(data):
+    """Spool (or, with SPOOL_ENABLED=0, insert) each record not already in seen_lines, then snapshot local state if due.
+
+    Returns the number of records accepted. Raises OSError if the spool cannot be written,
+    so callers do not advance their bookmark or checkpoint past records that were lost.
+    """
+    skipped = 0
+    pending, pending_hashes = [], set()
+    for record in data:
+        # Checked per record: repeats within data are caught too
+        if record in seen_lines or (record.line_hash is not None and record.line_hash in pending_hashes):
+            skipped += 1
+            continue
+        pending.append(record)
+        pending_hashes.add(record.line_hash)
+    if pending and spool is None:
+        if rate_counters is not None:
+            # Counted before scoring so each record's rate includes itself, as it will when clustered
+            for record in pending:
+                rate_counters.add_record(record)
+        # One scoring pass per call instead of one per record
+        scores = score_records(pending) or [None] * len(pending)
+        for record, score in zip(pending, scores):
+            insert_data_to_sql([record], 'sigma_alerts', assign_cluster_value(record, score))
+    elif pending:
+        spool.append(pending)
+        for record in pending:
+            seen_lines.add(record)
+            if rate_counters is not None:
+                rate_counters.add_record(record)
+    if skipped:
+        logger.info(f"Skipped {skipped} lines already inserted.")
+    seen_lines.save()
+    if rate_counters is not None:
+        rate_counters.save()
+    return len(data) - skipped
+
+# Choose cluster values for a replayed batch in one pass
+def assign_cluster_values(cursor, records):
+    """Batch form of assign_cluster_value: core-sample scores, else signature clusters, else new clusters in order."""
+    clusters = score_records(records) or [None] * len(records)
+    pending = [i for i, cluster in enumerate(clusters) if cluster is None]
+    if not pending:
+        return clusters
+
+    signatures = {}
+    for i in pending:
+        signatures.setdefault(records[i].signature_id, []).append(i)
+    known = signature_clusters(cursor, list(signatures))
+    cursor.execute("SELECT MAX(dbscan_cluster) FROM sigma_alerts")
+    result = cursor.fetchone()
+    next_cluster = (result[0] if result[0] is not None else 0) + 1
+    # Signatures are visited in record order, so new clusters are numbered as sequential inserts would number them
+    for signature in sorted(signatures, key=lambda signature: signatures[signature][0]):
+        cluster = known.get(signature)
+        if cluster is None:
+            cluster, next_cluster = next_cluster, next_cluster + 1
+        for i in signatures[signature]:
+            clusters[i] = cluster
+    return clusters
+
+# Insert a replayed batch into sigma_alerts in one transaction
+def insert_spooled_batch(connection, records):
+    """Bulk insert records with multi-row statements; returns the number of new rows.
+
+    Lines already in sigma_alerts (a batch replayed after a crash) are filtered first. If the
+    insert still ignores rows, another writer raced this one, so the batch is redone row by
+    row to keep dbscan_outlier and cluster_profile exact.
+    """
+    with connection.cursor() as cursor:
+        clusters = assign_cluster_values(cursor, records)
+        rows = normalize_records(connection, records)
+        present = set()
+        hashes = sorted({row[9] for row in rows if row[9] is not None})
+        for offset in range(0, len(hashes), 1000):
+            chunk = hashes[offset:offset + 1000]
+            cursor.execute(
+                f"SELECT line_hash, system_time FROM sigma_alerts WHERE line_hash IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+            present.update(cursor.fetchall())
+        new = []
+        for record, row, cluster in zip(records, rows, clusters):
+            key = (row[9], row[3])
+            if row[9] is not None and key in present:
+                continue
+            present.add(key)
+            new.append((record, row + (cluster,)))
+        if not new:
+            return 0
+
+        columns = normalized_columns + ["dbscan_cluster"]
+        placeholder = f"({', '.join(['%s'] * len(columns))})"
+        inserted = 0
+        for offset in range(0, len(new), 1000):
+            chunk = [row for _, row in new[offset:offset + 1000]]
+            cursor.execute(
+                f"INSERT IGNORE INTO sigma_alerts ({', '.join(columns)}) VALUES {', '.join([placeholder] * len(chunk))}",
+                [value for row in chunk for value in row]
+            )
+            inserted += cursor.rowcount
+        if inserted != len(new):
+            connection.rollback()
+            logger.warning(f"Concurrent insert detected; replaying {len(new)} rows one by one.")
+            return insert_rows_individually(connection, new)
+
+        noise = [(record, row) for record, row in new if row[-1] == -1]
+        if noise:
+            # Provisional noise is materialized in dbscan_outlier in the same transaction
+            alert_ids = {}
+            noise_hashes = sorted({row[9] for _, row in noise if row[9] is not None})
+            for offset in range(0, len(noise_hashes), 1000):
+                chunk = noise_hashes[offset:offset + 1000]
+                cursor.execute(
+                    f"SELECT id, line_hash, system_time FROM sigma_alerts WHERE line_hash IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk
+                )
+                alert_ids.update(((row[1], row[2]), row[0]) for row in cursor.fetchall())
+            cursor.executemany("""
+            INSERT INTO dbscan_outlier
+                (alert_id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, dbscan_cluster)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+            """, [(alert_ids.get((row[9], row[3])),) + tuple(record) + (-1,) for record, row in noise])
+
+        deltas = ProfileDeltas()
+        for _, row in new:
+            deltas[row[-1]].add(row[3], row[4], row[5], row[8])
+        apply_profile_deltas(cursor, deltas)
+    connection.commit()
+    return inserted
+
+def insert_rows_individually(connection, new):
+    """Slow path of insert_spooled_batch: one INSERT IGNORE per row, counting only rows really inserted."""
+    columns = normalized_columns + ["dbscan_cluster"]
+    insert_query = f"INSERT IGNORE INTO sigma_alerts ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    deltas, outliers = ProfileDeltas(), []
+    with connection.cursor() as cursor:
+        for record, row in new:
+            cursor.execute(insert_query, row)
+            if cursor.rowcount != 1:
+                continue
+            deltas[row[-1]].add(row[3], row[4], row[5], row[8])
+            if row[-1] == -1:
+                outliers.append((cursor.lastrowid,) + tuple(record) + (-1,))
+        if outliers:
+            cursor.executemany("""
+            INSERT INTO dbscan_outlier
+                (alert_id, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, dbscan_cluster)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+            """, outliers)
+        apply_profile_deltas(cursor, deltas)
+    connection.commit()
+    return sum(deltas[cluster].count for cluster in deltas)
+
+# Replay spooled records to the database
+def drain_spool(spool, batch_size=None):
+    """Replay spool batches until it is empty; returns the records replayed.
+
+    The cursor only moves after a batch is committed, so a database error leaves the batch
+    in the spool for the next attempt.
+    """
+    batch_size = batch_size or spool_batch_size
+    drained = 0
+    while True:
+        with intern_scope():
+            records, position = spool.read(batch_size)
+            if not records:
+                if position != spool.read_cursor():
+                    spool.commit(position)  # Step past a finished segment
+                return drained
+            connection = None
+            try:
+                connection = db.connect()
+                start = time.perf_counter()
+                inserted = insert_spooled_batch(connection, records)
+                logger.info(f"Replayed {len(records)} spooled records ({inserted} new) in {time.perf_counter() - start:.2f} seconds.")
+            except Exception:
+                if connection and connection.is_connected():
+                    connection.rollback()
+                raise
+            finally:
+                if connection and connection.is_connected():
+                    connection.close()
+        spool.commit(position)
+        spool.drained += len(records)
+        drained += len(records)
+
+# Background drainer started next to the folder monitor
+def run_spool_drainer(spool, stopped=None):
+    """Drain the spool until stopped is set, backing off while the database is unavailable and logging depth and lag."""
+    stopped = stopped or threading.Event()
+    lock = spool.drain_lock()
+    if lock is None:
+        logger.warning(f"Another process is draining {spool.directory}; not starting a drainer.")
+        return
+    backoff = spool_poll_seconds
+    reported = 0.0
+    try:
+        while not stopped.is_set():
+            try:
+                drain_spool(spool)
+                backoff = spool_poll_seconds
+            except db.Error as e:
+                logger.error(f"Spool replay failed, retrying in {backoff:.0f} seconds: {e}")
+                backoff = min(backoff * 2, spool_max_backoff_seconds)
+            except Exception as e:
+                logger.error(f"Error draining spool: {e}")
+                backoff = min(backoff * 2, spool_max_backoff_seconds)
+            if time.monotonic() - reported >= spool_metrics_seconds:
+                stats = spool.stats()
+                if stats["spool_pending_records"]:
+                    logger.info("Spool " + ", ".join(f"{name}={value}" for name, value in stats.items()))
+                reported = time.monotonic()
+            stopped.wait(backoff)
+    finally:
+        lock.close()
+
+def start_spool_drainer(spool):
+    """Start run_spool_drainer in a daemon thread; returns (thread, stop event) for finish_spool."""
+    stopped = threading.Event()
+    thread = threading.Thread(target=run_spool_drainer, args=(spool, stopped), name="spool-drainer")
+    thread.daemon = True
+    thread.start()
+    return thread, stopped
+
+# Replay what is left in the spool before the process exits
+def finish_spool(spool, drainer=None):
+    """Stop the drainer thread, drain the spool until it is empty and close it.
+
+    Records the database still refuses stay in the spool for the next start.
+    """
+    spool.close()
+    if drainer is not None:
+        thread, stopped = drainer
+        stopped.set()
+        thread.join()
+    lock = spool.drain_lock()
+    if lock is None:
+        logger.warning(f"Another process is draining {spool.directory}; leaving the rest to it.")
+        return
+    try:
+        drained = drain_spool(spool)
+        logger.info(f"Drained {drained} spooled records before exiting.")
+    except Exception as e:
+        pending = spool.stats()["spool_pending_records"]
+        logger.error(f"Could not drain the spool before exiting, {pending} records stay spooled: {e}")
+    finally:
+        lock.close()
+
+# Process the files that appeared since the previous scan
+def scan_folder_once(log_folder, processed_files, last_processed_time):
+    """Run one monitor_folder iteration: process new files and record them in processed_files."""
+    current_files = set(os.listdir(log_folder))
+    new_files = current_files - processed_files
+
+    for new_file in new_files:
+        full_path = os.path.join(log_folder, new_file)
+        if os.path.isfile(full_path):
+            logger.info(f"Processing new file: {full_path}")
+            with intern_scope():
+                data, latest_time = process_log_file(full_path, last_processed_time)
+                if data:
+                    insert_unseen_records(data)
+
+            if isinstance(latest_time, datetime):
+                update_last_processed_time(latest_time)
+
+            processed_files.add(new_file)
+
+    # Records never outlive a file, so the intern tables can be emptied between scans
+    compact_intern_tables()
+
+# Monitor and process new log files
+def monitor_folder(log_folder, drainer=None):
+    """Monitor the folder and process new log files as they arrive; drainer is start_spool_drainer's result."""
+    processed_files = set()
+    last_processed_time = read_last_processed_time()
+
+    if last_processed_time is None:
+        # Process all files if no bookmark exists or is empty
+        logger.info("Processing all files as no bookmark exists.")
+        all_files = sorted(os.listdir(log_folder))
+        for file_name in all_files:
+            full_path = os.path.join(log_folder, file_name)
+            if os.path.isfile(full_path):
+                logger.info(f"Processing file: {full_path}")
+                with intern_scope():
+                    data, latest_time = process_log_file(full_path, last_processed_time)
+                    if data:
+                        insert_unseen_records(data)
+                        last_processed_time = latest_time
+                compact_intern_tables()
+
+        if last_processed_time:
+            update_last_processed_time(last_processed_time)
+
+    else:
+        logger.info(f"Initial last processed time: {last_processed_time}")
+
+    while True:
+        try:
+            scan_folder_once(log_folder, processed_files, last_processed_time)
+            time.sleep(5)  # Check for new files every 5 seconds
+
+        except KeyboardInterrupt:
+            logger.info("Stopping monitoring.")
+            seen_lines.save(force=True)
+            if rate_counters is not None:
+                rate_counters.save(force=True)
+            if spool is not None:
+                finish_spool(spool, drainer)
+            break
+        except Exception as e:
+            logger.error(f"Error monitoring folder: {e}")
+
+# Main execution
+def main():
+    """Create the tables, start retention in the background and monitor the log folder."""
+    global scan_folder_once
+    configure_logging()
+    # Profile sampled folder scans when PIPELINE_PROFILE=1 or --profile is given
+    configure_from_args(sys.argv)
+    scan_folder_once = maybe_profile("ingest", scan_folder_once)
+
+    initialize_sql_tables()
+    ensure_column_exists("sigma_alerts", "dbscan_cluster", "INT")
+    ensure_column_exists("dbscan_outlier", "dbscan_cluster", "INT")
+    ensure_column_exists("dbscan_outlier", "alert_id", "INT UNIQUE")
+    configure()
+
+    # Start the retention scheduling in a separate thread
+    retention_thread = threading.Thread(target=schedule_retention)
+    retention_thread.daemon = True
+    retention_thread.start()
+
+    drainer = start_spool_drainer(spool) if spool is not None else None
+
+    # Start monitoring the folder
+    monitor_folder(log_folder, drainer)
+
+if __name__ == "__main__":
+    main()
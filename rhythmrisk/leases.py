@@ -0,0 +1,208 @@
+import os
+import uuid
+import logging
+import threading
+from . import db
+
+logger = logging.getLogger()
+
+# Lease configuration: a lease not renewed for lease_seconds can be taken over by another worker
+lease_seconds = int(os.getenv("INGEST_LEASE_SECONDS", "60"))
+heartbeat_seconds = max(1, int(os.getenv("INGEST_HEARTBEAT_SECONDS", str(lease_seconds // 4 or 1))))
+
+def create_lease_tables(cursor):
+    """Create the ingest_file_lease and ingest_worker tables."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_file_lease (
+        file_name VARCHAR(255) PRIMARY KEY,
+        owner VARCHAR(100),
+        claim_token CHAR(32),
+        lease_expires DATETIME(6),
+        checkpoint_offset BIGINT NOT NULL DEFAULT 0,
+        takeovers INT NOT NULL DEFAULT 0,
+        registered_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6),
+        completed_at DATETIME,
+        UNIQUE KEY uq_ingest_file_lease_token (claim_token),
+        KEY idx_ingest_file_lease_pending (completed_at, registered_at)
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_worker (
+        worker_id VARCHAR(100) PRIMARY KEY,
+        host VARCHAR(255),
+        pid INT,
+        started_at DATETIME,
+        heartbeat_at DATETIME,
+        current_file VARCHAR(255),
+        files_completed INT NOT NULL DEFAULT 0,
+        rows_inserted BIGINT NOT NULL DEFAULT 0
+    );
+    """)
+
+def connect():
+    """Connection whose UPDATE row counts are matched rows, so a renewal that changes nothing still counts."""
+    from mysql.connector.constants import ClientFlag
+    connection = db.connect(client_flags=[ClientFlag.FOUND_ROWS])
+    connection.autocommit = True
+    return connection
+
+class FileLease:
+    """One claimed file: its checkpoint and the token that proves ownership."""
+
+    def __init__(self, file_name, token, offset, takeovers):
+        self.file_name = file_name
+        self.token = token
+        self.offset = offset
+        self.takeovers = takeovers
+        self.lost = False
+
+class LeaseStore:
+    """Claims, renews, checkpoints and completes file leases for one worker.
+
+    Every statement is a single autocommitted UPDATE guarded by the claim token, so a
+    worker whose lease was taken over finds out on its next checkpoint or heartbeat and
+    never overwrites the new owner's progress. Expiry uses the database clock, so workers
+    on different nodes agree on it.
+    """
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.connection = None
+        self.lock = threading.Lock()
+        self.registered = set()
+
+    def execute(self, query, params=()):
+        with self.lock:
+            if self.connection is None or not self.connection.is_connected():
+                self.connection = connect()
+            with self.connection.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount, (cursor.fetchall() if cursor.with_rows else [])
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.connection.is_connected():
+                self.connection.close()
+
+    def register_files(self, file_names):
+        """Add files not seen by this worker yet to the lease table; existing rows are left alone."""
+        new_files = sorted(set(file_names) - self.registered)
+        for offset in range(0, len(new_files), 500):
+            chunk = new_files[offset:offset + 500]
+            self.execute(
+                f"INSERT IGNORE INTO ingest_file_lease (file_name) VALUES {', '.join(['(%s)'] * len(chunk))}",
+                chunk
+            )
+        self.registered.update(new_files)
+        return len(new_files)
+
+    def claim(self):
+        """Claim the oldest unfinished file that is unowned, expired or already ours; None if there is none."""
+        token = uuid.uuid4().hex
+        claimed, _ = self.execute("""
+        UPDATE ingest_file_lease
+        SET takeovers = takeovers + (owner IS NOT NULL AND owner <> %s),
+            owner = %s,
+            claim_token = %s,
+            lease_expires = NOW(6) + INTERVAL %s SECOND
+        WHERE completed_at IS NULL AND (owner IS NULL OR owner = %s OR lease_expires < NOW(6))
+        ORDER BY registered_at, file_name
+        LIMIT 1
+        """, (self.worker_id, self.worker_id, token, lease_seconds, self.worker_id))
+        if not claimed:
+            return None
+        _, rows = self.execute(
+            "SELECT file_name, checkpoint_offset, takeovers FROM ingest_file_lease WHERE claim_token = %s", (token,)
+        )
+        if not rows:
+            return None
+        file_name, offset, takeovers = rows[0]
+        return FileLease(file_name, token, offset, takeovers)
+
+    def renew(self, lease):
+        """Extend the lease; marks it lost if another worker has taken it over."""
+        renewed, _ = self.execute("""
+        UPDATE ingest_file_lease SET lease_expires = NOW(6) + INTERVAL %s SECOND
+        WHERE claim_token = %s AND completed_at IS NULL
+        """, (lease_seconds, lease.token))
+        if not renewed:
+            lease.lost = True
+        return not lease.lost
+
+    def checkpoint(self, lease, offset):
+        """Record that everything before offset is in the database, renewing the lease at the same time."""
+        saved, _ = self.execute("""
+        UPDATE ingest_file_lease SET checkpoint_offset = %s, lease_expires = NOW(6) + INTERVAL %s SECOND
+        WHERE claim_token = %s AND completed_at IS NULL
+        """, (offset, lease_seconds, lease.token))
+        if saved:
+            lease.offset = offset
+        else:
+            lease.lost = True
+        return not lease.lost
+
+    def complete(self, lease, offset):
+        completed, _ = self.execute("""
+        UPDATE ingest_file_lease SET checkpoint_offset = %s, completed_at = NOW(), lease_expires = NULL
+        WHERE claim_token = %s AND completed_at IS NULL
+        """, (offset, lease.token))
+        if not completed:
+            lease.lost = True
+        return not lease.lost
+
+    def release(self, lease):
+        """Give a lease up early so another worker can take it without waiting for expiry."""
+        self.execute(
+            "UPDATE ingest_file_lease SET lease_expires = NOW(6) WHERE claim_token = %s AND completed_at IS NULL",
+            (lease.token,)
+        )
+
+    def register_worker(self, host, pid):
+        self.execute("""
+        INSERT INTO ingest_worker (worker_id, host, pid, started_at, heartbeat_at)
+        VALUES (%s, %s, %s, NOW(), NOW())
+        ON DUPLICATE KEY UPDATE host = VALUES(host), pid = VALUES(pid), started_at = NOW(), heartbeat_at = NOW(), current_file = NULL
+        """, (self.worker_id, host, pid))
+
+    def worker_heartbeat(self, current_file):
+        self.execute(
+            "UPDATE ingest_worker SET heartbeat_at = NOW(), current_file = %s WHERE worker_id = %s",
+            (current_file, self.worker_id)
+        )
+
+    def worker_progress(self, rows):
+        self.execute("""
+        UPDATE ingest_worker SET files_completed = files_completed + 1, rows_inserted = rows_inserted + %s,
+            current_file = NULL, heartbeat_at = NOW()
+        WHERE worker_id = %s
+        """, (rows, self.worker_id))
+
+class Heartbeat(threading.Thread):
+    """Background thread renewing the worker's current lease every heartbeat_seconds."""
+
+    def __init__(self, store):
+        super().__init__(daemon=True)
+        self.store = store
+        self.lease = None
+        # Held for a whole renewal, so set_lease() returns only once no renewal of the old lease is in flight
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def set_lease(self, lease):
+        """Renew lease from now on (None to stop renewing), waiting out a renewal already in progress."""
+        with self.lock:
+            self.lease = lease
+
+    def run(self):
+        while not self.stopped.wait(heartbeat_seconds):
+            try:
+                with self.lock:
+                    lease = self.lease
+                    if lease is not None and not self.store.renew(lease):
+                        logger.warning(f"Lease on {lease.file_name} was taken over by another worker.")
+                self.store.worker_heartbeat(lease.file_name if lease else None)
+            except db.Error as e:
+                logger.error(f"Error renewing leases for {self.store.worker_id}: {e}")
+
+    def stop(self):
+        self.stopped.set()
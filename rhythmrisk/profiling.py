@@ -0,0 +1,122 @@
+import os
+import io
+import time
+import logging
+import cProfile
+import functools
+import pstats
+import tracemalloc
+
+logger = logging.getLogger()
+
+# Profiling configuration (PIPELINE_PROFILE=1 or --profile on the command line enables it)
+profile_enabled = os.getenv("PIPELINE_PROFILE", "0") == "1"
+profile_dir = os.getenv("PIPELINE_PROFILE_DIR", "profiles")
+profile_every = max(1, int(os.getenv("PIPELINE_PROFILE_EVERY", "1")))
+profile_keep = int(os.getenv("PIPELINE_PROFILE_KEEP", "20"))
+profile_top = int(os.getenv("PIPELINE_PROFILE_TOP", "15"))
+
+def configure_from_args(argv):
+    """Enable profiling if --profile is on the command line and strip the flag from argv."""
+    global profile_enabled
+    if "--profile" in argv:
+        profile_enabled = True
+        argv.remove("--profile")
+    return profile_enabled
+
+class CycleProfiler:
+    """Run every Nth call of a pipeline cycle under cProfile and tracemalloc and dump the reports.
+
+    Each sampled cycle writes a pstats file and a text summary to the profile directory; only
+    the newest reports per cycle name are kept. The top entries are also logged.
+    """
+
+    def __init__(self, name, every=profile_every, directory=profile_dir, keep=profile_keep, top=profile_top):
+        self.name = name
+        self.every = every
+        self.directory = directory
+        self.keep = keep
+        self.top = top
+        self.calls = 0
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            if (self.calls - 1) % self.every:
+                return func(*args, **kwargs)
+            return self.run(func, *args, **kwargs)
+        return wrapper
+
+    def run(self, func, *args, **kwargs):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                self.report(profiler, before, after, peak, seconds)
+            except OSError as e:
+                logger.error(f"Error writing profile for {self.name}: {e}")
+
+    def report(self, profiler, before, after, peak, seconds):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{self.calls}")
+        profiler.dump_stats(f"{base}.prof")
+
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(self.top)
+        growth = after.compare_to(before, "lineno")[:self.top]
+
+        with open(f"{base}.txt", "w") as file:
+            file.write(f"cycle={self.name} call={self.calls} seconds={seconds:.3f} peak_traced_bytes={peak}\n\n")
+            file.write(stats_text.getvalue())
+            file.write(f"\nTop {self.top} allocation changes by line:\n")
+            for stat in growth:
+                file.write(f"{stat}\n")
+
+        functions = pstats.Stats(profiler).sort_stats("cumulative")
+        logger.info(f"Profiled {self.name} cycle in {seconds:.2f}s, peak traced memory {peak / 2**20:.1f} MiB; report {base}.txt")
+        for (filename, line, function), (_, calls, _, cumulative, _) in sorted(
+            functions.stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:self.top]:
+            logger.info(f"  {cumulative:8.3f}s {calls:>8} calls  {function} ({os.path.basename(filename)}:{line})")
+        for stat in growth[:5]:
+            logger.info(f"  alloc {stat}")
+        self.rotate()
+
+    def rotate(self):
+        """Delete the oldest reports of this cycle beyond the retention count."""
+        prefix = f"{self.name}-"
+        reports = sorted(
+            (name for name in os.listdir(self.directory) if name.startswith(prefix) and name.endswith(".prof")),
+            # Reports written within one mtime tick are ordered by their call number
+            key=lambda name: (os.path.getmtime(os.path.join(self.directory, name)), report_call(name))
+        )
+        for name in reports[:max(0, len(reports) - self.keep)]:
+            for suffix in (".prof", ".txt"):
+                path = os.path.join(self.directory, name[:-len(".prof")] + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+def report_call(name):
+    """Call number a report file name ends with (<cycle>-<timestamp>-<call>.prof)."""
+    call = name[:-len(".prof")].rsplit("-", 1)[-1]
+    return int(call) if call.isdigit() else 0
+
+def maybe_profile(name, func):
+    """Return func wrapped in a CycleProfiler when profiling is enabled, or func itself (no overhead) otherwise."""
+    if not profile_enabled:
+        return func
+    logger.info(f"Profiling every {profile_every} {name} cycle(s) into {profile_dir}.")
+    return CycleProfiler(name).wrap(func)
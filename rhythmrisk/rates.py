@@ -0,0 +1,189 @@
+import os
+import glob
+import time
+import pickle
+import logging
+import tempfile
+from . import load_pickle, state_path
+from .records import to_epoch
+from .retention import retention_days
+
+logger = logging.getLogger()
+
+# Rate counter configuration
+rate_features_enabled = os.getenv("RATE_FEATURES", "1") == "1"
+rate_snapshot_path = state_path(os.getenv("RATE_SNAPSHOT_PATH", "rate_counters.pkl"))
+rate_bucket_seconds = int(os.getenv("RATE_BUCKET_SECONDS", "300"))
+# Buckets summed into one rate: 12 five-minute buckets is alerts in the trailing hour
+rate_window_buckets = int(os.getenv("RATE_WINDOW_BUCKETS", "12"))
+# Buckets older than this are pruned; the default keeps every row sigma_alerts retains
+rate_history_hours = float(os.getenv("RATE_HISTORY_HOURS", str(retention_days * 24)))
+# Minimum seconds between snapshots written by the ingester
+rate_snapshot_seconds = int(os.getenv("RATE_SNAPSHOT_SECONDS", "60"))
+
+# Counted dimensions, in feature column order
+rate_dimensions = ("computer_name", "user_id", "user_event")
+
+class RateCounters:
+    """Time-bucketed alert counts per computer_name, user_id and (user_id, event_id).
+
+    add() is O(1): one dict increment per dimension in the bucket of the alert's
+    system_time. A rate is the count over the rate_window_buckets buckets ending at a
+    given time, so each alert can be described by the activity around it. The ingester
+    owns the live counters and snapshots them to path; the clustering stage reads the
+    snapshot with refresh() instead of querying sigma_alerts.
+    """
+
+    def __init__(self, path=rate_snapshot_path, bucket_seconds=rate_bucket_seconds,
+                 window_buckets=rate_window_buckets, history_hours=rate_history_hours):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.history_buckets = max(window_buckets, int(history_hours * 3600 // bucket_seconds))
+        # dimension -> key -> bucket -> count
+        self.counts = {dimension: {} for dimension in rate_dimensions}
+        self.newest_bucket = 0
+        self.mtime = None
+        self.saved_at = 0.0
+        self.dirty = False
+
+    @staticmethod
+    def keys(computer_name, user_id, event_id):
+        return (computer_name, user_id, (user_id, event_id))
+
+    def add(self, computer_name, user_id, event_id, system_time):
+        """Count one alert."""
+        epoch = to_epoch(system_time)
+        if epoch < 0:
+            return
+        bucket = epoch // self.bucket_seconds
+        for dimension, key in zip(rate_dimensions, self.keys(computer_name, user_id, event_id)):
+            buckets = self.counts[dimension].setdefault(key, {})
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+        if bucket > self.newest_bucket:
+            self.newest_bucket = bucket
+        self.dirty = True
+
+    def add_record(self, record):
+        self.add(record[4], record[5], record[6], record[3])
+
+    def rates(self, computer_names, user_ids, event_ids, epochs):
+        """Trailing-window counts for each row as (host, user, user_event) tuples.
+
+        Rows share keys and buckets heavily, so window sums are memoized per call.
+        """
+        memo = {}
+        window = self.window_buckets
+        result = []
+        for computer_name, user_id, event_id, epoch in zip(computer_names, user_ids, event_ids, epochs):
+            if epoch < 0:
+                result.append((0, 0, 0))
+                continue
+            bucket = epoch // self.bucket_seconds
+            row = []
+            for dimension, key in zip(rate_dimensions, self.keys(computer_name, user_id, event_id)):
+                total = memo.get((dimension, key, bucket))
+                if total is None:
+                    buckets = self.counts[dimension].get(key)
+                    total = sum(buckets.get(b, 0) for b in range(bucket - window + 1, bucket + 1)) if buckets else 0
+                    memo[(dimension, key, bucket)] = total
+                row.append(total)
+            result.append(tuple(row))
+        return result
+
+    def prune(self):
+        """Drop buckets that fell out of the history and keys left without buckets."""
+        oldest = self.newest_bucket - self.history_buckets
+        for keyed in self.counts.values():
+            for key in list(keyed):
+                buckets = keyed[key]
+                for bucket in [bucket for bucket in buckets if bucket <= oldest]:
+                    del buckets[bucket]
+                if not buckets:
+                    del keyed[key]
+
+    def state(self):
+        return {"bucket_seconds": self.bucket_seconds, "window_buckets": self.window_buckets,
+                "newest_bucket": self.newest_bucket, "counts": self.counts}
+
+    def adopt(self, state):
+        if state["bucket_seconds"] != self.bucket_seconds:
+            logger.warning(f"Rate snapshot {self.path} uses {state['bucket_seconds']}s buckets, not {self.bucket_seconds}s; ignoring it.")
+            return
+        self.window_buckets = state["window_buckets"]
+        self.newest_bucket = state["newest_bucket"]
+        self.counts = state["counts"]
+
+    def load(self):
+        """Restore the snapshot written by a previous run, if any."""
+        try:
+            self.adopt(load_pickle(self.path))
+            self.mtime = os.stat(self.path).st_mtime_ns
+            logger.info(f"Loaded rate counters for {sum(len(keyed) for keyed in self.counts.values())} keys from {self.path}.")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Ignoring unreadable rate snapshot {self.path}: {e}")
+        return self
+
+    def snapshot_paths(self):
+        """The single-ingester snapshot plus any per-worker or backfill snapshots (<path>.<suffix>)."""
+        paths = [self.path] + sorted(glob.glob(glob.escape(self.path) + ".*"))
+        found = []
+        for path in paths:
+            try:
+                found.append((path, os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                pass
+        return tuple(found)
+
+    def merge(self, state):
+        """Add another snapshot's counts to these counters."""
+        if state["bucket_seconds"] != self.bucket_seconds:
+            return
+        self.newest_bucket = max(self.newest_bucket, state["newest_bucket"])
+        for dimension, keyed in state["counts"].items():
+            target = self.counts.setdefault(dimension, {})
+            for key, buckets in keyed.items():
+                merged = target.setdefault(key, {})
+                for bucket, count in buckets.items():
+                    merged[bucket] = merged.get(bucket, 0) + count
+
+    def refresh(self):
+        """Reload the snapshots if any ingester has replaced one since the last load.
+
+        With lease-coordinated workers each worker counts only the files it ingested, so
+        their snapshots are summed, as is the backfill command's <path>.backfill snapshot.
+        """
+        snapshots = self.snapshot_paths()
+        if not snapshots or snapshots == self.mtime:
+            return self
+        if len(snapshots) == 1 and snapshots[0][0] == self.path:
+            self.load()
+        else:
+            self.counts = {dimension: {} for dimension in rate_dimensions}
+            self.newest_bucket = 0
+            for path, _ in snapshots:
+                try:
+                    self.merge(load_pickle(path))
+                except Exception as e:
+                    logger.error(f"Ignoring unreadable rate snapshot {path}: {e}")
+        self.mtime = snapshots
+        return self
+
+    def save(self, force=False):
+        """Prune and write the snapshot atomically, at most every rate_snapshot_seconds unless forced."""
+        if not self.dirty or (not force and time.monotonic() - self.saved_at < rate_snapshot_seconds):
+            return
+        self.prune()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as file:
+                pickle.dump(self.state(), file, protocol=pickle.HIGHEST_PROTOCOL)
+                temp_path = file.name
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving rate snapshot {self.path}: {e}")
+            return
+        self.saved_at = time.monotonic()
+        self.dirty = False
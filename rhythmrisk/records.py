@@ -0,0 +1,311 @@
+import os
+import hashlib
+import threading
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# The ingester forgets every interned value once the tables hold more than this many in total
+intern_max_values = int(os.getenv("INTERN_MAX_VALUES", "500000"))
+
+class InternTable:
+    """Shared str <-> int mapping for a categorical field. Code 0 is reserved for None.
+
+    Codes whose value was forgotten by retain() read as None until adopt() or code() reuses them.
+    """
+
+    __slots__ = ("codes", "values", "free")
+
+    def __init__(self):
+        self.codes = {None: 0}
+        self.values = [None]
+        # Forgotten locally assigned codes, reused by code(); adopted tables never fill this
+        self.free = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        """Return the code for value, assigning the next one on first sight."""
+        code = self.codes.get(value)
+        if code is None:
+            if self.free:
+                code = self.free.pop()
+                self.values[code] = value
+            else:
+                code = len(self.values)
+                self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def value(self, code):
+        return self.values[code]
+
+    def adopt(self, code, value):
+        """Bind value to an externally assigned code, such as a dimension table id.
+
+        A table should either adopt all of its codes or assign them all through code();
+        locally assigned codes start above the highest adopted one.
+        """
+        if code >= len(self.values):
+            self.values.extend([None] * (code + 1 - len(self.values)))
+        self.values[code] = value
+        self.codes[value] = code
+
+    def retain(self, live_codes, reuse=True):
+        """Forget every value whose code is not in live_codes; returns how many were forgotten.
+
+        live_codes must cover every code still held anywhere: the codes that stay keep their
+        values, the others become holes. With reuse, code() hands holes out again for new
+        values; tables of adopted dimension ids pass reuse=False and adopt() fills them when
+        a row references the id again.
+        """
+        live = set(live_codes)
+        forgotten = 0
+        for code in range(1, len(self.values)):
+            value = self.values[code]
+            if value is None or code in live:
+                continue
+            del self.codes[value]
+            self.values[code] = None
+            forgotten += 1
+        while len(self.values) > 1 and self.values[-1] is None:
+            self.values.pop()
+        self.free = [code for code in range(1, len(self.values)) if self.values[code] is None] if reuse else []
+        return forgotten
+
+# Process-wide intern tables, one per categorical field
+title_table = InternTable()
+tags_table = InternTable()
+computer_table = InternTable()
+user_table = InternTable()
+event_table = InternTable()
+provider_table = InternTable()
+
+categorical_tables = (title_table, tags_table, computer_table, user_table, event_table, provider_table)
+
+# Stretches of code holding AlertRecords; compact_intern_tables waits until there are none
+intern_lock = threading.Lock()
+intern_holders = 0
+
+@contextmanager
+def intern_scope():
+    """Hold the intern tables stable while records created inside are in use."""
+    global intern_holders
+    with intern_lock:
+        intern_holders += 1
+    try:
+        yield
+    finally:
+        with intern_lock:
+            intern_holders -= 1
+
+def compact_intern_tables(max_values=None):
+    """Forget every interned value once the tables outgrow max_values (default intern_max_values).
+
+    For processes whose records are short-lived, like the ingester: it only runs while no
+    intern_scope is open, so no record still refers to a forgotten code. Returns whether the
+    tables were compacted.
+    """
+    max_values = intern_max_values if max_values is None else max_values
+    with intern_lock:
+        if intern_holders or sum(len(table) for table in categorical_tables) <= max_values:
+            return False
+        for table in categorical_tables:
+            table.retain(())
+        return True
+
+epoch_start = datetime(1970, 1, 1)
+
+# AlertBatch.clusters value for rows whose dbscan_cluster is NULL
+missing_cluster = -(2 ** 31)
+
+def value_hash(value):
+    """64-bit content hash of a string's UTF-8 bytes; matches dimensions.sql_value_hash."""
+    return int(hashlib.sha1(value.encode("utf-8")).hexdigest()[:16], 16)
+
+def signature_id(title, tags, computer_name, user_id, event_id):
+    """Cluster signature over the fields get_existing_cluster_value matches on, NULLs hashed as ''."""
+    return value_hash("\x1f".join("" if value is None else str(value) for value in (title, tags, computer_name, user_id, event_id)))
+
+def line_hash(line):
+    """Fast 64-bit content hash of a raw log line, ignoring surrounding whitespace."""
+    return int.from_bytes(hashlib.blake2b(line.strip().encode("utf-8"), digest_size=8).digest(), "big")
+
+def to_epoch(value):
+    """Encode a naive datetime as integer seconds for array storage; None becomes -1."""
+    if value is None:
+        return -1
+    return int((value - epoch_start).total_seconds())
+
+def from_epoch(value):
+    if value < 0:
+        return None
+    return epoch_start + timedelta(seconds=value)
+
+class AlertRecord:
+    """A parsed alert with its categorical fields stored as intern-table codes.
+
+    Indexing and iteration yield the sigma_alerts insert order (title, tags, description,
+    system_time, computer_name, user_id, event_id, provider_name), so a record can be passed
+    wherever the plain tuples used to go. system_time stays a datetime end to end.
+    """
+
+    __slots__ = ("title_code", "tags_code", "description", "system_time",
+                 "computer_code", "user_code", "event_code", "provider_code", "line_hash")
+
+    def __init__(self, title, tags, description, system_time, computer_name, user_id, event_id, provider_name, line_hash=None):
+        self.title_code = title_table.code(title)
+        self.tags_code = tags_table.code(tags)
+        self.description = description
+        self.system_time = system_time
+        self.computer_code = computer_table.code(computer_name)
+        self.user_code = user_table.code(user_id)
+        self.event_code = event_table.code(event_id)
+        self.provider_code = provider_table.code(provider_name)
+        self.line_hash = line_hash
+
+    @property
+    def title(self):
+        return title_table.values[self.title_code]
+
+    @property
+    def tags(self):
+        return tags_table.values[self.tags_code]
+
+    @property
+    def computer_name(self):
+        return computer_table.values[self.computer_code]
+
+    @property
+    def user_id(self):
+        return user_table.values[self.user_code]
+
+    @property
+    def event_id(self):
+        return event_table.values[self.event_code]
+
+    @property
+    def provider_name(self):
+        return provider_table.values[self.provider_code]
+
+    @property
+    def signature_id(self):
+        return signature_id(self.title, self.tags, self.computer_name, self.user_id, self.event_id)
+
+    def as_row(self):
+        return (self.title, self.tags, self.description, self.system_time,
+                self.computer_name, self.user_id, self.event_id, self.provider_name)
+
+    def __getitem__(self, index):
+        # Decode only the requested field; callers index single fields in hot loops
+        if isinstance(index, slice):
+            return self.as_row()[index]
+        return getattr(self, row_fields[index])
+
+    def __iter__(self):
+        return iter(self.as_row())
+
+    def __len__(self):
+        return 8
+
+    def __reduce__(self):
+        # Codes are only meaningful inside one process, so pickle the decoded values
+        return (AlertRecord, self.as_row() + (self.line_hash,))
+
+# AlertRecord attribute behind each row index, in sigma_alerts insert order
+row_fields = ("title", "tags", "description", "system_time", "computer_name", "user_id", "event_id", "provider_name")
+
+class AlertBatch:
+    """Columnar batch of fetched alerts backed by typed arrays.
+
+    Holds the columns fetch_data selects (id, title, tags, computer_name, user_id, event_id,
+    provider_name, system_time, dbscan_cluster, signature_id): ids and epoch seconds as int64
+    arrays, categorical fields as intern-table codes. Indexing yields the first eight fields
+    as a tuple for row-oriented callers.
+    """
+
+    __slots__ = ("ids", "title_codes", "tags_codes", "computer_codes", "user_codes",
+                 "event_codes", "provider_codes", "system_times", "clusters", "signatures")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.title_codes = array("i")
+        self.tags_codes = array("i")
+        self.computer_codes = array("i")
+        self.user_codes = array("i")
+        self.event_codes = array("i")
+        self.provider_codes = array("i")
+        self.system_times = array("q")
+        self.clusters = array("i")
+        self.signatures = array("Q")
+
+    @classmethod
+    def from_rows(cls, rows):
+        batch = cls()
+        for row in rows:
+            batch.append(*row)
+        return batch
+
+    def append(self, id, title, tags, computer_name, user_id, event_id, provider_name, system_time=None,
+               dbscan_cluster=None, signature=0):
+        self.append_codes(id, title_table.code(title), tags_table.code(tags), computer_table.code(computer_name),
+                          user_table.code(user_id), event_table.code(event_id), provider_table.code(provider_name),
+                          to_epoch(system_time), missing_cluster if dbscan_cluster is None else dbscan_cluster, signature)
+
+    def append_codes(self, id, title_code, tags_code, computer_code, user_code, event_code, provider_code, epoch,
+                     cluster=missing_cluster, signature=0):
+        self.ids.append(id)
+        self.title_codes.append(title_code)
+        self.tags_codes.append(tags_code)
+        self.computer_codes.append(computer_code)
+        self.user_codes.append(user_code)
+        self.event_codes.append(event_code)
+        self.provider_codes.append(provider_code)
+        self.system_times.append(epoch)
+        self.clusters.append(cluster)
+        self.signatures.append(signature)
+
+    def codes_at(self, i):
+        """The encoded row at position i, in append_codes argument order."""
+        return (self.ids[i], self.title_codes[i], self.tags_codes[i], self.computer_codes[i],
+                self.user_codes[i], self.event_codes[i], self.provider_codes[i], self.system_times[i],
+                self.clusters[i], self.signatures[i])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self.ids) > 0
+
+    def __getitem__(self, i):
+        return (self.ids[i], title_table.values[self.title_codes[i]], tags_table.values[self.tags_codes[i]],
+                computer_table.values[self.computer_codes[i]], user_table.values[self.user_codes[i]],
+                event_table.values[self.event_codes[i]], provider_table.values[self.provider_codes[i]],
+                from_epoch(self.system_times[i]))
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self[i]
+
+    def decode(self, field):
+        """Decode one categorical column to a list of (shared, interned) strings."""
+        table, column = batch_columns[field]
+        values = table.values
+        return [values[code] for code in getattr(self, column)]
+
+# Categorical field -> (intern table, AlertBatch column)
+batch_columns = {
+    "title": (title_table, "title_codes"),
+    "tags": (tags_table, "tags_codes"),
+    "computer_name": (computer_table, "computer_codes"),
+    "user_id": (user_table, "user_codes"),
+    "event_id": (event_table, "event_codes"),
+    "provider_name": (provider_table, "provider_codes"),
+}
+
+def as_batch(data):
+    """Return data as an AlertBatch, converting fetch_data-shaped rows if needed."""
+    if isinstance(data, AlertBatch):
+        return data
+    return AlertBatch.from_rows(data)
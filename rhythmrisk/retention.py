@@ -0,0 +1,354 @@
+import os
+import time
+import argparse
+import logging
+import schedule
+from datetime import datetime, timedelta
+from . import configure_logging, db
+from .cluster_profile import ProfileDeltas, apply_profile_deltas
+from .dimensions import dimension_cache_seconds, dimensions
+
+logger = logging.getLogger()
+
+# Retention configuration
+retention_days = int(os.getenv("RETENTION_DAYS", "7"))
+retention_interval_hours = int(os.getenv("RETENTION_INTERVAL_HOURS", "12"))
+# Rows per delete transaction and the pause between transactions when a table is not partitioned
+retention_batch_size = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+retention_pause_seconds = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.5"))
+# Daily partitions created ahead of today on partitioned tables
+partitions_ahead = int(os.getenv("RETENTION_PARTITIONS_AHEAD", "3"))
+# Hours a dimension value must stay unreferenced by sigma_alerts before it is deleted; at
+# least twice the ingesters' dimension cache lifetime
+dimension_grace_hours = max(float(os.getenv("RETENTION_DIMENSION_GRACE_HOURS", "24")), 2 * dimension_cache_seconds / 3600)
+
+class RetentionPolicy:
+    """How old rows leave one table: by the time column, via partitions or index-driven batches."""
+
+    def __init__(self, table, time_column, key_column="id", partitionable=False, profiled=False):
+        self.table = table
+        self.time_column = time_column
+        self.key_column = key_column
+        # Only tables whose unique keys can include time_column may be range partitioned
+        self.partitionable = partitionable
+        # Deleted rows are subtracted from cluster_profile by their dbscan_cluster
+        self.profiled = profiled
+
+# Every table the pipeline writes, in the order they are cleaned
+retention_policies = [
+    RetentionPolicy("sigma_alerts", "system_time", partitionable=True, profiled=True),
+    RetentionPolicy("dbscan_outlier", "system_time"),
+    RetentionPolicy("cluster_profile", "last_seen", key_column="cluster_id"),
+    # Completed ingest_file_lease rows are kept: they are what stops a file being read twice
+    RetentionPolicy("ingest_worker", "heartbeat_at", key_column="worker_id"),
+]
+# The dim_* tables have no time column: expire_dimension_values removes what sigma_alerts no longer references
+
+class RetentionReport:
+    """Rows removed and time spent holding locks, per table."""
+
+    def __init__(self):
+        self.rows = {}
+        self.lock_seconds = {}
+        self.partitions = {}
+
+    def add(self, table, rows, lock_seconds, partitions=0):
+        self.rows[table] = self.rows.get(table, 0) + rows
+        self.lock_seconds[table] = self.lock_seconds.get(table, 0.0) + lock_seconds
+        self.partitions[table] = self.partitions.get(table, 0) + partitions
+
+    def log(self, cutoff):
+        for table in self.rows:
+            logger.info(
+                f"Retention {table}: removed {self.rows[table]} rows older than {cutoff:%Y-%m-%d %H:%M:%S}"
+                f"{f' ({self.partitions[table]} partitions dropped)' if self.partitions[table] else ''}, "
+                f"locks held {self.lock_seconds[table]:.2f}s."
+            )
+
+def partition_name(day):
+    return f"p{day:%Y%m%d}"
+
+def partition_day(name):
+    """Day of a partition_name() partition, or None for any other name."""
+    if len(name) != 9 or name[0] != "p" or not name[1:].isdigit():
+        return None
+    try:
+        return datetime.strptime(name[1:], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def partition_bound(day):
+    """VALUES LESS THAN bound of the partition holding day: the start of the next day."""
+    return f"TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}')"
+
+def daily_partitions(cursor, table):
+    """Names and days of the daily partitions of table, oldest first; empty if it is not partitioned."""
+    cursor.execute("""
+    SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        if name == "pmax":
+            continue
+        day = partition_day(name)
+        if day is None:
+            # Partitions added by hand keep their data; only pYYYYMMDD partitions are ever dropped
+            logger.warning(f"Ignoring partition '{name}' of '{table}': not a daily pYYYYMMDD partition.")
+            continue
+        partitions.append((name, day))
+    return partitions, "pmax" in names
+
+def ensure_time_index(cursor, policy):
+    """Add an index on the time column so batched deletes never scan the table."""
+    index = f"idx_{policy.table}_{policy.time_column}"
+    cursor.execute(f"SHOW INDEX FROM {policy.table} WHERE Column_name = %s AND Seq_in_index = 1", (policy.time_column,))
+    if not cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {policy.table} ADD INDEX {index} ({policy.time_column}), ALGORITHM=INPLACE, LOCK=NONE")
+        logger.info(f"Added index '{index}' to '{policy.table}'.")
+
+def partition_table(connection, policy):
+    """Convert a table to daily RANGE partitions on its time column.
+
+    This rebuilds the table (the primary key becomes (id, time column), which MySQL requires
+    of partitioned tables), so run it once in a maintenance window. Returns False if the
+    backend refuses, in which case retention keeps using batched deletes.
+    """
+    with connection.cursor() as cursor:
+        if daily_partitions(cursor, policy.table)[0]:
+            logger.info(f"'{policy.table}' is already partitioned.")
+            return True
+        cursor.execute(f"SELECT SUM({policy.time_column} IS NULL), MIN({policy.time_column}) FROM {policy.table}")
+        null_rows, oldest = cursor.fetchone()
+        if null_rows:
+            logger.error(f"Cannot partition '{policy.table}': {null_rows} rows have no {policy.time_column}.")
+            return False
+
+        today = datetime.now().date()
+        first_day = oldest.date() if oldest else today
+        days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days + partitions_ahead + 1)]
+        partitions = ", ".join(f"PARTITION {partition_name(day)} VALUES LESS THAN ({partition_bound(day)})" for day in days)
+        start = time.perf_counter()
+        try:
+            cursor.execute(f"""
+            ALTER TABLE {policy.table}
+                MODIFY {policy.time_column} DATETIME NOT NULL,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY ({policy.key_column}, {policy.time_column})
+            PARTITION BY RANGE (TO_DAYS({policy.time_column})) ({partitions}, PARTITION pmax VALUES LESS THAN MAXVALUE)
+            """)
+        except db.Error as e:
+            logger.error(f"Partitioning '{policy.table}' is not supported here, keeping batched deletes: {e}")
+            return False
+    logger.info(f"Partitioned '{policy.table}' into {len(days)} daily partitions in {time.perf_counter() - start:.1f} seconds.")
+    return True
+
+def add_future_partitions(cursor, policy, partitions):
+    """Split pmax so there is a daily partition up to partitions_ahead days from now."""
+    last_day = partitions[-1][1] if partitions else datetime.now().date()
+    target = datetime.now().date() + timedelta(days=partitions_ahead)
+    days = [last_day + timedelta(days=offset) for offset in range(1, (target - last_day).days + 1)]
+    if not days:
+        return
+    new_partitions = ", ".join(f"PARTITION {partition_name(day)} VALUES LESS THAN ({partition_bound(day)})" for day in days)
+    cursor.execute(f"ALTER TABLE {policy.table} REORGANIZE PARTITION pmax INTO ({new_partitions}, PARTITION pmax VALUES LESS THAN MAXVALUE)")
+    logger.info(f"Added {len(days)} daily partitions to '{policy.table}'.")
+
+def create_retention_tables(cursor):
+    """Create retention_partition_adjustment, the partitions whose cluster_profile deltas are already applied."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS retention_partition_adjustment (
+        table_name VARCHAR(64) NOT NULL,
+        partition_name VARCHAR(64) NOT NULL,
+        adjusted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (table_name, partition_name)
+    );
+    """)
+
+def drop_expired_partitions(connection, policy, partitions, cutoff, report):
+    """Drop the daily partitions that end at or before cutoff.
+
+    Retention is day-granular here: the partition still holding cutoff is kept until its
+    whole day has expired. DROP PARTITION commits implicitly, so a profiled table's
+    cluster_profile deltas are applied first, in one transaction with a record in
+    retention_partition_adjustment; a pass that fails before the drop leaves the record,
+    and the retry drops the partition without subtracting its rows twice.
+    """
+    expired = [name for name, day in partitions if day + timedelta(days=1) <= cutoff.date()]
+    if not expired:
+        return
+    with connection.cursor() as cursor:
+        adjusted = set()
+        if policy.profiled:
+            cursor.execute("SELECT partition_name FROM retention_partition_adjustment WHERE table_name = %s", (policy.table,))
+            adjusted = {row[0] for row in cursor.fetchall()}
+        rows = 0
+        deltas = ProfileDeltas()
+        for name in expired:
+            if policy.profiled:
+                cursor.execute(f"SELECT dbscan_cluster, COUNT(*) FROM {policy.table} PARTITION ({name}) GROUP BY dbscan_cluster")
+            else:
+                cursor.execute(f"SELECT NULL, COUNT(*) FROM {policy.table} PARTITION ({name})")
+            for cluster_id, count in cursor.fetchall():
+                rows += count
+                if cluster_id is not None and name not in adjusted:
+                    deltas[cluster_id].remove(count)
+
+        pending = [name for name in expired if name not in adjusted]
+        if policy.profiled and pending:
+            start = time.perf_counter()
+            apply_profile_deltas(cursor, deltas)
+            cursor.executemany(
+                "INSERT INTO retention_partition_adjustment (table_name, partition_name) VALUES (%s, %s)",
+                [(policy.table, name) for name in pending]
+            )
+            connection.commit()
+            report.add("cluster_profile", 0, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        cursor.execute(f"ALTER TABLE {policy.table} DROP PARTITION {', '.join(expired)}")
+        report.add(policy.table, rows, time.perf_counter() - start, len(expired))
+        if policy.profiled:
+            cursor.execute(
+                f"DELETE FROM retention_partition_adjustment WHERE table_name = %s AND partition_name IN ({', '.join(['%s'] * len(expired))})",
+                [policy.table] + expired
+            )
+            connection.commit()
+
+def delete_in_batches(connection, policy, cutoff, report):
+    """Delete rows older than cutoff through the time index, one short transaction per batch."""
+    with connection.cursor() as cursor:
+        while True:
+            start = time.perf_counter()
+            # Locking the selected rows keeps a concurrent relabel from changing the clusters counted below
+            columns = f"{policy.key_column}, dbscan_cluster" if policy.profiled else policy.key_column
+            cursor.execute(
+                f"SELECT {columns} FROM {policy.table} WHERE {policy.time_column} < %s "
+                f"ORDER BY {policy.time_column} LIMIT %s FOR UPDATE",
+                (cutoff, retention_batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                connection.commit()
+                break
+            keys = [row[0] for row in rows]
+            cursor.execute(f"DELETE FROM {policy.table} WHERE {policy.key_column} IN ({', '.join(['%s'] * len(keys))})", keys)
+            if policy.profiled:
+                deltas = ProfileDeltas()
+                for _, cluster_id in rows:
+                    if cluster_id is not None:
+                        deltas[cluster_id].remove()
+                apply_profile_deltas(cursor, deltas)
+            connection.commit()
+            report.add(policy.table, len(rows), time.perf_counter() - start)
+
+            if len(rows) < retention_batch_size:
+                break
+            # Give ingestion a window to take the locks between batches
+            time.sleep(retention_pause_seconds)
+
+def expire_dimension_values(connection, report):
+    """Delete dimension values sigma_alerts has not referenced for dimension_grace_hours.
+
+    Each pass deletes values marked orphaned at least the grace period ago and still
+    unreferenced, then marks the newly unreferenced ones. A process resolving a marked value
+    clears its mark, and dimension caches live shorter than the grace period, so a deleted
+    id can no longer be written by anyone.
+    """
+    with connection.cursor() as cursor:
+        for table, key in dimensions.values():
+            start = time.perf_counter()
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS referenced_dimension_ids")
+            cursor.execute("CREATE TEMPORARY TABLE referenced_dimension_ids (id INT PRIMARY KEY)")
+            cursor.execute(f"INSERT IGNORE INTO referenced_dimension_ids SELECT DISTINCT {key} FROM sigma_alerts WHERE {key} IS NOT NULL")
+            cursor.execute(f"""
+            UPDATE {table} d JOIN referenced_dimension_ids r ON r.id = d.id
+            SET d.orphaned_at = NULL
+            WHERE d.orphaned_at IS NOT NULL
+            """)
+            cursor.execute(f"""
+            DELETE d FROM {table} d LEFT JOIN referenced_dimension_ids r ON r.id = d.id
+            WHERE r.id IS NULL AND d.orphaned_at < NOW() - INTERVAL %s SECOND
+            """, (int(dimension_grace_hours * 3600),))
+            deleted = cursor.rowcount
+            cursor.execute(f"""
+            UPDATE {table} d LEFT JOIN referenced_dimension_ids r ON r.id = d.id
+            SET d.orphaned_at = NOW()
+            WHERE r.id IS NULL AND d.orphaned_at IS NULL
+            """)
+            connection.commit()
+            cursor.execute("DROP TEMPORARY TABLE referenced_dimension_ids")
+            report.add(table, deleted, time.perf_counter() - start)
+
+def apply_retention(policies=None, days=None):
+    """Remove rows older than the retention period from every table and return the report."""
+    cutoff = datetime.now() - timedelta(days=retention_days if days is None else days)
+    report = RetentionReport()
+    connection = None
+    try:
+        connection = db.connect()
+        for policy in policies or retention_policies:
+            try:
+                with connection.cursor() as cursor:
+                    partitions, has_pmax = daily_partitions(cursor, policy.table)
+                    if partitions and has_pmax:
+                        add_future_partitions(cursor, policy, partitions)
+                    elif not partitions:
+                        ensure_time_index(cursor, policy)
+                if partitions:
+                    drop_expired_partitions(connection, policy, partitions, cutoff, report)
+                else:
+                    delete_in_batches(connection, policy, cutoff, report)
+            except db.Error as e:
+                connection.rollback()
+                logger.error(f"Error applying retention to '{policy.table}': {e}")
+        if policies is None:
+            try:
+                expire_dimension_values(connection, report)
+            except db.Error as e:
+                connection.rollback()
+                logger.error(f"Error expiring dimension values: {e}")
+        report.log(cutoff)
+    except db.Error as e:
+        logger.error(f"Error applying retention: {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+    return report
+
+# Apply retention at startup, then every retention_interval_hours
+def schedule_retention():
+    schedule.every(retention_interval_hours).hours.do(apply_retention)
+    logger.info(f"Scheduled retention of {retention_days} days every {retention_interval_hours} hours.")
+    # A process restarted more often than the interval would otherwise never clean up
+    apply_retention()
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Apply the retention policy to every table the pipeline writes.")
+    parser.add_argument("--days", type=int, default=retention_days, help="Keep rows newer than this many days")
+    parser.add_argument("--partition", action="store_true",
+                        help="Convert the partitionable tables to daily partitions first (rebuilds them; run in a maintenance window)")
+    args = parser.parse_args()
+
+    if args.partition:
+        connection = None
+        try:
+            connection = db.connect()
+            for policy in retention_policies:
+                if policy.partitionable:
+                    partition_table(connection, policy)
+        except db.Error as e:
+            logger.error(f"Error partitioning tables: {e}")
+        finally:
+            if connection and connection.is_connected():
+                connection.close()
+    apply_retention(days=args.days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import logging
+from . import configure_logging
+from . import db
+from .dimensions import ensure_dimension_layout
+from .cluster_profile import create_cluster_profile_table
+from .leases import create_lease_tables
+from .retention import create_retention_tables
+
+logger = logging.getLogger()
+
+# Initialize SQL tables
+def initialize_sql_tables():
+    """Create the normalized sigma_alerts layout and the dbscan_outlier table, migrating a flat sigma_alerts if present."""
+    connection = None
+    try:
+        connection = db.connect()
+        ensure_dimension_layout(connection)
+        with connection.cursor() as cursor:
+            # Create dbscan_outlier table
+            create_dbscan_outlier_query = """
+            CREATE TABLE IF NOT EXISTS dbscan_outlier (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                alert_id INT UNIQUE,
+                title VARCHAR(255),
+                tags TEXT,
+                description TEXT,
+                system_time DATETIME,
+                computer_name VARCHAR(100),
+                user_id VARCHAR(100),
+                event_id VARCHAR(50),
+                provider_name VARCHAR(100),
+                dbscan_cluster INT
+            );
+            """
+            cursor.execute(create_dbscan_outlier_query)
+
+            # Create cluster_profile table
+            create_cluster_profile_table(cursor)
+
+            # Create ingest_file_lease and ingest_worker tables
+            create_lease_tables(cursor)
+
+            # Create the table retention records applied profile adjustments in
+            create_retention_tables(cursor)
+
+            connection.commit()
+            logger.info("Initialized SQL tables 'sigma_alerts', 'dbscan_outlier', 'cluster_profile', the ingest lease tables and the retention bookkeeping table.")
+    except db.Error as e:
+        logger.error(f"Error initializing SQL tables: {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+# Ensure columns exist
+def ensure_column_exists(table_name, column_name, column_definition):
+    """Ensure the specified column exists in the given table."""
+    connection = None
+    try:
+        connection = db.connect()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SHOW COLUMNS FROM {table_name} LIKE '{column_name}'")
+            result = cursor.fetchone()
+            if not result:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
+                connection.commit()
+                logger.info(f"Added '{column_name}' column to '{table_name}' table.")
+    except db.Error as e:
+        logger.error(f"Error ensuring '{column_name}' column exists in '{table_name}': {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
+def main():
+    configure_logging()
+    initialize_sql_tables()
+    ensure_column_exists("sigma_alerts", "dbscan_cluster", "INT")
+    ensure_column_exists("dbscan_outlier", "dbscan_cluster", "INT")
+    ensure_column_exists("dbscan_outlier", "alert_id", "INT UNIQUE")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import os
+import sys
+import time
+import zlib
+import fcntl
+import struct
+import logging
+import argparse
+import threading
+from . import configure_logging
+from .records import AlertRecord, to_epoch, from_epoch
+
+logger = logging.getLogger()
+
+# Spool configuration
+spool_enabled = os.getenv("SPOOL_ENABLED", "1") == "1"
+spool_dir = os.getenv("SPOOL_DIR", "spool")
+# A segment is sealed and a new one started once it reaches this size
+spool_segment_bytes = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# fsync every append; turning it off trades crash safety for throughput on slow disks
+spool_fsync = os.getenv("SPOOL_FSYNC", "1") == "1"
+
+# Frame header: payload length, CRC-32 of spooled_at + payload, spooled_at (epoch seconds)
+frame_header = struct.Struct("<IId")
+# Payload prefix: has line hash, line hash, system_time epoch seconds
+record_header = struct.Struct("<?Qq")
+string_length = struct.Struct("<i")
+segment_suffix = ".seg"
+
+def encode_record(record):
+    """Compact binary form of an AlertRecord: fixed fields, then length-prefixed strings (-1 is None)."""
+    parts = [record_header.pack(record.line_hash is not None, record.line_hash or 0, to_epoch(record.system_time))]
+    for value in (record.title, record.tags, record.description, record.computer_name,
+                  record.user_id, record.event_id, record.provider_name):
+        if value is None:
+            parts.append(string_length.pack(-1))
+        else:
+            encoded = value.encode("utf-8")
+            parts.append(string_length.pack(len(encoded)))
+            parts.append(encoded)
+    return b"".join(parts)
+
+def decode_record(payload):
+    has_hash, hash_value, epoch = record_header.unpack_from(payload)
+    offset = record_header.size
+    values = []
+    for _ in range(7):
+        (length,) = string_length.unpack_from(payload, offset)
+        offset += string_length.size
+        if length < 0:
+            values.append(None)
+        else:
+            values.append(payload[offset:offset + length].decode("utf-8"))
+            offset += length
+    title, tags, description, computer_name, user_id, event_id, provider_name = values
+    return AlertRecord(title, tags, description, from_epoch(epoch), computer_name, user_id, event_id,
+                       provider_name, hash_value if has_hash else None)
+
+def read_frame(file):
+    """Next (spooled_at, payload) in file, or None at the end of the valid frames.
+
+    A short or mismatching frame is the tail of an interrupted write, or corruption;
+    read_frames decides whether to stop there or skip past it.
+    """
+    header = file.read(frame_header.size)
+    if len(header) < frame_header.size:
+        return None
+    length, checksum, spooled_at = frame_header.unpack(header)
+    # A corrupt length must not turn into a multi-gigabyte read
+    if length > 1 << 20 and length > os.fstat(file.fileno()).st_size - file.tell():
+        return None
+    payload = file.read(length)
+    if len(payload) < length or zlib.crc32(header[8:] + payload) != checksum:
+        return None
+    return spooled_at, payload
+
+def find_next_frame(file, start):
+    """Offset of the first frame after byte start whose checksum validates, or None if there is none."""
+    file.seek(start + 1)
+    data = memoryview(file.read())
+    for index in range(len(data) - frame_header.size + 1):
+        length, checksum, _ = frame_header.unpack_from(data, index)
+        end = index + frame_header.size + length
+        if end <= len(data) and zlib.crc32(data[index + 8:end]) == checksum:
+            return start + 1 + index
+    return None
+
+def read_frames(file, resync, path=None):
+    """Yield (end offset, spooled_at, payload) for the valid frames from the file's position on.
+
+    Reading stops at a bad frame, which in the segment being written may be an append in
+    progress. With resync (a sealed segment nothing writes to any more) the bad bytes are
+    skipped instead, up to the next frame whose checksum validates; path is given to log that.
+    """
+    while True:
+        offset = file.tell()
+        frame = read_frame(file)
+        if frame is not None:
+            yield file.tell(), frame[0], frame[1]
+            continue
+        if not resync or offset >= os.fstat(file.fileno()).st_size:
+            return
+        resumed = find_next_frame(file, offset)
+        if path is not None:
+            where = f"resuming at byte {resumed}" if resumed is not None else "nothing valid follows"
+            logger.error(f"Skipping unreadable data at byte {offset} of sealed spool segment {path}; {where}.")
+        if resumed is None:
+            return
+        file.seek(resumed)
+
+class Spool:
+    """Append-only, segmented, checksummed local queue of parsed alerts.
+
+    The ingester appends records and only then advances its bookmark or checkpoint, so
+    reading log files never waits on MySQL. A drainer replays the records in large batches
+    and commits its position to the cursor file once a batch is in the database; segments
+    behind the cursor are deleted. A crash between a batch's insert and its cursor commit
+    replays that batch, which the sigma_alerts line-hash key turns into a no-op.
+
+    One process writes a spool directory and one drainer reads it (drain_lock() enforces
+    the latter).
+    """
+
+    def __init__(self, directory=spool_dir, segment_bytes=spool_segment_bytes, fsync=spool_fsync):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.writer = None
+        self.writer_seq = None
+        self.appended = 0
+        self.drained = 0
+
+    def segment_path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}{segment_suffix}")
+
+    def segments(self):
+        """Sequence numbers of the segments on disk, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(segment_suffix)]) for name in names
+                      if name.endswith(segment_suffix) and name[:-len(segment_suffix)].isdigit())
+
+    def open_writer(self):
+        """Open the newest segment for appending, cutting off a torn frame left by a crash."""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.segments()
+        seq = segments[-1] if segments else max(self.read_cursor()[0], 1)
+        path = self.segment_path(seq)
+        valid = 0
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                while read_frame(file) is not None:
+                    valid = file.tell()
+            if valid < os.path.getsize(path):
+                logger.warning(f"Truncating {os.path.getsize(path) - valid} bytes of an incomplete frame from {path}.")
+                os.truncate(path, valid)
+        self.writer = open(path, "ab")
+        self.writer_seq = seq
+
+    def append(self, records):
+        """Durably append records; raises OSError if the spool cannot be written."""
+        if not records:
+            return 0
+        now = time.time()
+        frames = []
+        for record in records:
+            payload = encode_record(record)
+            stamp = struct.pack("<d", now)
+            frames.append(frame_header.pack(len(payload), zlib.crc32(stamp + payload), now))
+            frames.append(payload)
+        with self.lock:
+            if self.writer is None:
+                self.open_writer()
+            elif self.writer.tell() >= self.segment_bytes:
+                self.writer.close()
+                self.writer = open(self.segment_path(self.writer_seq + 1), "ab")
+                self.writer_seq += 1
+            self.writer.write(b"".join(frames))
+            self.writer.flush()
+            if self.fsync:
+                os.fsync(self.writer.fileno())
+            self.appended += len(records)
+        return len(records)
+
+    def end_position(self):
+        """(segment, offset) just past the last appended frame; the cursor reaches it once they are all drained."""
+        with self.lock:
+            if self.writer is None:
+                self.open_writer()
+            return self.writer_seq, self.writer.tell()
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+    def cursor_path(self):
+        return os.path.join(self.directory, "cursor")
+
+    def read_cursor(self):
+        """(segment, offset) of the first record not yet in the database."""
+        try:
+            with open(self.cursor_path()) as file:
+                seq, offset = file.read().split()
+                return int(seq), int(offset)
+        except FileNotFoundError:
+            segments = self.segments()
+            return (segments[0] if segments else 1), 0
+        except ValueError as e:
+            # Replaying from the oldest segment is safe; skipping records is not
+            logger.error(f"Ignoring unreadable spool cursor {self.cursor_path()}: {e}")
+            segments = self.segments()
+            return (segments[0] if segments else 1), 0
+
+    def read(self, max_records, position=None):
+        """Up to max_records records from position (default: the cursor) and the position after them."""
+        seq, offset = position or self.read_cursor()
+        records = []
+        while len(records) < max_records:
+            path = self.segment_path(seq)
+            sealed = any(later > seq for later in self.segments())
+            try:
+                with open(path, "rb") as file:
+                    file.seek(offset)
+                    for end, _, payload in read_frames(file, sealed, path):
+                        records.append(decode_record(payload))
+                        offset = end
+                        if len(records) >= max_records:
+                            break
+            except FileNotFoundError:
+                pass
+            if len(records) >= max_records or not sealed:
+                break
+            seq, offset = min(later for later in self.segments() if later > seq), 0
+        return records, (seq, offset)
+
+    def commit(self, position):
+        """Record that everything before position is in the database and delete finished segments."""
+        temp_path = self.cursor_path() + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(f"{position[0]} {position[1]}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.cursor_path())
+        for seq in self.segments():
+            if seq < position[0]:
+                os.remove(self.segment_path(seq))
+
+    def drain_lock(self):
+        """Exclusive, non-blocking lock held by the one drainer of this directory; None if taken."""
+        os.makedirs(self.directory, exist_ok=True)
+        file = open(os.path.join(self.directory, "drain.lock"), "w")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return None
+        return file
+
+    def stats(self):
+        """Depth and lag of the spool, read from disk so any process can report them."""
+        seq, offset = self.read_cursor()
+        pending_bytes = pending_records = 0
+        oldest = None
+        segments = [s for s in self.segments() if s >= seq]
+        for segment in segments:
+            try:
+                with open(self.segment_path(segment), "rb") as file:
+                    file.seek(offset if segment == seq else 0)
+                    # Only frames the drainer will replay count, so corrupt data is not reported as pending
+                    for _, spooled_at, payload in read_frames(file, segment != segments[-1]):
+                        pending_records += 1
+                        pending_bytes += frame_header.size + len(payload)
+                        if oldest is None:
+                            oldest = spooled_at
+            except FileNotFoundError:
+                pass
+        return {
+            "spool_segments": len(segments),
+            "spool_pending_records": pending_records,
+            "spool_pending_bytes": pending_bytes,
+            "spool_lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "spool_appended_records": self.appended,
+            "spool_drained_records": self.drained,
+        }
+
+def main():
+    """Report spool depth and lag, or drain a spool to the database once."""
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Inspect or drain the ingest write-ahead spool.")
+    parser.add_argument("action", choices=["status", "drain"])
+    parser.add_argument("--dir", default=spool_dir, help="Spool directory (workers use <SPOOL_DIR>.<worker_id>)")
+    args = parser.parse_args()
+
+    spool = Spool(args.dir)
+    if args.action == "status":
+        # Prometheus text format, so a textfile collector can scrape it
+        for name, value in spool.stats().items():
+            if name not in ("spool_appended_records", "spool_drained_records"):
+                print(f"{name} {value}")
+        return
+
+    from .ingest import configure, drain_spool
+    configure()
+    lock = spool.drain_lock()
+    if lock is None:
+        logger.error(f"Another process is draining {args.dir}.")
+        sys.exit(1)
+    try:
+        drained = drain_spool(spool)
+        logger.info(f"Drained {drained} records from {args.dir}.")
+    finally:
+        lock.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import csv
+import json
+import hashlib
+import argparse
+import logging
+import time
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import StandardScaler
+
+from . import configure_logging, clustering
+
+logger = logging.getLogger()
+
+def feature_matrix(rows):
+    """Build the scaled matrix run_dbscan would cluster, honouring PROJECTION_COMPONENTS and RATE_FEATURES."""
+    return StandardScaler().fit_transform(clustering.build_features(rows))
+
+def fingerprint(matrix, max_eps, max_k):
+    digest = hashlib.sha1(np.ascontiguousarray(matrix).tobytes())
+    digest.update(f"{matrix.shape}|{max_eps}|{max_k}".encode())
+    return digest.hexdigest()
+
+def compute_neighbors(matrix, max_eps, max_k, cache_path):
+    """Compute (or load from cache) the k-NN distances and the max_eps radius graph of matrix.
+
+    The radius graph is stored CSR-style with each row's distances sorted, so every smaller
+    eps is a prefix and never needs another neighbor search.
+    """
+    key = fingerprint(matrix, max_eps, max_k)
+    if cache_path and os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if str(cached["fingerprint"]) == key:
+            logger.info(f"Reusing cached neighborhoods from {cache_path}.")
+            return cached["knn_distances"], cached["indptr"], cached["indices"], cached["distances"]
+        logger.info(f"Cache {cache_path} was computed for a different matrix; recomputing.")
+
+    start = time.perf_counter()
+    model = NearestNeighbors().fit(matrix)
+    knn_distances, _ = model.kneighbors(matrix, n_neighbors=min(max_k, len(matrix)))
+    radius_distances, radius_indices = model.radius_neighbors(matrix, radius=max_eps, sort_results=True)
+    lengths = np.fromiter((len(row) for row in radius_indices), dtype=np.int64, count=len(radius_indices))
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    indices = np.concatenate(radius_indices) if len(radius_indices) else np.empty(0, dtype=np.int64)
+    distances = np.concatenate(radius_distances) if len(radius_distances) else np.empty(0)
+    logger.info(f"Computed neighborhoods for {len(matrix)} points ({len(indices)} pairs within {max_eps}) in {time.perf_counter() - start:.1f} seconds.")
+
+    if cache_path:
+        np.savez(cache_path, fingerprint=key, knn_distances=knn_distances, indptr=indptr, indices=indices, distances=distances)
+    return knn_distances, indptr, indices, distances
+
+def evaluate(indptr, indices, distances, eps, min_samples):
+    """Cluster count and noise count DBSCAN would produce for eps/min_samples, from the cached graph."""
+    n = len(indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    within = distances <= eps
+    # Like sklearn, a point's neighborhood includes the point itself
+    counts = np.bincount(rows[within], minlength=n)
+    core = counts >= min_samples
+
+    core_edges = within & core[rows] & core[indices]
+    graph = sparse.csr_matrix((np.ones(core_edges.sum(), dtype=np.int8), (rows[core_edges], indices[core_edges])), shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+    clusters = len(np.unique(components[core])) if core.any() else 0
+
+    reaches_core = np.bincount(rows[within & core[indices]], minlength=n) > 0
+    noise = int(np.sum(~core & ~reaches_core))
+    return clusters, noise
+
+def write_k_distance(knn_distances, ks, path):
+    """Write the sorted k-distance curve for each k (descending, as usually plotted)."""
+    curves = {k: np.sort(knn_distances[:, k - 1])[::-1] for k in ks if k <= knn_distances.shape[1]}
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["rank"] + [f"k{k}" for k in curves])
+        for rank in range(len(knn_distances)):
+            writer.writerow([rank] + [f"{curve[rank]:.6f}" for curve in curves.values()])
+    return curves
+
+def knee(curve):
+    """Point of the descending curve farthest from the chord between its ends."""
+    if len(curve) < 3:
+        return float(curve[-1]) if len(curve) else 0.0
+    x = np.arange(len(curve), dtype=np.float64)
+    start, end = np.array([0.0, curve[0]]), np.array([x[-1], curve[-1]])
+    direction = (end - start) / np.linalg.norm(end - start)
+    offsets = np.column_stack((x, curve)) - start
+    distances = np.abs(offsets[:, 0] * direction[1] - offsets[:, 1] * direction[0])
+    return float(curve[int(np.argmax(distances))])
+
+def write_config(path, eps, min_samples, source):
+    config = {"eps": eps, "min_samples": min_samples, "selected_at": time.strftime("%Y-%m-%d %H:%M:%S"), "source": source}
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(config, file, indent=2)
+    os.replace(temp_path, path)
+    logger.info(f"Wrote eps={eps}, min_samples={min_samples} to {path}; the cluster command picks it up on its next start.")
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Tune DBSCAN eps/min_samples from one cached neighbor computation.")
+    parser.add_argument("--eps", type=float, nargs="+", default=[0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0])
+    parser.add_argument("--min-samples", type=int, nargs="+", default=[3, 5, 10, 20])
+    parser.add_argument("--cache", default="tuning_cache.npz", help="Neighborhood cache file ('' disables)")
+    parser.add_argument("--curve", default="k_distance.csv", help="Where to write the k-distance curves")
+    parser.add_argument("--select", nargs=2, metavar=("EPS", "MIN_SAMPLES"), help="Write these parameters to the config")
+    parser.add_argument("--target-noise", type=float, help="Write the grid point whose noise rate is closest to this")
+    parser.add_argument("--config", default=clustering.dbscan_config_path, help="Config file the cluster command reads at startup")
+    parser.add_argument("--synthetic", type=int, default=0, help="Tune on N synthetic alerts instead of sigma_alerts")
+    args = parser.parse_args()
+    # Build the projector and rate counters the cluster command would use
+    clustering.configure()
+
+    if args.synthetic:
+        from .benchmark import synthetic_rows
+        rows = synthetic_rows(args.synthetic)
+    else:
+        rows = clustering.fetch_data()
+    if not rows:
+        logger.warning("No data to tune on.")
+        return
+
+    matrix = feature_matrix(rows)
+    max_eps, max_k = max(args.eps), max(args.min_samples)
+    knn_distances, indptr, indices, distances = compute_neighbors(matrix, max_eps, max_k, args.cache)
+
+    curves = write_k_distance(knn_distances, sorted(set(args.min_samples)), args.curve)
+    print(f"rows={len(rows)} width={matrix.shape[1]} k-distance curves written to {args.curve}")
+    for k, curve in curves.items():
+        print(f"k={k:<3} knee eps ~ {knee(curve):.3f}")
+
+    print(f"{'eps':>6} {'min_samples':>11} {'clusters':>8} {'noise':>8} {'noise_rate':>10}")
+    results = []
+    for eps in sorted(args.eps):
+        for min_samples in sorted(args.min_samples):
+            clusters, noise = evaluate(indptr, indices, distances, eps, min_samples)
+            results.append((eps, min_samples, clusters, noise / len(rows)))
+            print(f"{eps:>6.3f} {min_samples:>11} {clusters:>8} {noise:>8} {noise / len(rows):>10.4f}")
+
+    if args.select:
+        write_config(args.config, float(args.select[0]), int(args.select[1]), "manual")
+    elif args.target_noise is not None:
+        candidates = [result for result in results if result[2] > 0] or results
+        eps, min_samples, _, _ = min(candidates, key=lambda result: abs(result[3] - args.target_noise))
+        write_config(args.config, eps, min_samples, f"target_noise={args.target_noise}")
+
+if __name__ == "__main__":
+    main()
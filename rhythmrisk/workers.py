@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from . import configure_logging, db, ingest
+from .leases import Heartbeat, LeaseStore
+from .profiling import configure_from_args, maybe_profile
+from .records import compact_intern_tables, intern_scope
+from .retention import schedule_retention
+from .schema import initialize_sql_tables
+
+logger = logging.getLogger()
+
+# Worker configuration
+worker_poll_seconds = float(os.getenv("INGEST_POLL_SECONDS", "5"))
+# Lines read between checkpoints of a leased file
+checkpoint_lines = int(os.getenv("INGEST_CHECKPOINT_LINES", "1000"))
+# Seconds between looks at the spool cursor while a finished file waits for the drainer
+drain_wait_seconds = float(os.getenv("INGEST_DRAIN_WAIT_SECONDS", "0.2"))
+
+def checkpoint_drained(store, lease, spooled):
+    """Checkpoint the furthest file offset whose spooled records the drainer has committed to MySQL.
+
+    spooled holds (spool end position, file offset) pairs, oldest first. Returns False if
+    the lease was lost.
+    """
+    cursor = ingest.spool.read_cursor()
+    drained = None
+    while spooled and spooled[0][0] <= cursor:
+        drained = spooled.popleft()[1]
+    if lease.lost:
+        return False
+    if drained is None:
+        return True
+    return store.checkpoint(lease, drained)
+
+def wait_for_drainer(lease, position):
+    """Block until the spool cursor reaches position; False if the lease is lost meanwhile."""
+    while ingest.spool.read_cursor() < position:
+        if lease.lost:
+            return False
+        time.sleep(drain_wait_seconds)
+    return not lease.lost
+
+def process_leased_file(store, lease, folder, floor, heartbeat=None):
+    """Ingest a leased file from its checkpoint, checkpointing every checkpoint_lines lines.
+
+    Returns the number of records accepted (spooled, unless SPOOL_ENABLED=0), or None if
+    the lease was lost. A checkpoint only covers records already in MySQL: with the spool,
+    offsets wait until the drainer's cursor passes their records, and the file is completed
+    once it has drained all of them. Replaying lines after a takeover is harmless: the
+    line-hash key drops them.
+    """
+    path = os.path.join(folder, lease.file_name)
+    sent = 0
+    offset = lease.offset
+    spooled = deque()
+    if lease.takeovers:
+        logger.info(f"Resuming {lease.file_name} at byte {offset} after {lease.takeovers} takeover(s).")
+    try:
+        with intern_scope(), open(path, "rb") as file:
+            file.seek(offset)
+            records, lines = [], 0
+            for raw in file:
+                offset += len(raw)
+                lines += 1
+                line = raw.decode("utf-8", errors="replace")
+                if line.strip():
+                    try:
+                        record = ingest.parse_line(line)
+                        if not floor or record.system_time >= floor:
+                            records.append(record)
+                    except Exception as e:
+                        logger.error(f"Failed to process line: {line.strip()} | Error: {e}")
+                if lines >= checkpoint_lines:
+                    sent += ingest.insert_unseen_records(records) if records else 0
+                    if ingest.spool is None:
+                        if lease.lost or not store.checkpoint(lease, offset):
+                            return None
+                    else:
+                        spooled.append((ingest.spool.end_position(), offset))
+                        if not checkpoint_drained(store, lease, spooled):
+                            return None
+                    records, lines = [], 0
+            if records:
+                sent += ingest.insert_unseen_records(records)
+    except FileNotFoundError:
+        logger.warning(f"Leased file {path} no longer exists; marking it done.")
+    if ingest.spool is not None and not wait_for_drainer(lease, ingest.spool.end_position()):
+        return None
+    if heartbeat is not None:
+        # A renewal racing complete() would find the row finished and report a takeover
+        heartbeat.set_lease(None)
+    if lease.lost or not store.complete(lease, offset):
+        return None
+    return sent
+
+def run_worker(worker_id, folder, drain=False):
+    """Claim and ingest files from folder until interrupted (or, with drain, until nothing is left)."""
+    configure_logging()
+    logger.info(f"Ingest worker {worker_id} watching {folder}.")
+    # Local state is per worker so processes never overwrite each other's files
+    ingest.configure(worker_id)
+    drainer = ingest.start_spool_drainer(ingest.spool) if ingest.spool is not None else None
+    # Single-process ingestion's bookmark still bounds what is re-read after switching modes
+    floor = ingest.read_last_processed_time()
+    process_file = maybe_profile(f"ingest-{worker_id}", process_leased_file)
+
+    store = LeaseStore(worker_id)
+    store.register_worker(socket.gethostname(), os.getpid())
+    heartbeat = Heartbeat(store)
+    heartbeat.start()
+    lease = None
+    try:
+        while True:
+            try:
+                store.register_files(name for name in os.listdir(folder) if os.path.isfile(os.path.join(folder, name)))
+                lease = store.claim()
+                if lease is None:
+                    if drain:
+                        break
+                    time.sleep(worker_poll_seconds)
+                    continue
+
+                heartbeat.set_lease(lease)
+                start = time.perf_counter()
+                sent = process_file(store, lease, folder, floor, heartbeat)
+                heartbeat.set_lease(None)
+                if sent is None:
+                    logger.warning(f"Stopped {lease.file_name}: lease lost to another worker.")
+                else:
+                    store.worker_progress(sent)
+                    logger.info(f"Ingested {lease.file_name}: {sent} records in {time.perf_counter() - start:.2f} seconds.")
+                lease = None
+                compact_intern_tables()
+            except (db.Error, OSError) as e:
+                logger.error(f"Worker {worker_id} error: {e}")
+                heartbeat.set_lease(None)
+                time.sleep(worker_poll_seconds)
+    except KeyboardInterrupt:
+        logger.info(f"Stopping worker {worker_id}.")
+    finally:
+        heartbeat.stop()
+        try:
+            if lease is not None and not lease.lost:
+                store.release(lease)
+        except db.Error as e:
+            logger.error(f"Error releasing lease on {lease.file_name}: {e}")
+        ingest.seen_lines.save(force=True)
+        if ingest.rate_counters is not None:
+            ingest.rate_counters.save(force=True)
+        if ingest.spool is not None:
+            # Leaves nothing behind for drain mode's exit, or for a worker id that never runs again
+            ingest.finish_spool(ingest.spool, drainer)
+        store.close()
+
+def start_retention_thread():
+    """Run the retention schedule in a daemon thread of this process."""
+    retention_thread = threading.Thread(target=schedule_retention)
+    retention_thread.daemon = True
+    retention_thread.start()
+    return retention_thread
+
+def main():
+    """Run one or more lease-coordinated ingest workers on this host."""
+    configure_logging()
+    if configure_from_args(sys.argv):
+        # Spawned workers re-import profiling and only see the environment
+        os.environ["PIPELINE_PROFILE"] = "1"
+    parser = argparse.ArgumentParser(description="Ingest LOG_FOLDER_PATH with lease-coordinated worker processes.")
+    parser.add_argument("--folder", default=ingest.log_folder, help="Folder shared by all workers")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes to start on this host")
+    parser.add_argument("--worker-prefix", default=socket.gethostname(), help="Worker ids are <prefix>-<n>; keep them stable across restarts")
+    parser.add_argument("--drain", action="store_true", help="Exit once every registered file is ingested")
+    parser.add_argument("--no-retention", action="store_true", help="Leave retention to another host")
+    args = parser.parse_args()
+
+    initialize_sql_tables()
+    worker_ids = [f"{args.worker_prefix}-{slot}" for slot in range(args.workers)]
+    if len(worker_ids) == 1:
+        if not args.no_retention and not args.drain:
+            start_retention_thread()
+        run_worker(worker_ids[0], args.folder, args.drain)
+        return
+
+    # Spawned, not forked: a fork copies whatever locks this process's threads hold at that moment
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(worker_id, args.folder, args.drain), name=worker_id)
+        for worker_id in worker_ids
+    ]
+    for process in processes:
+        process.start()
+    if not args.no_retention and not args.drain:
+        start_retention_thread()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Workers get the same SIGINT from the terminal and release their leases themselves
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
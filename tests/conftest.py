@@ -0,0 +1,2 @@
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mysql: needs a reachable MySQL server (DB_HOST, DB_USER, DB_PASSWORD); skipped otherwise")
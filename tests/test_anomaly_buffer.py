@@ -0,0 +1,65 @@
+import json
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from rhythmrisk.anomaly_service import AnomalyRingBuffer, anomaly_from_row, start_service
+
+def anomaly(i, computer="host-a", user="alice", title="Mimikatz"):
+    return {"system_time": f"2026-01-01 00:00:{i:02d}", "provider_name": "Sysmon", "title": title,
+            "tags": "attack", "description": "d", "computer_name": computer, "user_id": user, "event_id": "1"}
+
+def test_newest_first_and_limit():
+    buffer = AnomalyRingBuffer(10)
+    buffer.extend(anomaly(i) for i in range(5))
+    assert [a["system_time"][-2:] for a in buffer.query(limit=3)] == ["04", "03", "02"]
+
+def test_limit_zero_returns_nothing():
+    buffer = AnomalyRingBuffer(10)
+    buffer.append(anomaly(0))
+    assert buffer.query(limit=0) == []
+    assert buffer.query(limit=0, computer_name="host-a") == []
+
+def test_negative_limit_is_rejected():
+    with pytest.raises(ValueError):
+        AnomalyRingBuffer(10).query(limit=-1)
+
+@pytest.mark.parametrize("capacity", [0, -5])
+def test_capacity_must_be_positive(capacity):
+    with pytest.raises(ValueError):
+        AnomalyRingBuffer(capacity)
+
+def test_eviction_keeps_indexes_consistent():
+    buffer = AnomalyRingBuffer(3)
+    buffer.extend([anomaly(0, computer="old"), anomaly(1), anomaly(2), anomaly(3), anomaly(4, computer="old")])
+    assert len(buffer) == 3
+    assert [a["system_time"][-2:] for a in buffer.query(computer_name="old")] == ["04"]
+    assert buffer.stats()["distinct"]["computer_name"] == 2
+
+def test_filters_combine_and_since_applies():
+    buffer = AnomalyRingBuffer(10)
+    buffer.extend([anomaly(1, user="bob"), anomaly(2), anomaly(3, user="bob", title="Whoami")])
+    assert [a["title"] for a in buffer.query(user_id="bob")] == ["Whoami", "Mimikatz"]
+    assert buffer.query(user_id="bob", title="Mimikatz", since="2026-01-01 00:00:02") == []
+    assert buffer.query(user_id="nobody") == []
+
+def test_anomaly_from_row_stringifies():
+    row = ("2026-01-01 00:00:00", "Sysmon", "t", None, "d", "h", "u", 4624)
+    assert anomaly_from_row(row)["event_id"] == "4624"
+    assert anomaly_from_row(row)["tags"] is None
+
+def test_http_rejects_bad_limit():
+    buffer = AnomalyRingBuffer(10)
+    buffer.append(anomaly(0))
+    server = start_service(buffer, "127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urlopen(f"{url}/anomalies?limit=1") as response:
+            assert json.load(response)["count"] == 1
+        for bad in ("-1", "x"):
+            with pytest.raises(HTTPError) as error:
+                urlopen(f"{url}/anomalies?limit={bad}")
+            assert error.value.code == 400
+    finally:
+        server.shutdown()
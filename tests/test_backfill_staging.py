@@ -0,0 +1,132 @@
+from datetime import datetime
+
+from rhythmrisk import backfill
+
+def test_mysql_field_escapes_and_nulls():
+    assert backfill.mysql_field(None) == "\\N"
+    assert backfill.mysql_field("a\tb\nc\\d\re") == "a\\tb\\nc\\\\d\\re"
+    assert backfill.mysql_field(42) == "42"
+
+def staged_row(index, cluster=1, system_time=datetime(2026, 1, 2, 3, 4, 5)):
+    """A row in staging_columns order: normalized sigma_alerts columns, then the cluster."""
+    return (1, 2, 3, system_time, 10 + index, 20, "4624", 5, 900 + index % 2, 7000 + index, cluster)
+
+def test_staged_rows_read_back_unchanged(tmp_path):
+    rows = [
+        (1, "tab\there", None, datetime(2026, 1, 2, 3, 4, 5), "back\\slash", "new\nline", "x", 1, 2, 3, 4),
+        (2, "plain", "\\N literal", None, "", "x", None, 1, 2, 3, 4),
+    ]
+    writer = backfill.StagingWriter(str(tmp_path))
+    for row in rows:
+        writer.write(row)
+    writer.close()
+    read = backfill.read_staged_rows(writer.paths[0])
+    expected = [tuple(None if value is None else str(value) for value in row) for row in rows]
+    assert read == expected
+
+def test_staging_writer_rotates_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "rows_per_stage", 2)
+    writer = backfill.StagingWriter(str(tmp_path))
+    for i in range(5):
+        writer.write(staged_row(i))
+    writer.close()
+    assert len(writer.paths) == 3
+    assert writer.total_rows == 5
+    assert writer.rows == [2, 2, 1]
+    assert sum(len(backfill.read_staged_rows(path)) for path in writer.paths) == 5
+
+def test_each_staging_file_has_its_own_profile_deltas(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "rows_per_stage", 2)
+    writer = backfill.StagingWriter(str(tmp_path))
+    for i, cluster in enumerate((1, 1, 1, 2)):
+        writer.write(staged_row(i, cluster))
+    writer.close()
+    assert [{cluster: delta.count for cluster, delta in deltas.items()} for deltas in writer.deltas] == [{1: 2}, {1: 1, 2: 1}]
+    assert writer.deltas[0][1].signatures == {900: 1, 901: 1}
+
+class LoadCursor:
+    """LOAD DATA stand-in that inserts all but `rejected` rows of the files listed there.
+
+    Every staged noise row is found as stored noise, with its line hash as its id.
+    """
+
+    def __init__(self, rejected):
+        self.rejected = rejected
+        self.rowcount = 0
+        self.result = []
+        self.outliers = []
+
+    def execute(self, query, params=()):
+        if query.startswith("LOAD DATA"):
+            path = params[0]
+            self.rowcount = len(backfill.read_staged_rows(path)) - self.rejected.get(path, 0)
+        elif query.startswith("SELECT id FROM sigma_alerts"):
+            self.result = [(line_hash,) for line_hash in params[::2]]
+        elif "INSERT IGNORE INTO dbscan_outlier" in query:
+            self.outliers.append(list(params))
+            self.rowcount = len(params)
+
+    def fetchall(self):
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class LoadConnection:
+    def __init__(self, cursor):
+        self.cursor_object = cursor
+
+    def cursor(self):
+        return self.cursor_object
+
+    def commit(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+def test_partly_ignored_files_are_re_derived_instead_of_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "rows_per_stage", 2)
+    writer = backfill.StagingWriter(str(tmp_path))
+    for i, cluster in enumerate((1, 1, 2, 3)):
+        writer.write(staged_row(i, cluster))
+    writer.close()
+    applied = []
+    monkeypatch.setattr(backfill, "apply_profile_deltas", lambda cursor, deltas: applied.append(sorted(deltas)))
+    cursor = LoadCursor({writer.paths[1]: 1})
+    monkeypatch.setattr(backfill.db, "connect", lambda **kwargs: LoadConnection(cursor))
+    loaded, rederive = backfill.load_staging_files(writer)
+    assert loaded == 3
+    # Only the fully inserted file's deltas are counted
+    assert applied == [[1]]
+    assert rederive == {2, 3}
+
+def test_backfill_state_is_kept_apart_from_the_ingester():
+    assert backfill.backfill_dedup_path == f"{backfill.dedup_state_path}.backfill"
+    assert backfill.backfill_rate_path == f"{backfill.rate_snapshot_path}.backfill"
+
+def test_staged_noise_reaches_dbscan_outlier_with_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "rows_per_stage", 2)
+    writer = backfill.StagingWriter(str(tmp_path))
+    for i, cluster in enumerate((-1, 1, 1, -1)):
+        writer.write(staged_row(i, cluster))
+    writer.close()
+    assert writer.noise == [[(7000, datetime(2026, 1, 2, 3, 4, 5))], [(7003, datetime(2026, 1, 2, 3, 4, 5))]]
+    monkeypatch.setattr(backfill, "apply_profile_deltas", lambda cursor, deltas: None)
+    cursor = LoadCursor({})
+    monkeypatch.setattr(backfill.db, "connect", lambda **kwargs: LoadConnection(cursor))
+    backfill.load_staging_files(writer)
+    assert cursor.outliers == [[7000], [7003]]
+
+def test_signature_clusters_come_from_the_shared_lookup(monkeypatch):
+    cursor = LoadCursor({})
+    cursor.fetchone = lambda: (9,)
+    monkeypatch.setattr(backfill, "signature_clusters", lambda cursor, signature_ids=None: {900: 4})
+    monkeypatch.setattr(backfill.db, "connect", lambda **kwargs: LoadConnection(cursor))
+    assert backfill.fetch_signature_clusters() == ({900: 4}, 9)
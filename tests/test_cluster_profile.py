@@ -0,0 +1,151 @@
+from datetime import datetime
+
+import pytest
+
+from rhythmrisk.cluster_profile import (
+    HyperLogLog, ProfileDelta, ProfileDeltas, apply_profile_deltas, representative_vote, seed_cluster_profile
+)
+
+def sketch_of(items):
+    sketch = HyperLogLog()
+    for item in items:
+        sketch.add(item)
+    return sketch
+
+@pytest.mark.parametrize("cardinality", [10, 1000, 20000])
+def test_hll_estimate_is_within_error(cardinality):
+    estimate = sketch_of(range(cardinality)).estimate()
+    assert abs(estimate - cardinality) <= max(2, 0.2 * cardinality)
+
+def test_hll_ignores_none_and_duplicates():
+    assert sketch_of([None, None]).estimate() == 0
+    assert sketch_of(["a"] * 100).estimate() == 1
+
+def test_hll_merge_is_the_sketch_of_the_union():
+    left, right = sketch_of(range(0, 600)), sketch_of(range(400, 1000))
+    union = sketch_of(range(1000))
+    assert left.merge(right).registers == union.registers
+
+def test_hll_round_trips_through_bytes():
+    sketch = sketch_of(range(50))
+    assert HyperLogLog(bytes(sketch.registers)).registers == sketch.registers
+
+def test_profile_delta_tracks_count_and_time_range():
+    delta = ProfileDelta()
+    delta.add(datetime(2026, 1, 2), 1, 10, 99)
+    delta.add(datetime(2026, 1, 1), 2, 10, 99)
+    delta.add(None, None, None, None)
+    assert (delta.count, delta.first_seen, delta.last_seen) == (3, datetime(2026, 1, 1), datetime(2026, 1, 2))
+    assert delta.signatures == {99: 2}
+    delta.remove(2)
+    # Removal only shrinks the count; the time range and sketches stay as upper bounds
+    assert (delta.count, delta.first_seen) == (1, datetime(2026, 1, 1))
+    assert delta.hosts.estimate() == 2
+
+def test_representative_vote():
+    assert representative_vote(None, 0, 5, 3) == (5, 3)
+    assert representative_vote(5, 3, 5, 2) == (5, 5)
+    assert representative_vote(5, 3, 7, 2) == (5, 1)
+    assert representative_vote(5, 3, 7, 4) == (7, 1)
+    assert representative_vote(5, 3, None, 0) == (5, 3)
+
+def test_representative_follows_the_majority_across_batches():
+    current, count = None, 0
+    for batch in ([1] * 5, [2] * 3, [2] * 3, [2] * 4):
+        current, count = representative_vote(current, count, batch[0], len(batch))
+    assert current == 2
+
+class ProfileCursor:
+    """In-memory cluster_profile answering the statements apply_profile_deltas issues."""
+
+    def __init__(self, rows=None):
+        self.rows = dict(rows or {})
+        self.result = []
+
+    def execute(self, query, params=()):
+        if query.lstrip().startswith("SELECT"):
+            self.result = [(cluster_id,) + self.rows[cluster_id][4:6] + self.rows[cluster_id][8:10]
+                           for cluster_id in params if cluster_id in self.rows]
+        elif query.lstrip().startswith("DELETE"):
+            for cluster_id in params:
+                if cluster_id in self.rows and self.rows[cluster_id][1] <= 0:
+                    del self.rows[cluster_id]
+
+    def executemany(self, query, rows):
+        for row in rows:
+            old = self.rows.get(row[0])
+            if old is not None:
+                row = (row[0], old[1] + row[1], min(filter(None, (old[2], row[2])), default=None),
+                       max(filter(None, (old[3], row[3])), default=None)) + row[4:]
+            self.rows[row[0]] = row
+
+    def fetchall(self):
+        return self.result
+
+def test_apply_profile_deltas_merges_existing_profiles():
+    cursor = ProfileCursor()
+    deltas = ProfileDeltas()
+    for host in range(3):
+        deltas[4].add(datetime(2026, 1, 1, host), host, 1, 11)
+    assert apply_profile_deltas(cursor, deltas) == 1
+
+    deltas = ProfileDeltas()
+    for host in range(3, 6):
+        deltas[4].add(datetime(2026, 1, 2), host, 1, 22)
+    deltas[4].add(datetime(2026, 1, 2), 0, 1, 22)
+    apply_profile_deltas(cursor, deltas)
+    row = cursor.rows[4]
+    assert row[1] == 7
+    assert (row[2], row[3]) == (datetime(2026, 1, 1), datetime(2026, 1, 2))
+    assert row[6] == 6
+    # Signature 22 outweighs 11 (4 against 3), so the representative moves on instead of freezing
+    assert (row[8], row[9]) == (22, 1)
+
+def test_apply_profile_deltas_drops_emptied_clusters():
+    cursor = ProfileCursor()
+    deltas = ProfileDeltas()
+    deltas[1].add(datetime(2026, 1, 1), 1, 1, 5)
+    apply_profile_deltas(cursor, deltas)
+    deltas = ProfileDeltas()
+    deltas[1].remove()
+    apply_profile_deltas(cursor, deltas)
+    assert 1 not in cursor.rows
+
+class SeedCursor(ProfileCursor):
+    """Answers the seeding GROUP BY queries from a list of (cluster, time, host, user, signature) alerts."""
+
+    def __init__(self, alerts):
+        super().__init__()
+        self.alerts = alerts
+
+    def execute(self, query, params=()):
+        text = " ".join(query.split())
+        if text.startswith("SHOW COLUMNS"):
+            self.result = [("dbscan_cluster",)]
+        elif "MIN(system_time)" in text:
+            clusters = sorted({alert[0] for alert in self.alerts})
+            self.result = [(c, sum(a[0] == c for a in self.alerts), min(a[1] for a in self.alerts if a[0] == c),
+                            max(a[1] for a in self.alerts if a[0] == c)) for c in clusters]
+        elif "SELECT DISTINCT dbscan_cluster, computer_key" in text:
+            self.result = sorted({(a[0], a[2]) for a in self.alerts})
+        elif "SELECT DISTINCT dbscan_cluster, user_key" in text:
+            self.result = sorted({(a[0], a[3]) for a in self.alerts})
+        elif "signature_id, COUNT(*)" in text:
+            pairs = [(a[0], a[4]) for a in self.alerts]
+            self.result = [pair + (pairs.count(pair),) for pair in sorted(set(pairs))]
+        else:
+            super().execute(query, params)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+def test_seed_builds_exact_profiles():
+    alerts = [(1, datetime(2026, 1, 1), 10, 100, 7), (1, datetime(2026, 1, 3), 11, 100, 8),
+              (1, datetime(2026, 1, 2), 10, 101, 8), (-1, datetime(2026, 1, 5), 12, 102, 9)]
+    cursor = SeedCursor(alerts)
+    assert seed_cluster_profile(cursor) == 2
+    row = cursor.rows[1]
+    assert row[1:4] == (3, datetime(2026, 1, 1), datetime(2026, 1, 3))
+    assert (row[6], row[7]) == (2, 2)
+    assert (row[8], row[9]) == (8, 2)
+    assert cursor.rows[-1][1] == 1
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+from datetime import timedelta
+
+import pytest
+
+from rhythmrisk import clustering, ingest
+
+# Importing every stage must not build state, touch the working directory or connect anywhere
+import_probe = """
+import os, sys
+before = set(os.listdir("."))
+from rhythmrisk import anomaly_log, backfill, clustering, ingest, spool, tune, workers
+assert (clustering.sliding_window, clustering.feature_projector, clustering.rate_counters) == (None, None, None)
+assert (ingest.seen_lines, ingest.rate_counters, ingest.spool, ingest.core_index_loader) == (None, None, None, None)
+assert anomaly_log.anomaly_buffer is None
+assert set(os.listdir(".")) == before, set(os.listdir(".")) - before
+"""
+
+def test_importing_the_stages_builds_no_state(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, CLUSTER_WINDOW_HOURS="24", PROJECTION_COMPONENTS="8")
+    subprocess.run([sys.executable, "-c", import_probe], cwd=tmp_path, env=env, check=True)
+
+@pytest.fixture
+def local_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest, "dedup_state_path", str(tmp_path / "seen_lines.bin"))
+    monkeypatch.setattr(ingest, "rate_snapshot_path", str(tmp_path / "rate_counters.pkl"))
+    monkeypatch.setattr(ingest, "spool_dir", str(tmp_path / "spool"))
+    monkeypatch.setattr(ingest, "rate_features_enabled", True)
+    monkeypatch.setattr(ingest, "spool_enabled", True)
+    for name in ("core_index_loader", "seen_lines", "rate_counters", "spool"):
+        monkeypatch.setattr(ingest, name, None)
+    return tmp_path
+
+def test_ingest_configure_builds_shared_state(local_state):
+    ingest.configure()
+    assert ingest.seen_lines.path == str(local_state / "seen_lines.bin")
+    assert ingest.rate_counters.path == str(local_state / "rate_counters.pkl")
+    assert ingest.spool.directory == str(local_state / "spool")
+    assert ingest.core_index_loader.path == ingest.core_index_path
+
+def test_ingest_configure_gives_each_worker_its_own_files(local_state):
+    ingest.configure("host-1")
+    assert ingest.seen_lines.path == str(local_state / "seen_lines.bin.host-1")
+    assert ingest.rate_counters.path == str(local_state / "rate_counters.pkl.host-1")
+    assert ingest.spool.directory == str(local_state / "spool.host-1")
+
+def test_clustering_configure_follows_the_environment(monkeypatch):
+    for name in ("sliding_window", "feature_projector", "rate_counters"):
+        monkeypatch.setattr(clustering, name, None)
+    monkeypatch.setattr(clustering, "cluster_window_hours", 6.0)
+    monkeypatch.setattr(clustering, "projection_components", 0)
+    monkeypatch.setattr(clustering, "rate_features_enabled", False)
+    clustering.configure()
+    assert clustering.sliding_window.span == timedelta(hours=6)
+    assert clustering.feature_projector is None
+    assert clustering.rate_counters is None
+
+def test_failed_connections_are_not_closed(monkeypatch):
+    mysql = pytest.importorskip("mysql.connector")
+
+    def connect(**options):
+        raise mysql.Error("unreachable")
+
+    monkeypatch.setattr(clustering.db, "connect", connect)
+    assert len(clustering.fetch_data()) == 0
+    clustering.ensure_column_exists()
+    assert clustering.update_cluster_labels(clustering.AlertBatch(), []) is False
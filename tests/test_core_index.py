@@ -0,0 +1,68 @@
+import os
+import pickle
+from datetime import datetime
+
+import pytest
+
+from rhythmrisk import load_pickle, state_path
+from rhythmrisk.features import CoreIndexLoader, CoreSampleIndex, category_key, category_rank, unseen_category_rank
+
+def test_category_rank_of_known_values():
+    keys = [category_key(value) for value in (None, "a", "c")]
+    assert [category_rank(keys, value) for value in (None, "a", "c")] == [0, 1, 2]
+
+def test_unseen_category_does_not_collide_with_a_known_rank():
+    keys = [category_key(value) for value in ("a", "c")]
+    # "b" would have taken "c"'s rank under a plain insertion point
+    assert category_rank(keys, "b") == unseen_category_rank
+    assert category_rank(keys, "z") == unseen_category_rank
+    assert category_rank(keys, None) == unseen_category_rank
+
+class IdentityScaler:
+    def transform(self, matrix):
+        return matrix
+
+class StaticText:
+    """Projector stand-in whose text block is a single zero column."""
+
+    def __init__(self):
+        self.svd = self
+
+    def text_matrix(self, titles, tags):
+        return [[0.0] for _ in titles]
+
+    def transform(self, matrix):
+        return matrix
+
+def test_transform_maps_unseen_hosts_to_the_oov_rank():
+    index = CoreSampleIndex()
+    index.projector = StaticText()
+    index.scaler = IdentityScaler()
+    index.categories = [[category_key(v) for v in values] for values in (("host-a", "host-c"), ("u",), ("1",), ("p",))]
+    record = ("t", "g", "d", datetime(2026, 1, 1), "host-b", "u", "1", "p")
+    assert index.transform([record]).tolist() == [[0.0, unseen_category_rank, 0, 0, 0]]
+
+def test_state_path_resolves_relative_paths_against_the_state_dir(monkeypatch):
+    monkeypatch.setattr("rhythmrisk.state_dir", "/srv/rhythmrisk")
+    assert state_path("core_index.pkl") == "/srv/rhythmrisk/core_index.pkl"
+    assert state_path("/tmp/core_index.pkl") == "/tmp/core_index.pkl"
+
+def test_load_pickle_refuses_group_or_world_writable_files(tmp_path):
+    path = tmp_path / "state.pkl"
+    path.write_bytes(pickle.dumps({"ok": True}))
+    os.chmod(path, 0o600)
+    assert load_pickle(str(path)) == {"ok": True}
+    os.chmod(path, 0o666)
+    with pytest.raises(PermissionError):
+        load_pickle(str(path))
+
+def test_loader_keeps_the_previous_index_when_a_file_is_untrusted(tmp_path):
+    path = tmp_path / "core_index.pkl"
+    index = CoreSampleIndex()
+    index.core_labels = []
+    index.save(str(path))
+    loader = CoreIndexLoader(str(path))
+    assert isinstance(loader.current(), CoreSampleIndex)
+    path.write_bytes(pickle.dumps("replaced"))
+    os.chmod(path, 0o666)
+    assert isinstance(loader.current(), CoreSampleIndex)
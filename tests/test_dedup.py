@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from rhythmrisk.dedup import SeenLines
+from rhythmrisk.records import AlertRecord, to_epoch
+
+start = datetime(2026, 1, 1)
+
+def record(line_hash, hours=0):
+    return AlertRecord("t", "g", "d", start + timedelta(hours=hours), "h", "u", "1", "p", line_hash)
+
+def test_membership_needs_a_line_hash(tmp_path):
+    seen = SeenLines(str(tmp_path / "seen.bin"))
+    seen.add(record(1))
+    seen.add(record(None))
+    assert record(1) in seen
+    assert record(None) not in seen
+    assert len(seen) == 1
+
+def test_entries_older_than_the_window_expire(tmp_path):
+    seen = SeenLines(str(tmp_path / "seen.bin"), window_hours=10, block_entries=1)
+    for line_hash, hours in ((1, 0), (2, 5), (3, 12), (4, 20)):
+        seen.add(record(line_hash, hours))
+    seen.expire()
+    assert list(seen.ordered()[0]) == [3, 4]
+
+def test_size_bound_drops_the_oldest(tmp_path):
+    seen = SeenLines(str(tmp_path / "seen.bin"), window_hours=100, max_entries=3)
+    for line_hash in range(1, 6):
+        seen.add(record(line_hash, line_hash))
+    seen.expire()
+    assert list(seen.ordered()[0]) == [3, 4, 5]
+
+def test_expire_keeps_the_oldest_live_entry_first(tmp_path):
+    seen = SeenLines(str(tmp_path / "seen.bin"), window_hours=10, block_entries=1)
+    for line_hash, hours in ((1, 0), (2, 8), (3, 9)):
+        seen.add(record(line_hash, hours))
+    seen.add(record(4, 15))
+    seen.expire()
+    seen.add(record(5, 30))
+    seen.expire()
+    assert list(seen.ordered()[0]) == [5]
+
+def test_expiry_drops_whole_blocks_once_their_newest_entry_is_old(tmp_path):
+    seen = SeenLines(str(tmp_path / "seen.bin"), window_hours=10, block_entries=2)
+    for line_hash, hours in ((1, 0), (2, 5), (3, 6), (4, 12), (5, 17)):
+        seen.add(record(line_hash, hours))
+    seen.expire()
+    # The first block is gone; the second still holds 4 at hour 12 and 5 sits in the unsealed dict
+    assert list(seen.ordered()[0]) == [3, 4, 5]
+    assert record(1) not in seen and record(3) in seen and record(5) in seen
+
+def test_blocks_are_sorted_for_lookup_and_draining_them_empties_the_set(tmp_path):
+    seen = SeenLines(str(tmp_path / "seen.bin"), window_hours=1, max_entries=10**7, block_entries=1000)
+    for line_hash in range(200000, 0, -1):
+        seen.add(record(line_hash, (200000 - line_hash) / 3600))
+    assert len(seen.blocks) == 200 and not seen.tail
+    assert all(record(line_hash) in seen for line_hash in (1, 777, 200000))
+    assert record(200001) not in seen
+    for step in range(1, 201):
+        seen.newest = to_epoch(start) + step * 1000 + 3600
+        seen.expire()
+    assert len(seen) == 0
+
+def test_save_preserves_blocks_across_a_reload(tmp_path):
+    path = str(tmp_path / "seen.bin")
+    seen = SeenLines(path, window_hours=48, block_entries=2)
+    for line_hash in (7, 3, 9):
+        seen.add(record(line_hash, line_hash))
+    seen.save(force=True)
+    loaded = SeenLines(path, window_hours=48, block_entries=2).load()
+    assert [list(block[0]) for block in loaded.blocks] == [[3, 7]]
+    assert loaded.tail == {9: to_epoch(record(9, 9).system_time)}
+
+def test_state_round_trips(tmp_path):
+    path = str(tmp_path / "seen.bin")
+    seen = SeenLines(path, window_hours=48)
+    for line_hash in (7, 3, 9):
+        seen.add(record(line_hash, line_hash))
+    seen.save(force=True)
+    loaded = SeenLines(path, window_hours=48).load()
+    assert list(loaded.ordered()[0]) == [7, 3, 9]
+    assert loaded.newest == seen.newest
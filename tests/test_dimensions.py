@@ -0,0 +1,147 @@
+import re
+import hashlib
+
+import pytest
+
+from rhythmrisk import dimensions
+from rhythmrisk.records import AlertBatch, InternTable, signature_id, value_hash
+
+class DimensionCursor:
+    """Answers `SELECT id, value FROM <table> WHERE id IN (...)` from in-memory tables."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = []
+        self.result = []
+
+    def execute(self, query, params=()):
+        self.queries.append((query, list(params)))
+        table = re.search(r"FROM (\w+)", query).group(1)
+        self.result = [(dim_id, self.tables.get(table, {})[dim_id]) for dim_id in params if dim_id in self.tables.get(table, {})]
+
+    def fetchall(self):
+        return self.result
+
+@pytest.fixture
+def tables(monkeypatch):
+    fresh = {table: InternTable() for table in dimensions.intern_tables}
+    monkeypatch.setattr(dimensions, "intern_tables", fresh)
+    return fresh
+
+def batch_with_titles(*codes):
+    batch = AlertBatch()
+    for index, code in enumerate(codes):
+        batch.append_codes(index + 1, code, 0, 0, 0, 0, 0, 0)
+    return batch
+
+def test_refresh_fetches_sparse_and_out_of_order_ids(tables):
+    cursor = DimensionCursor({"dim_title": {2: "b", 7: "g", 40: "late"}})
+    assert dimensions.refresh_intern_tables(cursor, batch_with_titles(40, 7, 2, 7, 0)) == 3
+    title_table = tables["dim_title"]
+    assert [title_table.value(code) for code in (2, 7, 40)] == ["b", "g", "late"]
+    # Only the table the batch references is queried, and only for the ids it lacks
+    assert cursor.queries == [(cursor.queries[0][0], [2, 7, 40])]
+    assert "WHERE id IN" in cursor.queries[0][0]
+
+def test_refresh_skips_ids_already_held_and_refills_holes(tables):
+    title_table = tables["dim_title"]
+    title_table.adopt(3, "c")
+    title_table.adopt(5, "e")
+    title_table.retain({5}, reuse=False)
+    cursor = DimensionCursor({"dim_title": {3: "c", 5: "e"}})
+    assert dimensions.refresh_intern_tables(cursor, batch_with_titles(3, 5)) == 1
+    assert cursor.queries[0][1] == [3]
+    assert title_table.value(3) == "c"
+    assert dimensions.refresh_intern_tables(cursor, batch_with_titles(3, 5)) == 0
+
+def test_refresh_queries_in_chunks(tables, monkeypatch):
+    monkeypatch.setattr(dimensions, "refresh_chunk_size", 2)
+    cursor = DimensionCursor({"dim_title": {1: "a", 2: "b", 3: "c"}})
+    dimensions.refresh_intern_tables(cursor, batch_with_titles(1, 2, 3))
+    assert [params for _, params in cursor.queries] == [[1, 2], [3]]
+
+def test_refresh_logs_ids_missing_from_the_dimension(tables, caplog):
+    cursor = DimensionCursor({"dim_title": {}})
+    assert dimensions.refresh_intern_tables(cursor, batch_with_titles(9)) == 0
+    assert "dim_title ids referenced by sigma_alerts do not exist" in caplog.text
+
+def test_sql_hashes_convert_to_utf8mb4():
+    assert "CONVERT(title USING utf8mb4)" in dimensions.sql_value_hash("title")
+    assert dimensions.sql_signature_id("a.").count("CONVERT(a.") == 5
+
+class MigrationCursor:
+    """Returns a fixed lost-key count, then the same sample rows for both sample queries."""
+
+    def __init__(self, missing, rows):
+        self.missing = missing
+        self.rows = rows
+        self.queries = []
+
+    def execute(self, query, params=()):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return (self.missing,)
+
+    def fetchall(self):
+        return self.rows
+
+def migrated_row(row_id, values, event_id="10", title_hash=None):
+    row = [row_id]
+    for column in dimensions.dimensions:
+        value = values.get(column)
+        row += [value, None if value is None else value_hash(value)]
+    if title_hash is not None:
+        row[2] = title_hash
+    signature = signature_id(values.get("title"), values.get("tags"), values.get("computer_name"), values.get("user_id"), event_id)
+    return tuple(row + [event_id, signature])
+
+def test_verify_migration_accepts_matching_rows():
+    rows = [migrated_row(1, {"title": "Zugriff verweigert – ü", "computer_name": "hôte"}), migrated_row(2, {})]
+    assert dimensions.verify_migration(MigrationCursor(0, rows)) == []
+
+def test_verify_migration_reports_hash_mismatch_and_lost_keys():
+    latin1_hash = int(hashlib.sha1("é".encode("latin-1")).hexdigest()[:16], 16)
+    rows = [migrated_row(1, {"title": "é"}, title_hash=latin1_hash)]
+    problems = dimensions.verify_migration(MigrationCursor(3, rows))
+    assert problems[0] == "3 rows have a value but no dimension key"
+    assert any("row 1: title" in problem for problem in problems)
+
+class ResolveCursor:
+    """Dimension table in memory: inserts assign ids, a duplicate only clears orphaned_at."""
+
+    def __init__(self):
+        self.rows = {}
+        self.orphaned = set()
+        self.inserts = 0
+        self.result = []
+
+    def executemany(self, query, rows):
+        assert "ON DUPLICATE KEY UPDATE orphaned_at = NULL" in query
+        for hash_value, _ in rows:
+            self.inserts += 1
+            self.rows.setdefault(hash_value, len(self.rows) + 1)
+            self.orphaned.discard(hash_value)
+
+    def execute(self, query, params=()):
+        self.result = [(self.rows[hash_value], hash_value) for hash_value in params if hash_value in self.rows]
+
+    def fetchall(self):
+        return self.result
+
+def test_dimension_cache_expires_and_resolving_clears_the_orphan_mark(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(dimensions.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(dimensions, "dimension_cache_seconds", 60)
+    cursor = ResolveCursor()
+    cache = dimensions.DimensionCache("dim_title")
+    cache.resolve(cursor, {"a"})
+    cursor.orphaned.add(value_hash("a"))
+    clock[0] = 30
+    cache.resolve(cursor, {"a"})
+    assert cursor.inserts == 1
+    clock[0] = 61
+    cache.resolve(cursor, {"a"})
+    assert cursor.inserts == 2
+    assert not cursor.orphaned
+    assert cache.key("a") == 1
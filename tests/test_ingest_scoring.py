@@ -0,0 +1,91 @@
+import contextlib
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from rhythmrisk import ingest
+from rhythmrisk.dedup import SeenLines
+from rhythmrisk.records import AlertRecord
+
+def make_record(index):
+    return AlertRecord("title", "tags", "description", datetime(2026, 1, 1, 8, index), "host", "user", "4624",
+                       "provider", index + 1)
+
+@pytest.fixture
+def direct_path(monkeypatch, tmp_path):
+    inserted = []
+    monkeypatch.setattr(ingest, "spool", None)
+    monkeypatch.setattr(ingest, "rate_counters", None)
+    monkeypatch.setattr(ingest, "seen_lines", SeenLines(str(tmp_path / "seen_lines.bin")))
+    monkeypatch.setattr(ingest, "insert_data_to_sql", lambda data, table, cluster: inserted.append((data[0].line_hash, cluster)))
+    return inserted
+
+def test_direct_path_scores_all_records_in_one_pass(direct_path, monkeypatch):
+    calls = []
+
+    def score_records(records):
+        calls.append(len(records))
+        return [7] * len(records)
+
+    monkeypatch.setattr(ingest, "score_records", score_records)
+    records = [make_record(i) for i in range(3)]
+    assert ingest.insert_unseen_records(records + [records[0]]) == 3
+    assert calls == [3]
+    assert direct_path == [(1, 7), (2, 7), (3, 7)]
+
+def test_direct_path_falls_back_to_signature_clusters(direct_path, monkeypatch):
+    monkeypatch.setattr(ingest, "score_records", lambda records: None)
+    monkeypatch.setattr(ingest, "get_existing_cluster_value", lambda record: 4)
+    ingest.insert_unseen_records([make_record(0)])
+    assert direct_path == [(1, 4)]
+
+def test_score_records_is_none_when_disabled(monkeypatch):
+    monkeypatch.setattr(ingest, "realtime_scoring", False)
+    assert ingest.score_records([make_record(0)]) is None
+
+class SqliteCursor:
+    """Runs the pipeline's %s-style statements against an in-memory SQLite sigma_alerts."""
+
+    def __init__(self, rows):
+        import sqlite3
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute("CREATE TABLE sigma_alerts (id INTEGER PRIMARY KEY, signature_id INT, dbscan_cluster INT)")
+        self.connection.executemany("INSERT INTO sigma_alerts VALUES (?, ?, ?)", rows)
+        self.result = []
+
+    def execute(self, query, params=()):
+        self.result = self.connection.execute(query.replace("%s", "?"), params).fetchall()
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+def test_signature_clusters_prefer_a_cluster_over_noise():
+    cursor = SqliteCursor([
+        (1, 10, -1), (2, 10, 4), (3, 10, 5),  # split between noise and two clusters: the earliest cluster
+        (4, 11, -1), (5, 11, -1),             # only noise
+        (6, 12, None), (7, 12, 8),            # unlabelled rows are ignored
+        (8, 13, None),
+    ])
+    assert ingest.signature_clusters(cursor) == {10: 4, 11: -1, 12: 8}
+    assert ingest.signature_clusters(cursor, [10, 13, 99]) == {10: 4}
+    assert ingest.signature_clusters(cursor, []) == {}
+
+def test_both_insert_paths_use_the_same_lookup(monkeypatch):
+    cursor = SqliteCursor([(1, 10, -1), (2, 10, 4)])
+
+    class Connection:
+        def cursor(self):
+            return contextlib.nullcontext(cursor)
+
+        def is_connected(self):
+            return False
+
+    monkeypatch.setattr(ingest.db, "connect", lambda **kwargs: Connection())
+    monkeypatch.setattr(ingest, "realtime_scoring", False)
+    record = SimpleNamespace(signature_id=10)
+    assert ingest.get_existing_cluster_value(record) == 4
+    assert ingest.assign_cluster_values(cursor, [record, SimpleNamespace(signature_id=20)]) == [4, 5]
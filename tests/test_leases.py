@@ -0,0 +1,192 @@
+from types import SimpleNamespace
+
+import pytest
+
+from rhythmrisk import leases, workers
+from rhythmrisk.leases import LeaseStore
+
+class LeaseTable:
+    """ingest_file_lease in memory, answering the statements LeaseStore sends; now is the database clock."""
+
+    def __init__(self):
+        self.rows = {}
+        self.now = 0.0
+
+    def execute(self, query, params):
+        text = " ".join(query.split())
+        if text.startswith("INSERT IGNORE INTO ingest_file_lease"):
+            for name in params:
+                self.rows.setdefault(name, {"file_name": name, "owner": None, "token": None, "expires": None,
+                                            "offset": 0, "takeovers": 0, "registered": len(self.rows), "completed": False})
+            return 0, []
+        if text.startswith("UPDATE ingest_file_lease SET takeovers"):
+            worker, _, token, seconds, _ = params
+            pending = sorted((row for row in self.rows.values() if not row["completed"] and (
+                row["owner"] is None or row["owner"] == worker or row["expires"] < self.now
+            )), key=lambda row: (row["registered"], row["file_name"]))
+            if not pending:
+                return 0, []
+            row = pending[0]
+            row["takeovers"] += row["owner"] is not None and row["owner"] != worker
+            row.update(owner=worker, token=token, expires=self.now + seconds)
+            return 1, []
+        if text.startswith("SELECT file_name, checkpoint_offset, takeovers"):
+            return 1, [(row["file_name"], row["offset"], row["takeovers"]) for row in self.owned(params[-1])]
+        if text.startswith("UPDATE ingest_file_lease SET lease_expires = NOW(6) + INTERVAL"):
+            return self.update(params[-1], expires=self.now + params[0])
+        if text.startswith("UPDATE ingest_file_lease SET checkpoint_offset = %s, lease_expires"):
+            return self.update(params[-1], offset=params[0], expires=self.now + params[1])
+        if text.startswith("UPDATE ingest_file_lease SET checkpoint_offset = %s, completed_at"):
+            return self.update(params[-1], offset=params[0], completed=True, expires=None)
+        if text.startswith("UPDATE ingest_file_lease SET lease_expires = NOW(6) WHERE"):
+            return self.update(params[-1], expires=self.now)
+        return 1, []
+
+    def owned(self, token):
+        return [row for row in self.rows.values() if row["token"] == token and not row["completed"]]
+
+    def update(self, token, **values):
+        rows = self.owned(token)
+        for row in rows:
+            row.update(values)
+        return len(rows), []
+
+@pytest.fixture
+def table(monkeypatch):
+    table = LeaseTable()
+    monkeypatch.setattr(LeaseStore, "execute", lambda store, query, params=(): table.execute(query, params))
+    return table
+
+def test_workers_claim_files_in_registration_order(table):
+    first, second = LeaseStore("w1"), LeaseStore("w2")
+    assert first.register_files(["b.json", "a.json"]) == 2
+    assert second.register_files(["a.json", "b.json", "c.json"]) == 3
+    third = LeaseStore("w3")
+    assert [first.claim().file_name, second.claim().file_name, third.claim().file_name] == ["a.json", "b.json", "c.json"]
+    assert LeaseStore("w4").claim() is None
+    assert first.register_files(["a.json"]) == 0
+
+def test_expired_lease_is_taken_over_from_its_checkpoint(table):
+    first, second = LeaseStore("w1"), LeaseStore("w2")
+    first.register_files(["a.json"])
+    lease = first.claim()
+    assert first.checkpoint(lease, 500)
+    assert second.claim() is None
+    table.now += leases.lease_seconds + 1
+    taken = second.claim()
+    assert (taken.file_name, taken.offset, taken.takeovers) == ("a.json", 500, 1)
+    # The old owner finds out on its next write and cannot overwrite the new owner's progress
+    assert not first.checkpoint(lease, 900)
+    assert lease.lost
+    assert table.rows["a.json"]["offset"] == 500
+    assert not first.complete(lease, 900)
+    assert second.complete(taken, 900)
+
+def test_renewal_keeps_a_lease_and_release_frees_it(table):
+    first, second = LeaseStore("w1"), LeaseStore("w2")
+    first.register_files(["a.json"])
+    lease = first.claim()
+    table.now += leases.lease_seconds - 1
+    assert first.renew(lease)
+    table.now += leases.lease_seconds - 1
+    assert second.claim() is None
+    first.release(lease)
+    table.now += 0.001
+    assert second.claim().file_name == "a.json"
+    assert not first.renew(lease)
+
+def test_a_worker_reclaims_its_own_lease_after_a_restart(table):
+    store = LeaseStore("w1")
+    store.register_files(["a.json"])
+    store.checkpoint(store.claim(), 42)
+    resumed = LeaseStore("w1").claim()
+    assert (resumed.offset, resumed.takeovers) == (42, 0)
+
+class RecordingHeartbeat:
+    def __init__(self, events):
+        self.events = events
+
+    def set_lease(self, lease):
+        self.events.append(("heartbeat", lease))
+
+@pytest.fixture
+def leased_file(table, monkeypatch, tmp_path):
+    (tmp_path / "a.json").write_text("one\ntwo\nthree\n")
+    monkeypatch.setattr(workers, "checkpoint_lines", 2)
+    monkeypatch.setattr(workers.ingest, "parse_line", lambda line: SimpleNamespace(system_time=None, line=line.strip()))
+    monkeypatch.setattr(workers.ingest, "insert_unseen_records", lambda records: len(records))
+    store = LeaseStore("w1")
+    store.register_files(["a.json"])
+    return store, store.claim(), tmp_path
+
+def test_heartbeat_stops_renewing_before_the_file_is_completed(leased_file, monkeypatch):
+    store, lease, folder = leased_file
+    events = []
+    complete = store.complete
+    monkeypatch.setattr(store, "complete", lambda lease, offset: events.append("complete") or complete(lease, offset))
+    assert workers.process_leased_file(store, lease, str(folder), None, RecordingHeartbeat(events)) == 3
+    assert events == [("heartbeat", None), "complete"]
+    assert not lease.lost
+
+def test_lost_lease_stops_the_file_at_the_next_checkpoint(leased_file, table):
+    store, lease, folder = leased_file
+    table.now += leases.lease_seconds + 1
+    LeaseStore("w2").claim()
+    assert workers.process_leased_file(store, lease, str(folder), None) is None
+    assert lease.lost
+    assert table.rows["a.json"]["offset"] == 0
+
+class RecordingContext:
+    """Stands in for the spawn context; processes only record when they start."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def Process(self, target, args, name):
+        events = self.events
+        return SimpleNamespace(start=lambda: events.append(("start", name)), join=lambda: None)
+
+def test_workers_are_spawned_before_the_retention_thread_starts(monkeypatch):
+    events = []
+    contexts = []
+    monkeypatch.setattr(workers, "initialize_sql_tables", lambda: None)
+    monkeypatch.setattr(workers, "start_retention_thread", lambda: events.append("retention"))
+    monkeypatch.setattr(workers.multiprocessing, "get_context", lambda method: contexts.append(method) or RecordingContext(events))
+    monkeypatch.setattr(workers.sys, "argv", ["workers", "--workers", "2", "--worker-prefix", "h"])
+    workers.main()
+    assert contexts == ["spawn"]
+    assert events == [("start", "h-0"), ("start", "h-1"), "retention"]
+
+class LaggingSpool:
+    """Spool whose drainer commits one appended batch each time the worker looks at the cursor."""
+
+    def __init__(self):
+        self.appended = 0
+        self.drained = 0
+        self.looks = 0
+
+    def end_position(self):
+        self.appended += 1
+        return (1, self.appended)
+
+    def read_cursor(self):
+        self.looks += 1
+        if self.looks > 1:
+            self.drained = min(self.drained + 1, self.appended)
+        return (1, self.drained)
+
+def test_checkpoints_wait_for_the_drainer_before_completing(leased_file, table, monkeypatch):
+    store, lease, folder = leased_file
+    spool = LaggingSpool()
+    monkeypatch.setattr(workers.ingest, "spool", spool)
+    monkeypatch.setattr(workers, "drain_wait_seconds", 0)
+    monkeypatch.setattr(workers, "checkpoint_lines", 1)
+    offsets = []
+    checkpoint = store.checkpoint
+    monkeypatch.setattr(store, "checkpoint", lambda lease, offset: offsets.append(offset) or checkpoint(lease, offset))
+    assert workers.process_leased_file(store, lease, str(folder), None) == 3
+    # Each checkpoint covers only the lines whose batch the drainer had committed by then
+    assert offsets == [len("one\n"), len("one\ntwo\n")]
+    assert spool.drained == spool.appended == 4
+    assert table.rows["a.json"]["completed"]
+    assert table.rows["a.json"]["offset"] == len("one\ntwo\nthree\n")
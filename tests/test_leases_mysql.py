@@ -0,0 +1,106 @@
+import os
+import time
+import multiprocessing
+
+import pytest
+
+from rhythmrisk import db, leases
+from rhythmrisk.leases import LeaseStore, create_lease_tables
+
+pytestmark = pytest.mark.mysql
+
+# Scratch database the tests create and drop; never the pipeline's own DB_NAME
+test_database = os.getenv("RHYTHMRISK_TEST_DB_NAME", "rhythmrisk_test")
+
+@pytest.fixture
+def lease_database(monkeypatch):
+    connector = pytest.importorskip("mysql.connector")
+    server = {key: value for key, value in db.db_config.items() if key != "database"}
+    connection = None
+    try:
+        connection = connector.connect(**server, connection_timeout=2, autocommit=True)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{test_database}`")
+            cursor.execute(f"USE `{test_database}`")
+            cursor.execute("DROP TABLE IF EXISTS ingest_file_lease, ingest_worker")
+            create_lease_tables(cursor)
+    except db.Error as e:
+        if connection and connection.is_connected():
+            connection.close()
+        pytest.skip(f"No usable MySQL server: {e}")
+    # Spawned workers re-import db and read the database name from the environment
+    monkeypatch.setitem(db.db_config, "database", test_database)
+    monkeypatch.setenv("DB_NAME", test_database)
+    yield connection
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{test_database}`")
+    connection.close()
+
+def pending_files(store):
+    _, rows = store.execute("SELECT COUNT(*) FROM ingest_file_lease WHERE completed_at IS NULL")
+    return rows[0][0]
+
+def claim_until_done(worker_id, results, abandon=False):
+    """Worker process: complete leased files until none are left, or die holding the first one."""
+    store = LeaseStore(worker_id)
+    completed = []
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        lease = store.claim()
+        if lease is None:
+            # Files under someone else's live lease come back once it expires
+            if not pending_files(store):
+                break
+            time.sleep(0.1)
+            continue
+        store.checkpoint(lease, 10)
+        if abandon:
+            os._exit(0)
+        if store.complete(lease, 20):
+            completed.append((lease.file_name, lease.takeovers))
+    store.close()
+    results.put(completed)
+
+def test_expired_lease_is_taken_over_against_mysql(lease_database, monkeypatch):
+    monkeypatch.setattr(leases, "lease_seconds", 1)
+    first, second = LeaseStore("w1"), LeaseStore("w2")
+    try:
+        first.register_files(["a.json"])
+        lease = first.claim()
+        assert first.checkpoint(lease, 500)
+        # An unchanged renewal still counts as a matched row
+        assert first.checkpoint(lease, 500)
+        assert second.claim() is None
+        time.sleep(1.2)
+        taken = second.claim()
+        assert (taken.file_name, taken.offset, taken.takeovers) == ("a.json", 500, 1)
+        assert not first.checkpoint(lease, 900)
+        assert not first.complete(lease, 900)
+        assert second.complete(taken, 900)
+    finally:
+        first.close()
+        second.close()
+
+def test_worker_processes_complete_every_file_exactly_once(lease_database, monkeypatch):
+    monkeypatch.setenv("INGEST_LEASE_SECONDS", "1")
+    files = [f"{index:03}.json" for index in range(40)]
+    store = LeaseStore("test")
+    store.register_files(files)
+    store.close()
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    # One worker dies holding a lease; the others must take that file over once it expires
+    abandoned = context.Process(target=claim_until_done, args=("dead", results, True))
+    abandoned.start()
+    abandoned.join()
+    processes = [context.Process(target=claim_until_done, args=(f"w{slot}", results)) for slot in range(4)]
+    for process in processes:
+        process.start()
+    completed = [item for _ in processes for item in results.get(timeout=90)]
+    for process in processes:
+        process.join()
+    assert sorted(name for name, _ in completed) == files
+    assert [(name, takeovers) for name, takeovers in completed if takeovers] == [(files[0], 1)]
+    with lease_database.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*), SUM(checkpoint_offset) FROM `{test_database}`.ingest_file_lease WHERE completed_at IS NOT NULL")
+        assert cursor.fetchone() == (40, 800)
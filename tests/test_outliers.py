@@ -0,0 +1,43 @@
+from rhythmrisk import clustering
+
+class OutlierCursor:
+    """Stands in for the dbscan_outlier table: answers the alert_id scan and applies the DELETE/INSERT ... IN batches."""
+
+    def __init__(self, alert_ids):
+        self.alert_ids = set(alert_ids)
+        self.statements = []
+
+    def execute(self, query, params=()):
+        statement = query.split()[0]
+        self.statements.append((statement, list(params)))
+        if statement == "DELETE":
+            self.alert_ids -= set(params)
+        elif statement == "INSERT":
+            self.alert_ids |= set(params)
+
+    def fetchall(self):
+        return [(alert_id,) for alert_id in sorted(self.alert_ids)]
+
+def test_sync_inserts_new_noise_and_deletes_rows_no_longer_noise():
+    cursor = OutlierCursor({1, 2})
+    assert clustering.sync_outliers(cursor, [1, 2, 3, 4], [-1, 0, -1, 1]) == (1, 1)
+    assert cursor.alert_ids == {1, 3}
+    assert cursor.statements[1:] == [("DELETE", [2]), ("INSERT", [3])]
+
+def test_sync_keeps_outliers_outside_the_run():
+    # Row 9 left the sliding window; its entry stays even though it is not relabelled
+    cursor = OutlierCursor({9})
+    clustering.sync_outliers(cursor, [1, 2], [0, 0])
+    assert cursor.alert_ids == {9}
+    assert [statement for statement, _ in cursor.statements] == ["SELECT"]
+
+def test_sync_is_idempotent():
+    cursor = OutlierCursor(set())
+    clustering.sync_outliers(cursor, [1, 2], [-1, -1])
+    assert clustering.sync_outliers(cursor, [1, 2], [-1, -1]) == (0, 0)
+
+def test_sync_writes_in_chunks(monkeypatch):
+    monkeypatch.setattr(clustering, "outlier_chunk_size", 2)
+    cursor = OutlierCursor(set())
+    assert clustering.sync_outliers(cursor, [1, 2, 3, 4, 5], [-1] * 5) == (5, 0)
+    assert [params for statement, params in cursor.statements if statement == "INSERT"] == [[1, 2], [3, 4], [5]]
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from rhythmrisk import profiling
+from rhythmrisk.profiling import CycleProfiler
+
+def reports(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".prof"))
+
+def test_every_nth_call_is_profiled(tmp_path):
+    profiler = CycleProfiler("cycle", every=2, directory=str(tmp_path), keep=10, top=5)
+    cycle = profiler.wrap(lambda value: value * 2)
+    assert [cycle(value) for value in range(5)] == [0, 2, 4, 6, 8]
+    # Calls 1, 3 and 5 are sampled
+    assert len(reports(tmp_path)) == 3
+    text = next(name for name in os.listdir(tmp_path) if name.endswith("-1.txt"))
+    with open(tmp_path / text) as file:
+        assert file.readline().startswith("cycle=cycle call=1 ")
+
+def test_only_the_newest_reports_are_kept(tmp_path):
+    profiler = CycleProfiler("cycle", every=1, directory=str(tmp_path), keep=2, top=5)
+    cycle = profiler.wrap(lambda: None)
+    for _ in range(4):
+        cycle()
+    assert [name.rsplit("-", 1)[-1] for name in reports(tmp_path)] == ["3.prof", "4.prof"]
+    assert len(os.listdir(tmp_path)) == 4
+
+def test_exceptions_propagate_and_are_still_reported(tmp_path):
+    profiler = CycleProfiler("failing", every=1, directory=str(tmp_path), keep=5, top=5)
+
+    @profiler.wrap
+    def cycle():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cycle()
+    assert len(reports(tmp_path)) == 1
+
+def test_maybe_profile_returns_func_untouched_when_disabled(monkeypatch):
+    monkeypatch.setattr(profiling, "profile_enabled", False)
+    func = lambda: None
+    assert profiling.maybe_profile("cycle", func) is func
+
+def test_configure_from_args_strips_the_flag(monkeypatch):
+    monkeypatch.setattr(profiling, "profile_enabled", False)
+    argv = ["rhythmrisk", "--profile", "--drain"]
+    assert profiling.configure_from_args(argv) is True
+    assert argv == ["rhythmrisk", "--drain"]
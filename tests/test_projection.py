@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from rhythmrisk.features import CoreSampleIndex, FeatureProjector
+
+def rows(count, offset=0):
+    titles = ["Mimikatz Command Line", "Scheduled Task Creation", "LSASS Memory Dump", "Whoami Execution"]
+    tags = ["attack.credential_access", "attack.persistence", "attack.discovery"]
+    return [(i + offset, titles[i % len(titles)], tags[i % len(tags)], f"host-{i % 5}", f"user-{i % 7}",
+             str(4624 + i % 3), "Sysmon", datetime(2026, 1, 1)) for i in range(count)]
+
+def test_projection_width_is_components_plus_categoricals():
+    matrix = FeatureProjector(3).transform(rows(40))
+    assert matrix.shape == (40, 3 + 4)
+
+def test_projection_is_fitted_once_and_reused():
+    projector = FeatureProjector(3)
+    projector.transform(rows(40))
+    svd, vectorizer = projector.svd, projector.title_vectorizer
+    second = projector.transform(rows(10, offset=100))
+    assert projector.svd is svd and projector.title_vectorizer is vectorizer
+    assert second.shape == (10, 7)
+
+def test_components_are_capped_below_text_width():
+    projector = FeatureProjector(500)
+    matrix = projector.transform(rows(20))
+    assert projector.svd.n_components < 500
+    assert matrix.shape[1] == projector.svd.n_components + 4
+
+def test_transform_records_projector_on_model():
+    model = CoreSampleIndex()
+    projector = FeatureProjector(2)
+    projector.transform(rows(12), model)
+    assert model.projector is projector
+    assert len(model.categories) == 4
@@ -0,0 +1,100 @@
+import os
+import pickle
+from datetime import datetime, timedelta
+
+from rhythmrisk import ingest
+from rhythmrisk.features import CoreSampleIndex
+from rhythmrisk.rates import RateCounters
+from rhythmrisk.records import to_epoch
+
+start = datetime(2026, 1, 1, 12)
+
+def counters(path, **options):
+    options.setdefault("bucket_seconds", 60)
+    options.setdefault("window_buckets", 5)
+    options.setdefault("history_hours", 1)
+    return RateCounters(str(path), **options)
+
+def test_rates_sum_the_trailing_window(tmp_path):
+    rates = counters(tmp_path / "rates.pkl")
+    for minutes in (0, 1, 2, 6, 6):
+        rates.add("host", "user", "4624", start + timedelta(minutes=minutes))
+    rates.add("other", "user", "4625", start + timedelta(minutes=6))
+    at = [to_epoch(start + timedelta(minutes=minutes)) for minutes in (2, 6, 20)]
+    assert rates.rates(["host"] * 3, ["user"] * 3, ["4624"] * 3, at) == [(3, 3, 3), (3, 4, 3), (0, 0, 0)]
+    assert rates.rates(["host"], ["user"], ["4624"], [-1]) == [(0, 0, 0)]
+
+def test_prune_drops_buckets_beyond_the_history(tmp_path):
+    rates = counters(tmp_path / "rates.pkl", window_buckets=2, history_hours=0.1)
+    rates.add("old", "user", "1", start)
+    rates.add("new", "user", "1", start + timedelta(minutes=30))
+    rates.prune()
+    assert list(rates.counts["computer_name"]) == ["new"]
+    assert list(rates.counts["user_id"]["user"]) == [rates.newest_bucket]
+
+def test_snapshot_round_trips(tmp_path):
+    path = tmp_path / "rates.pkl"
+    rates = counters(path)
+    rates.add("host", "user", "4624", start)
+    rates.save(force=True)
+    loaded = counters(path).load()
+    assert loaded.counts == rates.counts
+    assert loaded.newest_bucket == rates.newest_bucket
+
+def test_refresh_sums_worker_and_backfill_snapshots(tmp_path):
+    path = tmp_path / "rates.pkl"
+    for suffix, host in (("", "a"), (".w1", "b"), (".backfill", "a")):
+        rates = counters(f"{path}{suffix}")
+        rates.add(host, "user", "4624", start)
+        rates.save(force=True)
+    reader = counters(path).refresh()
+    epoch = [to_epoch(start)]
+    assert reader.rates(["a"], ["user"], ["4624"], epoch) == [(2, 3, 3)]
+    assert reader.rates(["b"], ["user"], ["4624"], epoch) == [(1, 3, 3)]
+
+def test_refresh_reloads_only_when_a_snapshot_changes(tmp_path):
+    path = tmp_path / "rates.pkl"
+    writer = counters(path)
+    writer.add("host", "user", "4624", start)
+    writer.save(force=True)
+    reader = counters(path).refresh()
+    reader.counts = {}
+    assert reader.refresh().counts == {}
+    writer.add("host", "user", "4624", start)
+    writer.save(force=True)
+    os.utime(path, ns=(1, 1))
+    assert reader.refresh().rates(["host"], ["user"], ["4624"], [to_epoch(start)]) == [(2, 2, 2)]
+
+def test_snapshots_with_other_buckets_are_ignored(tmp_path):
+    path = tmp_path / "rates.pkl"
+    with open(path, "wb") as file:
+        pickle.dump({"bucket_seconds": 300, "window_buckets": 12, "newest_bucket": 1, "counts": {}}, file)
+    assert counters(path).load().newest_bucket == 0
+
+def test_rate_mismatch_reports_missing_or_different_counters(tmp_path):
+    index = CoreSampleIndex()
+    assert index.rate_mismatch(None) is None
+    index.rate_features = True
+    index.rate_window = (60, 5)
+    assert index.rate_mismatch(counters(tmp_path / "rates.pkl")) is None
+    assert "disabled" in index.rate_mismatch(None)
+    assert "12 of 60s" in index.rate_mismatch(counters(tmp_path / "rates.pkl", window_buckets=12))
+
+class StaticLoader:
+    def __init__(self, index):
+        self.index = index
+
+    def current(self):
+        return self.index
+
+def test_ingest_does_not_score_without_the_index_rate_columns(monkeypatch, caplog):
+    index = CoreSampleIndex()
+    index.rate_features = True
+    monkeypatch.setattr(ingest, "realtime_scoring", True)
+    monkeypatch.setattr(ingest, "core_index_loader", StaticLoader(index))
+    monkeypatch.setattr(ingest, "rate_counters", None)
+    monkeypatch.setattr(ingest, "unscorable_index", None)
+    record = ("t", "g", "d", start, "host", "user", "4624", "provider")
+    assert ingest.score_records([record]) is None
+    assert ingest.score_records([record]) is None
+    assert caplog.text.count("Real-time scoring disabled") == 1
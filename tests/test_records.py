@@ -0,0 +1,107 @@
+import pickle
+import threading
+from datetime import datetime
+
+from rhythmrisk import records
+from rhythmrisk.records import AlertBatch, AlertRecord, InternTable
+
+def make_record(**overrides):
+    fields = dict(title="Mimikatz", tags="attack.t1003", description="dump", system_time=datetime(2026, 1, 1, 8),
+                  computer_name="host-a", user_id="alice", event_id="10", provider_name="Sysmon", line_hash=7)
+    fields.update(overrides)
+    return AlertRecord(**fields)
+
+def test_intern_table_assigns_stable_codes():
+    table = InternTable()
+    assert table.code(None) == 0
+    assert table.code("a") == table.code("a") == 1
+    assert table.code("b") == 2
+    assert table.value(2) == "b"
+
+def test_retain_forgets_dead_values_and_reuses_codes():
+    table = InternTable()
+    codes = [table.code(value) for value in "abcd"]
+    assert table.retain({codes[1], codes[3]}) == 2
+    assert table.values == [None, None, "b", None, "d"]
+    assert "a" not in table.codes
+    # Kept values keep their codes, new values fill the holes
+    assert table.code("b") == codes[1]
+    assert table.code("x") in (codes[0], codes[2])
+    assert len(table) == 5
+
+def test_retain_trims_trailing_holes_and_can_empty_the_table():
+    table = InternTable()
+    for value in "abc":
+        table.code(value)
+    table.retain({1})
+    assert len(table) == 2
+    table.retain(())
+    assert table.values == [None] and table.codes == {None: 0} and table.free == []
+
+def test_retain_without_reuse_leaves_adopted_ids_free():
+    table = InternTable()
+    table.adopt(3, "host-3")
+    table.adopt(9, "host-9")
+    table.retain({9}, reuse=False)
+    assert table.values[3] is None and table.free == []
+    table.adopt(3, "host-3")
+    assert table.codes["host-3"] == 3
+
+def test_compact_waits_for_open_scopes():
+    records.computer_table.code("compact-me")
+    with records.intern_scope():
+        assert not records.compact_intern_tables(max_values=0)
+    assert records.compact_intern_tables(max_values=0)
+    assert "compact-me" not in records.computer_table.codes
+    assert not records.compact_intern_tables(max_values=10 ** 9)
+
+def test_scope_blocks_compaction_from_other_threads():
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        with records.intern_scope():
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    entered.wait(5)
+    assert not records.compact_intern_tables(max_values=0)
+    release.set()
+    thread.join()
+
+def test_record_indexes_single_fields():
+    record = make_record()
+    assert record[0] == "Mimikatz"
+    assert record[3] == datetime(2026, 1, 1, 8)
+    assert record[4] == "host-a"
+    assert record[-1] == "Sysmon"
+    assert record[4:6] == ("host-a", "alice")
+    assert tuple(record) == record.as_row()
+    assert len(record) == 8
+
+def test_record_pickles_decoded_values():
+    record = make_record(line_hash=123)
+    restored = pickle.loads(pickle.dumps(record))
+    assert restored.as_row() == record.as_row()
+    assert restored.line_hash == 123
+
+def test_line_hash_ignores_surrounding_whitespace():
+    assert records.line_hash("  {\"a\":1}\n") == records.line_hash("{\"a\":1}")
+    assert records.line_hash("{\"a\":1}") != records.line_hash("{\"a\":2}")
+
+def test_epoch_round_trip():
+    moment = datetime(2026, 3, 4, 5, 6, 7)
+    assert records.from_epoch(records.to_epoch(moment)) == moment
+    assert records.to_epoch(None) == -1 and records.from_epoch(-1) is None
+
+def test_batch_decodes_columns():
+    batch = AlertBatch.from_rows([
+        (1, "t1", "g", "h1", "u1", "4624", "p", datetime(2026, 1, 1)),
+        (2, "t2", "g", "h2", None, "4688", "p", None),
+    ])
+    assert len(batch) == 2 and bool(batch)
+    assert batch.decode("title") == ["t1", "t2"]
+    assert batch.decode("user_id") == ["u1", None]
+    assert batch[1][7] is None
+    assert batch.codes_at(0)[8] == records.missing_cluster
@@ -0,0 +1,152 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from rhythmrisk import retention
+from rhythmrisk.retention import RetentionPolicy, RetentionReport
+
+class PartitionCursor:
+    """Answers the information_schema query and the per-partition cluster counts; records everything else."""
+
+    def __init__(self, names=(), counts=None, adjusted=()):
+        self.names = list(names)
+        self.counts = counts or {}
+        self.adjusted = list(adjusted)
+        self.statements = []
+        self.result = []
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        text = " ".join(query.split())
+        self.statements.append(text)
+        if "information_schema.PARTITIONS" in text:
+            self.result = [(name,) for name in self.names]
+        elif text.startswith("SELECT partition_name FROM retention_partition_adjustment"):
+            self.result = [(name,) for name in self.adjusted]
+        elif "PARTITION (" in text:
+            name = text.split("PARTITION (")[1].split(")")[0]
+            self.result = list(self.counts.get(name, []))
+        else:
+            self.result = []
+
+    def executemany(self, query, rows):
+        self.statements.append(" ".join(query.split()))
+        if query.strip().startswith("INSERT INTO retention_partition_adjustment"):
+            self.adjusted.extend(name for _, name in rows)
+
+    def fetchall(self):
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self.cursor_object = cursor
+        self.commits = 0
+
+    def cursor(self):
+        return self.cursor_object
+
+    def commit(self):
+        self.commits += 1
+
+def test_partition_names_round_trip():
+    day = date(2026, 3, 9)
+    assert retention.partition_name(day) == "p20260309"
+    assert retention.partition_day("p20260309") == day
+    assert retention.partition_bound(day) == "TO_DAYS('2026-03-10')"
+
+@pytest.mark.parametrize("name", ["pmax", "p2026", "p20261399", "x20260309", "p202603091", "legacy"])
+def test_partition_day_rejects_other_names(name):
+    assert retention.partition_day(name) is None
+
+def test_daily_partitions_skips_and_logs_foreign_partitions(caplog):
+    cursor = PartitionCursor(["p_archive", "p20260101", "p20260102", "pmax"])
+    partitions, has_pmax = retention.daily_partitions(cursor, "sigma_alerts")
+    assert partitions == [("p20260101", date(2026, 1, 1)), ("p20260102", date(2026, 1, 2))]
+    assert has_pmax
+    assert "Ignoring partition 'p_archive' of 'sigma_alerts'" in caplog.text
+
+def test_only_whole_expired_days_are_dropped_and_profiles_updated(monkeypatch):
+    applied = []
+    monkeypatch.setattr(retention, "apply_profile_deltas", lambda cursor, deltas: applied.append(dict(deltas)))
+    cursor = PartitionCursor(counts={"p20260101": [(3, 10), (None, 2)], "p20260102": [(3, 5)]})
+    partitions = [("p20260101", date(2026, 1, 1)), ("p20260102", date(2026, 1, 2)), ("p20260103", date(2026, 1, 3))]
+    report = RetentionReport()
+    policy = RetentionPolicy("sigma_alerts", "system_time", partitionable=True, profiled=True)
+    retention.drop_expired_partitions(FakeConnection(cursor), policy, partitions, datetime(2026, 1, 3, 12), report)
+    assert "ALTER TABLE sigma_alerts DROP PARTITION p20260101, p20260102" in cursor.statements
+    assert report.rows["sigma_alerts"] == 17
+    assert report.partitions["sigma_alerts"] == 2
+    assert applied[0][3].count == -15
+
+def test_profiles_are_adjusted_and_recorded_before_the_drop(monkeypatch):
+    order = []
+    monkeypatch.setattr(retention, "apply_profile_deltas", lambda cursor, deltas: order.append("deltas"))
+    cursor = PartitionCursor(counts={"p20260101": [(3, 10)]})
+    execute = cursor.execute
+    monkeypatch.setattr(cursor, "execute", lambda query, params=(): (order.append("drop") if "DROP PARTITION" in query else None, execute(query, params)))
+    policy = RetentionPolicy("sigma_alerts", "system_time", partitionable=True, profiled=True)
+    retention.drop_expired_partitions(FakeConnection(cursor), policy, [("p20260101", date(2026, 1, 1))], datetime(2026, 1, 3), RetentionReport())
+    assert order == ["deltas", "drop"]
+    assert cursor.adjusted == ["p20260101"]
+    assert cursor.statements[-1].startswith("DELETE FROM retention_partition_adjustment")
+
+def test_a_retried_drop_does_not_subtract_twice(monkeypatch):
+    applied = []
+    monkeypatch.setattr(retention, "apply_profile_deltas", lambda cursor, deltas: applied.append(dict(deltas)))
+    # A previous pass applied p20260101's deltas and failed before dropping it
+    cursor = PartitionCursor(counts={"p20260101": [(3, 10)], "p20260102": [(3, 5)]}, adjusted=["p20260101"])
+    partitions = [("p20260101", date(2026, 1, 1)), ("p20260102", date(2026, 1, 2))]
+    report = RetentionReport()
+    policy = RetentionPolicy("sigma_alerts", "system_time", partitionable=True, profiled=True)
+    retention.drop_expired_partitions(FakeConnection(cursor), policy, partitions, datetime(2026, 1, 3, 12), report)
+    assert applied[0][3].count == -5
+    assert "ALTER TABLE sigma_alerts DROP PARTITION p20260101, p20260102" in cursor.statements
+    assert report.rows["sigma_alerts"] == 15
+
+def test_dimension_values_are_deleted_only_after_being_marked(monkeypatch):
+    cursor = PartitionCursor()
+    connection = FakeConnection(cursor)
+    report = RetentionReport()
+    retention.expire_dimension_values(connection, report)
+    for table, key in retention.dimensions.values():
+        statements = [statement for statement in cursor.statements if table in statement or key in statement]
+        delete = next(i for i, statement in enumerate(statements) if statement.startswith(f"DELETE d FROM {table}"))
+        mark = next(i for i, statement in enumerate(statements) if "SET d.orphaned_at = NOW()" in statement)
+        assert "d.orphaned_at < NOW() - INTERVAL %s SECOND" in statements[delete]
+        assert delete < mark
+        assert table in report.rows
+    assert retention.dimension_grace_hours * 3600 >= 2 * retention.dimension_cache_seconds
+
+def test_future_partitions_are_split_from_pmax(monkeypatch):
+    today = datetime.now().date()
+    monkeypatch.setattr(retention, "partitions_ahead", 2)
+    cursor = PartitionCursor()
+    policy = RetentionPolicy("sigma_alerts", "system_time")
+    retention.add_future_partitions(cursor, policy, [(retention.partition_name(today), today)])
+    statement = cursor.statements[-1]
+    assert statement.startswith("ALTER TABLE sigma_alerts REORGANIZE PARTITION pmax INTO")
+    for offset in (1, 2):
+        assert retention.partition_name(today + timedelta(days=offset)) in statement
+    assert retention.partition_name(today + timedelta(days=3)) not in statement
+
+def test_schedule_runs_one_pass_at_startup(monkeypatch):
+    passes = []
+
+    class Stop(Exception):
+        pass
+
+    def sleep(seconds):
+        raise Stop()
+
+    monkeypatch.setattr(retention, "apply_retention", lambda: passes.append(True))
+    monkeypatch.setattr(retention.time, "sleep", sleep)
+    monkeypatch.setattr(retention.schedule, "default_scheduler", retention.schedule.Scheduler())
+    with pytest.raises(Stop):
+        retention.schedule_retention()
+    assert passes == [True]
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from rhythmrisk import clustering
+from rhythmrisk.records import AlertBatch
+
+now = datetime(2026, 1, 2, 12, 0, 0)
+
+def make_rows(specs):
+    """(id, hours before now) -> fetch_data-shaped rows."""
+    return [(row_id, f"title {row_id}", "tag", "host", "user", "4624", "provider", now - timedelta(hours=age))
+            for row_id, age in specs]
+
+@pytest.fixture
+def table(monkeypatch):
+    rows = []
+
+    def fetch_window_rows(after_id, cutoff):
+        return AlertBatch.from_rows([row for row in rows if row[0] > after_id and row[7] >= cutoff])
+
+    monkeypatch.setattr(clustering, "fetch_window_rows", fetch_window_rows)
+    return rows
+
+def test_rows_enter_and_leave_incrementally(table):
+    window = clustering.SlidingWindow(24)
+    table.extend(make_rows([(1, 30), (2, 20), (3, 1)]))
+    batch = window.advance(now)
+    assert list(batch.ids) == [2, 3]
+    assert window.last_id == 3
+
+    table.extend(make_rows([(4, 0)]))
+    batch = window.advance(now + timedelta(hours=5))
+    assert list(batch.ids) == [3, 4]
+    assert len(window.rows) == 2
+
+def test_record_labels_updates_cluster_column(table):
+    window = clustering.SlidingWindow(24)
+    table.extend(make_rows([(1, 1), (2, 2)]))
+    batch = window.advance(now)
+    window.record_labels(batch, [7, -1])
+    assert list(window.advance(now).clusters) == [7, -1]
+
+@pytest.mark.parametrize("hours", [0, -1])
+def test_rejects_empty_window(hours):
+    with pytest.raises(ValueError):
+        clustering.SlidingWindow(hours)
+
+def test_advance_releases_interned_values_of_evicted_rows(table):
+    window = clustering.SlidingWindow(24)
+    table.extend([(1, "gone title", "tag", "host", "user", "4624", "provider", now - timedelta(hours=2))])
+    window.advance(now)
+    assert "gone title" in clustering.title_table.codes
+    table.extend([(2, "kept title", "tag", "host", "user", "4688", "provider", now)])
+    batch = window.advance(now + timedelta(hours=23))
+    assert list(batch.ids) == [2]
+    assert "gone title" not in clustering.title_table.codes
+    assert "4624" not in clustering.event_table.codes
+    assert batch.decode("title") == ["kept title"]
+
+def test_rows_committed_out_of_id_order_are_picked_up(table, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(clustering.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(clustering, "window_commit_lag_seconds", 600)
+    window = clustering.SlidingWindow(24)
+    table.extend(make_rows([(1, 1), (3, 1)]))
+    assert list(window.advance(now).ids) == [1, 3]
+    # Id 2's transaction commits after id 3 was read
+    table.extend(make_rows([(2, 1)]))
+    clock[0] = 300
+    assert list(window.advance(now).ids) == [1, 2, 3]
+    assert len(window.expiry) == 3
+
+def test_low_water_mark_trails_the_commit_lag(table, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(clustering.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(clustering, "window_commit_lag_seconds", 600)
+    window = clustering.SlidingWindow(24)
+    table.extend(make_rows([(1, 1), (2, 1)]))
+    window.advance(now)
+    clock[0] = 300
+    window.advance(now)
+    assert window.safe_id == 0
+    clock[0] = 700
+    window.advance(now)
+    assert window.safe_id == 2
@@ -0,0 +1,143 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from rhythmrisk import ingest
+from rhythmrisk.records import AlertRecord
+from rhythmrisk.spool import Spool, decode_record, encode_record, frame_header
+
+start = datetime(2026, 1, 1, 8)
+
+def record(index):
+    return AlertRecord(f"title {index}", "attack.t1059", f"description {index}", start + timedelta(seconds=index),
+                       "host", "S-1-5-21-1", "4624", "Security", 1000 + index)
+
+def fields(records):
+    return [tuple(record) + (record.line_hash,) for record in records]
+
+class StubConnection:
+    def is_connected(self):
+        return True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class Database:
+    """Stands in for insert_spooled_batch; fails while down is set."""
+
+    def __init__(self):
+        self.inserted = []
+        self.down = False
+
+    def insert(self, connection, records):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        self.inserted.extend(fields(records))
+        return len(records)
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database()
+    monkeypatch.setattr(ingest.db, "connect", lambda **kwargs: StubConnection())
+    monkeypatch.setattr(ingest, "insert_spooled_batch", database.insert)
+    return database
+
+def test_records_round_trip_through_the_frame_encoding():
+    empty = AlertRecord(None, None, None, None, None, None, None, None)
+    for original in (record(1), empty):
+        assert fields([decode_record(encode_record(original))]) == fields([original])
+
+def test_drain_replays_everything_and_commits_the_cursor(tmp_path, database):
+    spool = Spool(str(tmp_path), segment_bytes=200, fsync=False)
+    records = [record(i) for i in range(10)]
+    for i in range(0, 10, 2):
+        spool.append(records[i:i + 2])
+    assert len(spool.segments()) > 1
+    assert ingest.drain_spool(spool, batch_size=3) == 10
+    assert database.inserted == fields(records)
+    # Everything before the cursor is gone and nothing is replayed twice
+    assert spool.segments() == [spool.read_cursor()[0]]
+    assert ingest.drain_spool(spool) == 0
+    assert spool.stats()["spool_pending_records"] == 0
+
+def test_failed_batch_stays_in_the_spool(tmp_path, database):
+    spool = Spool(str(tmp_path), fsync=False)
+    spool.append([record(i) for i in range(3)])
+    database.down = True
+    with pytest.raises(ConnectionError):
+        ingest.drain_spool(spool)
+    assert spool.read_cursor() == (1, 0)
+    database.down = False
+    assert ingest.drain_spool(spool) == 3
+
+def test_torn_tail_is_cut_off_when_the_writer_reopens(tmp_path, caplog):
+    spool = Spool(str(tmp_path), fsync=False)
+    spool.append([record(0), record(1)])
+    spool.close()
+    path = spool.segment_path(1)
+    size = os.path.getsize(path)
+    with open(path, "ab") as file:
+        file.write(frame_header.pack(500, 0, 0.0) + b"partial")
+    reopened = Spool(str(tmp_path), fsync=False)
+    reopened.append([record(2)])
+    assert "Truncating" in caplog.text
+    assert os.path.getsize(path) > size
+    records, _ = reopened.read(10)
+    assert fields(records) == fields([record(0), record(1), record(2)])
+
+def test_corrupt_frame_in_a_sealed_segment_is_skipped(tmp_path, caplog):
+    spool = Spool(str(tmp_path), segment_bytes=1, fsync=False)
+    spool.append([record(0), record(1)])
+    spool.append([record(2)])
+    first = spool.segment_path(spool.segments()[0])
+    with open(first, "r+b") as file:
+        file.seek(os.path.getsize(first) - 3)
+        file.write(b"\xff\xff\xff")
+    records, position = spool.read(10)
+    assert fields(records) == fields([record(0), record(2)])
+    assert position[0] == spool.segments()[-1]
+    assert "Skipping unreadable data" in caplog.text
+
+def test_finish_spool_stops_the_drainer_and_empties_the_spool(tmp_path, database, monkeypatch):
+    monkeypatch.setattr(ingest, "spool_poll_seconds", 60)
+    spool = Spool(str(tmp_path), fsync=False)
+    database.down = True
+    drainer = ingest.start_spool_drainer(spool)
+    spool.append([record(0), record(1)])
+    database.down = False
+    ingest.finish_spool(spool, drainer)
+    assert not drainer[0].is_alive()
+    assert database.inserted == fields([record(0), record(1)])
+    assert spool.stats()["spool_pending_records"] == 0
+
+def test_finish_spool_keeps_records_the_database_refuses(tmp_path, database, caplog):
+    spool = Spool(str(tmp_path), fsync=False)
+    spool.append([record(0)])
+    database.down = True
+    ingest.finish_spool(spool)
+    assert "1 records stay spooled" in caplog.text
+    assert spool.stats()["spool_pending_records"] == 1
+
+@pytest.mark.parametrize("field", ["length", "payload"])
+def test_frames_after_a_corrupt_one_in_a_sealed_segment_are_still_read(tmp_path, caplog, field):
+    spool = Spool(str(tmp_path), segment_bytes=1, fsync=False)
+    spool.append([record(0), record(1), record(2)])
+    spool.append([record(3)])
+    first = spool.segment_path(spool.segments()[0])
+    second_frame = frame_header.size + len(encode_record(record(0)))
+    with open(first, "r+b") as file:
+        if field == "length":
+            file.seek(second_frame)
+            file.write(b"\xff\xff\xff\x7f")
+        else:
+            file.seek(second_frame + frame_header.size + 4)
+            file.write(b"\xff\xff\xff")
+    assert spool.stats()["spool_pending_records"] == 3
+    records, position = spool.read(10)
+    assert fields(records) == fields([record(0), record(2), record(3)])
+    assert position[0] == spool.segments()[-1]
+    assert "Skipping unreadable data" in caplog.text and "resuming at byte" in caplog.text
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+from sklearn.datasets import make_blobs
+
+from rhythmrisk import tune
+
+@pytest.fixture(scope="module")
+def points():
+    blobs, _ = make_blobs(n_samples=300, centers=4, cluster_std=0.4, random_state=3)
+    scattered = np.random.RandomState(1).uniform(-12, 12, size=(30, 2))
+    return np.vstack((blobs, scattered))
+
+@pytest.mark.parametrize("eps,min_samples", [(0.3, 3), (0.5, 5), (0.8, 10), (1.5, 4)])
+def test_evaluate_matches_sklearn_dbscan(points, eps, min_samples):
+    _, indptr, indices, distances = tune.compute_neighbors(points, 1.5, 10, None)
+    labels = DBSCAN(eps=eps, min_samples=min_samples).fit(points).labels_
+    expected = (len(set(labels) - {-1}), int(np.sum(labels == -1)))
+    assert tune.evaluate(indptr, indices, distances, eps, min_samples) == expected
+
+def test_neighbors_are_cached_per_matrix(points, tmp_path):
+    cache = str(tmp_path / "cache.npz")
+    first = tune.compute_neighbors(points, 1.0, 5, cache)
+    again = tune.compute_neighbors(points, 1.0, 5, cache)
+    assert all(np.array_equal(a, b) for a, b in zip(first, again))
+    # A different matrix or radius invalidates the cache
+    other = tune.compute_neighbors(points[:50], 1.0, 5, cache)
+    assert len(other[1]) == 51
+
+def test_knee_of_an_elbow_curve():
+    curve = np.array([10.0, 9.0, 8.0, 1.0, 0.9, 0.8, 0.7])
+    assert tune.knee(curve) == 1.0
+    assert tune.knee(np.array([2.0])) == 2.0
+
+def test_write_config_round_trips(tmp_path):
+    path = str(tmp_path / "dbscan_config.json")
+    tune.write_config(path, 0.75, 6, "manual")
+    with open(path) as file:
+        config = json.load(file)
+    assert (config["eps"], config["min_samples"], config["source"]) == (0.75, 6, "manual")